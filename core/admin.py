@@ -2,7 +2,7 @@
 
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Role, Permission
+from .models import CustomUser, Role, Permission, RequiredDocumentRule, NotificationOutbox, UploadSession, Blob
 
 # تخصيص عرض نموذج المستخدم في لوحة التحكم
 class CustomUserAdmin(UserAdmin):
@@ -17,4 +17,8 @@ class CustomUserAdmin(UserAdmin):
 # تسجيل النماذج
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Role)
-admin.site.register(Permission)
\ No newline at end of file
+admin.site.register(Permission)
+admin.site.register(RequiredDocumentRule)
+admin.site.register(NotificationOutbox)
+admin.site.register(UploadSession)
+admin.site.register(Blob)
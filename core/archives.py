@@ -0,0 +1,136 @@
+# core/archives.py
+
+import logging
+import os
+import re
+import zipfile
+from dataclasses import dataclass
+
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+
+from .models import Document
+
+logger = logging.getLogger(__name__)
+
+# حجم القراءة من كل ملف: الذاكرة المستخدمة لا تتجاوزه مهما كان حجم الحزمة
+READ_SIZE = 64 * 1024
+
+# صيغ مضغوطة أصلاً تُخزن كما هي بدلاً من إضاعة المعالج في ضغطها مرة ثانية
+STORED_EXTENSIONS = {'.pdf', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.zip', '.rar', '.7z',
+                     '.docx', '.xlsx', '.pptx', '.mp4'}
+
+# مجلد المستندات غير المرتبطة بمستند مطلوب
+EXTRA_DOCUMENTS_FOLDER = 'مستندات إضافية'
+
+
+@dataclass
+class ArchiveEntry:
+    name: str
+    file: FieldFile
+    modified: object
+
+
+def _safe_part(name):
+    # الشرطة المائلة في اسم نوع المستند تنشئ مجلداً فرعياً غير مقصود
+    name = re.sub(r'[\\/:*?"<>|\x00-\x1f]', '_', name or '').strip(' .')
+    return name or '_'
+
+
+def transaction_package_entries(transaction):
+    """
+    Lists the files of a transaction's document package: one folder per
+    DocumentType name (extras in EXTRA_DOCUMENTS_FOLDER), with the stamped
+    version of every document that has one. Only names and file fields are
+    loaded; file contents are read later while the ZIP is streamed.
+    """
+    documents = Document.objects.filter(transaction=transaction).select_related(
+        'transaction_document__document_type'
+    ).order_by('transaction_document__document_type__name_ar', 'uploaded_at', 'pk')
+
+    entries, used = [], set()
+    for document in documents:
+        field = document.stamped_file if document.is_stamped and document.stamped_file else document.file
+        if not field:
+            continue
+        transaction_document = document.transaction_document
+        folder = _safe_part(transaction_document.document_type.name_ar) if transaction_document else EXTRA_DOCUMENTS_FOLDER
+
+        # ملفات بنفس الاسم في نفس المجلد: نضيف رقماً بدلاً من تكرار الاسم داخل الأرشيف
+        base, extension = os.path.splitext(_safe_part(os.path.basename(field.name)))
+        name, counter = f"{folder}/{base}{extension}", 1
+        while name in used:
+            counter += 1
+            name = f"{folder}/{base} ({counter}){extension}"
+        used.add(name)
+        entries.append(ArchiveEntry(name=name, file=field, modified=document.uploaded_at))
+    return entries
+
+
+class _ZipSink:
+    """
+    Write-only target for ZipFile. It has tell() but no seek(), so ZipFile
+    writes sizes and CRCs in data descriptors after each entry instead of
+    seeking back. Written bytes are kept until the next drain().
+    """
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _date_time(value):
+    if value is None:
+        value = timezone.now()
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    # صيغة ZIP لا تقبل تواريخ قبل 1980
+    return max(value.timetuple()[:6], (1980, 1, 1, 0, 0, 0))
+
+
+def iter_zip(entries):
+    """
+    Yields a ZIP archive of entries piece by piece as it is written. Each
+    file is read in READ_SIZE blocks and its compressed bytes are yielded
+    straight away, so nothing is built in memory or on disk. Files missing
+    from storage are logged and left out.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w') as archive:
+        for entry in entries:
+            try:
+                source = entry.file.storage.open(entry.file.name, 'rb')
+            except OSError as e:
+                logger.warning(f"تم تجاهل الملف {entry.file.name} في الأرشيف: {e}")
+                continue
+
+            info = zipfile.ZipInfo(entry.name, date_time=_date_time(entry.modified))
+            extension = os.path.splitext(entry.name)[1].lower()
+            info.compress_type = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+            # الحجم المعروف مسبقاً يحدد إن كان الملف يحتاج ZIP64 (أكبر من 4 جيجابايت)
+            info.file_size = source.size
+
+            with source, archive.open(info, 'w') as target:
+                for data in iter(lambda: source.read(READ_SIZE), b''):
+                    target.write(data)
+                    if sink.chunks:
+                        yield sink.drain()
+            if sink.chunks:
+                yield sink.drain()
+    # الفهرس المركزي في نهاية الأرشيف
+    yield sink.drain()
@@ -0,0 +1,25 @@
+# core/authentication.py
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .authorization import get_token_permission_codes, prime_user_permissions
+
+
+class PermissionClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that trusts the permission codes carried in the access
+    token, so permission checks during the request need no database access.
+    If the role's permissions changed after the token was issued, the codes are
+    ignored and the usual role lookup is used instead.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is None:
+            return None
+
+        user, validated_token = result
+        codes = get_token_permission_codes(validated_token, user)
+        if codes is not None:
+            prime_user_permissions(user, codes)
+        return user, validated_token
@@ -0,0 +1,153 @@
+# core/authorization.py
+
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import Role
+
+# ذاكرة مؤقتة على مستوى العملية: role_id -> (permissions_version, frozenset من أكواد الصلاحيات)
+_role_permissions_cache = {}
+_role_permissions_lock = threading.Lock()
+
+# اسم الخاصية التي نخزن فيها صلاحيات المستخدم على كائن الطلب الحالي
+USER_CACHE_ATTR = '_permission_codes_cache'
+
+# أسماء الحقول المضافة إلى توكن الدخول (JWT)
+PERMISSIONS_CLAIM = 'permissions'
+ROLE_CLAIM = 'role_id'
+PERMISSIONS_VERSION_CLAIM = 'perm_version'
+
+# مدة تخزين رقم إصدار الصلاحيات في الـ cache. مع cache مشترك (Redis) يظهر
+# التعديل فورًا، ومع LocMemCache تكون هذه المدة هي أقصى تأخير بين العمليات.
+PERMISSIONS_VERSION_CACHE_TIMEOUT = getattr(settings, 'PERMISSIONS_VERSION_CACHE_TIMEOUT', 30)
+
+
+def _version_cache_key(role_id):
+    return f'role_permissions_version:{role_id}'
+
+
+def get_role_permissions_version(role_id):
+    """
+    Returns the current permissions version of a role.
+    Served from the cache; the database is only hit on a cache miss.
+    """
+    if role_id is None:
+        return None
+
+    key = _version_cache_key(role_id)
+    version = cache.get(key)
+    if version is None:
+        version = Role.objects.filter(pk=role_id).values_list('permissions_version', flat=True).first()
+        if version is None:
+            return None
+        cache.set(key, version, PERMISSIONS_VERSION_CACHE_TIMEOUT)
+    return version
+
+
+def bump_role_permissions_version(role_ids):
+    """
+    يزيد رقم إصدار صلاحيات الأدوار المحددة حتى تُعتبر التوكنات القديمة
+    والنسخ المخزنة في العمليات الأخرى منتهية الصلاحية.
+    """
+    role_ids = list(role_ids)
+    if not role_ids:
+        return
+    Role.objects.filter(pk__in=role_ids).update(permissions_version=F('permissions_version') + 1)
+    cache.delete_many([_version_cache_key(role_id) for role_id in role_ids])
+    invalidate_role_permissions(role_ids)
+
+
+def get_role_permission_codes(role_id):
+    """
+    Returns the permission codes of a role as a frozenset.
+    The set is loaded with a single query and cached per process until the
+    role's permissions version changes.
+    """
+    if role_id is None:
+        return frozenset()
+
+    version = get_role_permissions_version(role_id)
+    entry = _role_permissions_cache.get(role_id)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    # كود الصلاحية هو المفتاح الأساسي، لذلك لا نحتاج إلى JOIN مع جدول الصلاحيات
+    codes = frozenset(
+        Role.permissions.through.objects.filter(role_id=role_id).values_list('permission_id', flat=True)
+    )
+    with _role_permissions_lock:
+        _role_permissions_cache[role_id] = (version, codes)
+    return codes
+
+
+def get_token_permission_codes(token, user):
+    """
+    Returns the permission codes carried by a validated access token, or None
+    when the token cannot be trusted (issued for another role, or before the
+    role's permissions last changed).
+    """
+    if token is None:
+        return None
+    try:
+        codes = token[PERMISSIONS_CLAIM]
+        role_id = token[ROLE_CLAIM]
+        version = token[PERMISSIONS_VERSION_CLAIM]
+    except KeyError:
+        # توكن قديم تم إصداره قبل إضافة هذه الحقول
+        return None
+
+    if role_id != user.role_id or role_id is None:
+        return None
+    if version != get_role_permissions_version(role_id):
+        return None
+    return frozenset(codes)
+
+
+def prime_user_permissions(user, codes):
+    """يخزن أكواد الصلاحيات على كائن المستخدم لبقية الطلب الحالي."""
+    setattr(user, USER_CACHE_ATTR, frozenset(codes))
+
+
+def get_user_permission_codes(user):
+    """
+    Returns the permission codes of the user's role, cached on the user instance
+    so repeated checks during the same request cost nothing.
+    """
+    if not user or not user.is_authenticated:
+        return frozenset()
+
+    codes = getattr(user, USER_CACHE_ATTR, None)
+    if codes is None:
+        codes = get_role_permission_codes(user.role_id)
+        setattr(user, USER_CACHE_ATTR, codes)
+    return codes
+
+
+def user_has_permission(user, code):
+    """
+    الدالة المركزية للتحقق من الصلاحيات: المدير الخارق يملك كل الصلاحيات،
+    وباقي المستخدمين يُتحقق منهم عبر صلاحيات الدور المخزنة مؤقتًا.
+    """
+    if not user or not user.is_authenticated:
+        return False
+    if user.is_superuser:
+        return True
+    return code in get_user_permission_codes(user)
+
+
+def invalidate_role_permissions(role_ids=None):
+    """يحذف صلاحيات الأدوار المحددة من الذاكرة المؤقتة (أو كل الأدوار إذا لم تُحدد)."""
+    with _role_permissions_lock:
+        if role_ids is None:
+            _role_permissions_cache.clear()
+            return
+        for role_id in role_ids:
+            _role_permissions_cache.pop(role_id, None)
+
+
+def invalidate_user_permissions(user):
+    """يحذف الصلاحيات المخزنة على كائن المستخدم (مثلاً بعد تغيير دوره)."""
+    user.__dict__.pop(USER_CACHE_ATTR, None)
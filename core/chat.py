@@ -0,0 +1,240 @@
+# core/chat.py
+
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import ChatMessage, ChatReadCursor, ChatRoom, Notification
+from .services import send_bulk_notifications
+
+logger = logging.getLogger(__name__)
+
+# طول معاينة آخر رسالة في قائمة المحادثات
+PREVIEW_LENGTH = 100
+
+# عدد الرسائل في صفحة سجل المحادثة (الافتراضي والأقصى)
+CHAT_HISTORY_PAGE_SIZE = getattr(settings, 'CHAT_HISTORY_PAGE_SIZE', 50)
+CHAT_HISTORY_MAX_PAGE_SIZE = getattr(settings, 'CHAT_HISTORY_MAX_PAGE_SIZE', 200)
+
+
+# --- مؤشرات القراءة ---
+
+def latest_message_id(room_id):
+    return ChatMessage.objects.filter(room_id=room_id).order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def advance_read_cursor(room_id, user_id, message_id):
+    """
+    Moves the user's read cursor in the room forward to message_id. It never
+    moves back, so a late or repeated request cannot mark messages unread
+    again. One UPDATE; the row is only inserted the first time.
+    """
+    updated = ChatReadCursor.objects.filter(
+        room_id=room_id, user_id=user_id, last_read_message_id__lt=message_id
+    ).update(last_read_message_id=message_id)
+    if updated or ChatReadCursor.objects.filter(room_id=room_id, user_id=user_id).exists():
+        return
+    try:
+        with transaction.atomic():
+            ChatReadCursor.objects.create(room_id=room_id, user_id=user_id, last_read_message_id=message_id)
+    except IntegrityError:
+        # أنشأه طلب آخر في نفس اللحظة
+        ChatReadCursor.objects.filter(
+            room_id=room_id, user_id=user_id, last_read_message_id__lt=message_id
+        ).update(last_read_message_id=message_id)
+
+
+def mark_room_read(room_id, user_id):
+    """يحدد كل رسائل الغرفة كمقروءة للمستخدم بتحريك المؤشر إلى آخر رسالة."""
+    message_id = latest_message_id(room_id)
+    if message_id:
+        advance_read_cursor(room_id, user_id, message_id)
+    return message_id
+
+
+def create_read_cursors(room_id, user_ids):
+    """
+    مؤشرات للمشاركين الجدد عند آخر رسالة حالية، فلا تظهر لهم رسائل ما قبل انضمامهم
+    كغير مقروءة. المؤشرات الموجودة لا تتغير.
+    """
+    message_id = latest_message_id(room_id)
+    ChatReadCursor.objects.bulk_create([
+        ChatReadCursor(room_id=room_id, user_id=user_id, last_read_message_id=message_id)
+        for user_id in user_ids
+    ], ignore_conflicts=True)
+
+
+def unread_messages(room_id, user_id):
+    """
+    الرسائل غير المقروءة: كل ما بعد مؤشر المستخدم من رسائل الآخرين.
+    نطاق على (room, id) في فهرس الغرفة، مع المؤشر كاستعلام فرعي داخل نفس الاستعلام.
+    """
+    cursor = ChatReadCursor.objects.filter(room_id=room_id, user_id=user_id).values('last_read_message_id')[:1]
+    return ChatMessage.objects.filter(
+        room_id=room_id, id__gt=Coalesce(Subquery(cursor), Value(0))
+    ).exclude(sender_id=user_id)
+
+
+def unread_count(room_id, user_id):
+    return unread_messages(room_id, user_id).count()
+
+
+def annotate_unread_counts(queryset, user_id):
+    """
+    Adds unread_count to a rooms queryset as one correlated subquery, so a
+    list of N rooms costs one query instead of N + 1.
+    """
+    cursor = ChatReadCursor.objects.filter(
+        room_id=OuterRef(OuterRef('pk')), user_id=user_id
+    ).values('last_read_message_id')[:1]
+    unread = ChatMessage.objects.filter(
+        room_id=OuterRef('pk'), id__gt=Coalesce(Subquery(cursor), Value(0))
+    ).exclude(sender_id=user_id).order_by().values('room_id').annotate(total=Count('id')).values('total')
+    return queryset.annotate(unread_count=Coalesce(Subquery(unread, output_field=IntegerField()), Value(0)))
+
+
+# --- سجل الرسائل ---
+
+def parse_history_params(params):
+    """
+    يقرأ before و after و limit من معاملات الطلب أو رسالة WebSocket.
+    يرفع ValueError إذا كانت القيم غير صحيحة.
+    """
+    def optional_id(name):
+        value = params.get(name)
+        if value in (None, ''):
+            return None
+        value = int(value)
+        if value < 0:
+            raise ValueError(name)
+        return value
+
+    before, after = optional_id('before'), optional_id('after')
+    if before is not None and after is not None:
+        raise ValueError("before and after cannot be combined")
+    limit = optional_id('limit') or CHAT_HISTORY_PAGE_SIZE
+    return before, after, min(limit, CHAT_HISTORY_MAX_PAGE_SIZE)
+
+
+def history_page(queryset, before=None, after=None, limit=CHAT_HISTORY_PAGE_SIZE):
+    """
+    Returns (messages, has_more) for a room's messages queryset, oldest first.
+
+    Without before/after this is the latest page. before=N gives the page just
+    older than message N (scrolling back), after=N the page just newer than
+    it (catching up). Every page is a range on (room, id) read from the room
+    index with LIMIT, whatever the length of the history.
+    """
+    if after is not None:
+        page = list(queryset.filter(id__gt=after).order_by('id')[:limit + 1])
+        return page[:limit], len(page) > limit
+
+    if before is not None:
+        queryset = queryset.filter(id__lt=before)
+    page = list(queryset.order_by('-id')[:limit + 1])
+    return page[:limit][::-1], len(page) > limit
+
+
+# --- ملخص الغرفة ---
+
+def message_preview(message):
+    return (message.content or message.get_message_type_display())[:PREVIEW_LENGTH]
+
+
+def record_last_message(message):
+    """يحدّث ملخص الغرفة بالرسالة الجديدة (تحديث واحد، ولا يعود لرسالة أقدم)."""
+    ChatRoom.objects.filter(
+        Q(last_message__isnull=True) | Q(last_message_id__lt=message.id), pk=message.room_id
+    ).update(
+        last_message=message,
+        last_message_preview=message_preview(message),
+        last_message_at=message.created_at,
+    )
+
+
+def refresh_last_message(room_id):
+    """يعيد حساب آخر رسالة في الغرفة (بعد حذف رسالة)."""
+    message = ChatMessage.objects.filter(room_id=room_id).order_by('-id').first()
+    ChatRoom.objects.filter(pk=room_id).update(
+        last_message=message,
+        last_message_preview=message_preview(message) if message else '',
+        last_message_at=message.created_at if message else None,
+    )
+
+
+def refresh_participant_counts(room_ids):
+    """يعيد حساب عدد المشاركين لمجموعة غرف بتحديث واحد."""
+    counts = ChatRoom.participants.through.objects.filter(
+        chatroom_id=OuterRef('pk')
+    ).order_by().values('chatroom_id').annotate(total=Count('id')).values('total')
+    ChatRoom.objects.filter(pk__in=list(room_ids)).update(
+        participants_count=Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+    )
+
+
+# --- اتصالات WebSocket ---
+
+def room_group_name(room_id):
+    return f"chat_{room_id}"
+
+
+def revoke_room_access(room_id, user_ids=None):
+    """
+    Tells live ChatConsumer connections of the room that membership was
+    revoked, so they close. user_ids=None revokes everyone (room cleared or
+    deleted). Sent after commit; a channel layer error is only logged.
+    """
+    event = {'type': 'membership.revoked', 'user_ids': None if user_ids is None else list(user_ids)}
+
+    def send():
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        try:
+            async_to_sync(channel_layer.group_send)(room_group_name(room_id), event)
+        except Exception as e:
+            logger.warning(f"تعذر إبلاغ اتصالات الغرفة {room_id} بإلغاء العضوية: {e}")
+
+    transaction.on_commit(send)
+
+
+# --- توزيع الرسائل الجديدة ---
+
+def fan_out_message(message):
+    """
+    Notifies every other participant of a new message and moves the sender's
+    read cursor to it.
+
+    The cost does not grow with the room: one query for the participants,
+    the cursor update, and send_bulk_notifications for the notifications and
+    their queued realtime events. Unread state needs no per-recipient rows:
+    the message is unread for everyone whose cursor is behind it. Returns
+    the number of recipients.
+    """
+    room = message.room
+    advance_read_cursor(room.id, message.sender_id, message.id)
+
+    recipient_ids = list(room.participants.exclude(id=message.sender_id).values_list('id', flat=True))
+    if not recipient_ids:
+        return 0
+
+    content_type = ContentType.objects.get_for_model(ChatMessage)
+    text = f"لديك رسالة جديدة من {message.sender.username} في '{room.name}'."
+    send_bulk_notifications([
+        Notification(
+            user_id=user_id,
+            message=text,
+            event_type=Notification.EventType.NEW_MESSAGE,
+            link=f'/chat?room={room.id}',
+            content_type=content_type,
+            object_id=message.id,
+        )
+        for user_id in recipient_ids
+    ])
+    return len(recipient_ids)
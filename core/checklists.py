@@ -0,0 +1,101 @@
+# core/checklists.py
+
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import RequiredDocumentRule, TransactionDocument
+
+# مفتاح رقم إصدار القواعد في الـ cache المشترك. يتغير عند أي تعديل على القواعد
+RULES_VERSION_CACHE_KEY = 'required_document_rules_version'
+
+# مع cache مشترك (Redis) يظهر التعديل فورًا، ومع LocMemCache تكون هذه المدة
+# هي أقصى تأخير قبل أن تعيد العمليات الأخرى تحميل القواعد.
+RULES_VERSION_CACHE_TIMEOUT = getattr(settings, 'REQUIRED_DOCUMENT_RULES_CACHE_TIMEOUT', 60)
+
+# ذاكرة مؤقتة على مستوى العملية: (version, {(sub_category_id, competent_authority_id): (codes...)})
+_rules_cache = None
+_rules_lock = threading.Lock()
+
+
+def _get_rules_version():
+    version = cache.get(RULES_VERSION_CACHE_KEY)
+    if version is None:
+        # لا يوجد رقم إصدار (أول تشغيل أو بعد تعديل): ننشئ رقمًا جديدًا فتعيد كل العمليات التحميل
+        cache.add(RULES_VERSION_CACHE_KEY, uuid.uuid4().hex, RULES_VERSION_CACHE_TIMEOUT)
+        version = cache.get(RULES_VERSION_CACHE_KEY)
+    return version
+
+
+def _load_rules():
+    rules = {}
+    queryset = RequiredDocumentRule.objects.order_by('order', 'document_type_id').values_list(
+        'sub_category_id', 'competent_authority_id', 'document_type_id'
+    )
+    for sub_category_id, competent_authority_id, code in queryset:
+        rules.setdefault((sub_category_id, competent_authority_id), []).append(code)
+    return {key: tuple(codes) for key, codes in rules.items()}
+
+
+def get_required_document_rules():
+    """
+    Returns all checklist rules as {(sub_category_id, competent_authority_id): codes}.
+    The rules are loaded with a single query and kept per process until they change.
+    """
+    global _rules_cache
+
+    version = _get_rules_version()
+    entry = _rules_cache
+    if entry is not None and version is not None and entry[0] == version:
+        return entry[1]
+
+    rules = _load_rules()
+    with _rules_lock:
+        _rules_cache = (version, rules)
+    return rules
+
+
+def invalidate_required_document_rules():
+    """يلغي القواعد المخزنة في هذه العملية وفي باقي العمليات (عبر رقم الإصدار)."""
+    global _rules_cache
+
+    cache.delete(RULES_VERSION_CACHE_KEY)
+    with _rules_lock:
+        _rules_cache = None
+
+
+def get_required_document_codes(transaction, rules=None):
+    """
+    Returns the document type codes required for a transaction.
+    The most specific rule wins: sub category + competent authority, then the
+    sub category alone, then the default list.
+    """
+    if rules is None:
+        rules = get_required_document_rules()
+
+    sub_category_id = transaction.sub_category_id
+    competent_authority_id = transaction.competent_authority_id
+    if sub_category_id is not None:
+        if competent_authority_id is not None and (sub_category_id, competent_authority_id) in rules:
+            return rules[(sub_category_id, competent_authority_id)]
+        if (sub_category_id, None) in rules:
+            return rules[(sub_category_id, None)]
+    return rules.get((None, None), ())
+
+
+def create_required_documents(transactions):
+    """
+    إنشاء قائمة المستندات المطلوبة لمجموعة من المعاملات بعملية bulk_create واحدة.
+    القواعد تأتي من الذاكرة المؤقتة، لذلك عدد الاستعلامات ثابت مهما كان حجم القائمة.
+    """
+    rules = get_required_document_rules()
+    items = [
+        TransactionDocument(transaction_id=transaction.pk, document_type_id=code)
+        for transaction in transactions
+        for code in get_required_document_codes(transaction, rules)
+    ]
+    if not items:
+        return []
+    return TransactionDocument.objects.bulk_create(items)
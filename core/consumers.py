@@ -3,31 +3,40 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import ChatRoom, ChatMessage, CustomUser
+from django.db import transaction
+from .models import ChatRoom, ChatMessage
+from . import presence
+from .chat import fan_out_message, history_page, parse_history_params, room_group_name
+from .serializers import ChatMessageListSerializer
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         # 1. استخراج رقم الغرفة والمستخدم
-        self.room_id = self.scope['url_route']['kwargs']['room_id']
         self.user = self.scope['user']
+        try:
+            self.room_id = int(self.scope['url_route']['kwargs']['room_id'])
+        except (TypeError, ValueError):
+            await self.close()
+            return
 
         # 2. التحقق من أن المستخدم مسجل دخوله
         if not self.user or not self.user.is_authenticated:
             await self.close()
             return
 
-        # 3. التحقق من أن المستخدم عضو في الغرفة المطلوبة
+        # 3. التحقق من أن المستخدم عضو في الغرفة المطلوبة (مرة واحدة لكل اتصال)
         is_participant = await self.is_user_participant(self.user, self.room_id)
         if not is_participant:
             await self.close() # ارفض الاتصال إذا لم يكن المستخدم عضواً
             return
             
         # 4. إذا نجحت كل التحققات، اقبل الاتصال
-        self.room_group_name = f"chat_{self.room_id}"
+        self.room_group_name = room_group_name(self.room_id)
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
+        await self.update_presence(online=True)
         await self.accept()
 
     async def disconnect(self, close_code):
@@ -36,9 +45,21 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 self.room_group_name,
                 self.channel_name
             )
+            await self.update_presence(online=False)
 
     async def receive(self, text_data):
         text_data_json = json.loads(text_data)
+
+        # نبضة من الواجهة تبقي المستخدم متصلاً: {"type": "heartbeat"}
+        if text_data_json.get('type') == 'heartbeat':
+            await self.update_presence(online=True)
+            return
+
+        # طلب سجل الرسائل: {"type": "history", "before": id, "after": id, "limit": k}
+        if text_data_json.get('type') == 'history':
+            await self.send_history(text_data_json)
+            return
+
         message_content = text_data_json['message']
 
         # حفظ الرسالة في قاعدة البيانات
@@ -56,6 +77,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
             }
         )
 
+        # الإشعارات ومؤشر قراءة المرسل بعد البث، فلا ينتظرها المشاركون
+        await self.notify_participants(new_message)
+
     async def chat_message(self, event):
         # إرسال الرسالة إلى WebSocket
         await self.send(text_data=json.dumps({
@@ -65,15 +89,56 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'timestamp': event['timestamp']
         }))
 
+    async def membership_revoked(self, event):
+        # أُزيل المستخدم من الغرفة (أو حُذفت الغرفة): أغلق الاتصال
+        if event['user_ids'] is None or self.user.id in event['user_ids']:
+            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+            await self.close(code=4403)
+
+    async def send_history(self, params):
+        try:
+            before, after, limit = parse_history_params(params)
+        except (TypeError, ValueError):
+            await self.send(text_data=json.dumps({
+                'type': 'history',
+                'error': 'before و after و limit يجب أن تكون أرقامًا صحيحة، ولا يُجمع before مع after.',
+            }))
+            return
+
+        messages, has_more = await self.load_history(before, after, limit)
+        await self.send(text_data=json.dumps({
+            'type': 'history',
+            'messages': messages,
+            'has_more': has_more,
+        }, default=str))
+
+    @database_sync_to_async
+    def load_history(self, before, after, limit):
+        # نفس الاستعلام المستخدم في ChatMessageViewSet.list (نطاق على فهرس الغرفة)
+        queryset = ChatMessage.objects.filter(room_id=self.room_id).select_related('sender')
+        messages, has_more = history_page(queryset, before=before, after=after, limit=limit)
+        return ChatMessageListSerializer(messages, many=True).data, has_more
+
+    @database_sync_to_async
+    def update_presence(self, online):
+        # تحديث في الـ cache فقط؛ last_seen يُكتب في قاعدة البيانات على دفعات
+        if online:
+            presence.heartbeat(self.user.id)
+        else:
+            presence.mark_offline(self.user.id)
+
     @database_sync_to_async
     def is_user_participant(self, user, room_id):
-        try:
-            room = ChatRoom.objects.get(pk=room_id)
-            return user in room.participants.all()
-        except ChatRoom.DoesNotExist:
-            return False
+        # EXISTS على الفهرس الفريد (chatroom_id, customuser_id) بدون تحميل الغرفة أو المشاركين
+        return ChatRoom.participants.through.objects.filter(chatroom_id=room_id, customuser_id=user.id).exists()
 
     @database_sync_to_async
     def save_message(self, user, room_id, content):
-        room = ChatRoom.objects.get(pk=room_id)
-        return ChatMessage.objects.create(sender=user, room=room, content=content)
\ No newline at end of file
+        # INSERT واحد برقم الغرفة المحفوظ في الاتصال، بدون جلب الغرفة
+        return ChatMessage.objects.create(sender=user, room_id=room_id, content=content)
+
+    @database_sync_to_async
+    def notify_participants(self, message):
+        with transaction.atomic():
+            # نفس الإشعارات ومؤشر القراءة عند الإرسال عبر الـ API
+            fan_out_message(message)
@@ -0,0 +1,78 @@
+# core/counters.py
+
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .models import Transaction, TransactionStatusCounter
+
+# معرف "الموظف" للمعاملات غير المسندة
+UNASSIGNED = 0
+
+
+def adjust_transaction_counters(deltas):
+    """
+    Applies {(status, assigned_to_id): delta} to the counters table.
+
+    Each change is a single atomic UPDATE ... SET count = count + delta, so it
+    commits or rolls back together with the transaction save that caused it.
+    """
+    with transaction.atomic():
+        for (status, assignee_id), delta in sorted(deltas.items(), key=lambda item: (item[0][0], item[0][1] or UNASSIGNED)):
+            if not delta:
+                continue
+            lookup = {'status': status, 'assignee_id': assignee_id or UNASSIGNED}
+            updated = TransactionStatusCounter.objects.filter(**lookup).update(count=F('count') + delta)
+            if updated:
+                continue
+            # أول معاملة لهذا المفتاح: ننشئ صف العداد. إذا سبقتنا عملية أخرى نعود للتحديث.
+            try:
+                with transaction.atomic():
+                    TransactionStatusCounter.objects.create(count=delta, **lookup)
+            except IntegrityError:
+                TransactionStatusCounter.objects.filter(**lookup).update(count=F('count') + delta)
+
+
+def count_transactions(transactions, sign=1):
+    """يحوّل قائمة معاملات إلى فروقات للعدادات (للإدخال أو الحذف الجماعي)."""
+    counts = Counter((t.status, t.assigned_to_id) for t in transactions)
+    return {key: sign * value for key, value in counts.items()}
+
+
+def reassign_counters(assignee_id, new_assignee_id=None):
+    """
+    ينقل عدادات موظف إلى موظف آخر (أو إلى غير مسندة)، مثلاً عند حذف الموظف
+    حيث تُحدّث معاملاته بـ SET NULL دون استدعاء save.
+    """
+    rows = list(TransactionStatusCounter.objects.filter(assignee_id=assignee_id).values_list('status', 'count'))
+    deltas = {}
+    for status, count in rows:
+        deltas[(status, new_assignee_id)] = deltas.get((status, new_assignee_id), 0) + count
+        deltas[(status, assignee_id)] = deltas.get((status, assignee_id), 0) - count
+    adjust_transaction_counters(deltas)
+
+
+def get_status_counts(assignee_id=None):
+    """
+    Returns {status: count}. With assignee_id only that employee's transactions
+    are counted. One query on the counters table, whatever the number of transactions.
+    """
+    queryset = TransactionStatusCounter.objects.all()
+    if assignee_id is not None:
+        queryset = queryset.filter(assignee_id=assignee_id)
+    return {
+        row['status']: row['total']
+        for row in queryset.values('status').annotate(total=Sum('count'))
+        if row['total']
+    }
+
+
+def rebuild_transaction_counters():
+    """يعيد حساب كل العدادات من جدول المعاملات (للإصلاح عند الحاجة)."""
+    with transaction.atomic():
+        TransactionStatusCounter.objects.all().delete()
+        TransactionStatusCounter.objects.bulk_create([
+            TransactionStatusCounter(status=row['status'], assignee_id=row['assigned_to'] or UNASSIGNED, count=row['total'])
+            for row in Transaction.objects.order_by().values('status', 'assigned_to').annotate(total=Count('id'))
+        ])
@@ -0,0 +1,183 @@
+# core/distribution.py
+
+import heapq
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction as db_transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .counters import adjust_transaction_counters
+from .models import Notification, Transaction, TransactionDistribution
+from .services import send_bulk_notifications
+from .workload import CLOSED_TRANSACTION_STATUSES, annotate_active_counts
+
+# وزن الخبرة في التخصص: 0 = توزيع حسب الحمل فقط
+AUTO_DISTRIBUTION_AFFINITY_WEIGHT = getattr(settings, 'AUTO_DISTRIBUTION_AFFINITY_WEIGHT', 1.0)
+
+# أقصى عدد معاملات في طلب توزيع واحد
+AUTO_DISTRIBUTION_MAX_BATCH = getattr(settings, 'AUTO_DISTRIBUTION_MAX_BATCH', 1000)
+
+# الحالة التي تنتقل إليها المعاملة بعد إسنادها (نفس التوزيع اليدوي)
+ASSIGNED_STATUS = Transaction.StatusChoices.UNDER_REVIEW
+
+
+@dataclass
+class Candidate:
+    id: int
+    department_id: int = None
+    load: int = 0
+    # التخصص -> نسبة معاملات الموظف (أو قسمه) في هذا التخصص من 0 إلى 1
+    affinity: dict = field(default_factory=dict)
+    # يزيد مع كل إسناد، وتُعتبر عناصر الكومة ذات النسخة الأقدم قديمة
+    version: int = 0
+
+    def score(self, discipline):
+        # كلما زاد الحمل زادت الدرجة، وكلما زادت الخبرة في التخصص قلّت
+        return (self.load + 1) / (1 + AUTO_DISTRIBUTION_AFFINITY_WEIGHT * self.affinity.get(discipline, 0))
+
+
+def _shares(counts):
+    total = sum(counts.values())
+    return {key: value / total for key, value in counts.items()} if total else {}
+
+
+def load_candidates(staff_queryset):
+    """
+    Builds the candidates from a users queryset in two queries: open work
+    (transactions + tasks) from the workload annotations, and the discipline
+    history of every candidate. Affinity for a discipline is the candidate's
+    own share of it plus the share of their department.
+    """
+    staff = list(annotate_active_counts(staff_queryset.order_by()).values(
+        'id', 'department_id', 'active_transactions_count', 'active_tasks_count'
+    ))
+    candidates = {
+        member['id']: Candidate(
+            id=member['id'],
+            department_id=member['department_id'],
+            load=member['active_transactions_count'] + member['active_tasks_count'],
+        )
+        for member in staff
+    }
+
+    by_employee = defaultdict(dict)
+    by_department = defaultdict(lambda: defaultdict(int))
+    history = Transaction.objects.filter(assigned_to__in=list(candidates)).order_by().values(
+        'assigned_to', 'engineering_discipline'
+    ).annotate(total=Count('id'))
+    for row in history:
+        candidate = candidates[row['assigned_to']]
+        by_employee[candidate.id][row['engineering_discipline']] = row['total']
+        if candidate.department_id:
+            by_department[candidate.department_id][row['engineering_discipline']] += row['total']
+
+    department_shares = {department_id: _shares(counts) for department_id, counts in by_department.items()}
+    for candidate in candidates.values():
+        own = _shares(by_employee[candidate.id])
+        department = department_shares.get(candidate.department_id, {})
+        candidate.affinity = {
+            discipline: own.get(discipline, 0) + department.get(discipline, 0)
+            for discipline in set(own) | set(department)
+        }
+    return list(candidates.values())
+
+
+def plan_assignments(transactions, candidates):
+    """
+    Picks an assignee for each transaction, in order: each one goes to the
+    candidate with the lowest score for its discipline.
+
+    There is one min-heap per discipline. Assigning a transaction raises the
+    candidate's load, which makes their entries in every other heap stale; they
+    are not updated there but re-scored lazily when popped. Scores only grow
+    with load, so a stale entry is never better than its real score and the
+    heap top after re-scoring is always the true minimum.
+
+    Returns [(transaction, candidate), ...].
+    """
+    if not candidates:
+        return []
+
+    heaps = {}
+    plan = []
+    for transaction in transactions:
+        discipline = transaction.engineering_discipline
+        heap = heaps.get(discipline)
+        if heap is None:
+            heap = heaps[discipline] = [
+                (candidate.score(discipline), candidate.load, candidate.id, candidate.version, candidate)
+                for candidate in candidates
+            ]
+            heapq.heapify(heap)
+
+        while True:
+            _, _, _, version, candidate = heap[0]
+            if version == candidate.version:
+                break
+            heapq.heapreplace(heap, (candidate.score(discipline), candidate.load, candidate.id, candidate.version, candidate))
+
+        candidate.load += 1
+        candidate.version += 1
+        heapq.heapreplace(heap, (candidate.score(discipline), candidate.load, candidate.id, candidate.version, candidate))
+        plan.append((transaction, candidate))
+    return plan
+
+
+def auto_distribute(transaction_ids, staff_queryset, assigned_by, manager_notes=None):
+    """
+    توزيع مجموعة من المعاملات غير المسندة على الموظفين الأقل حملاً.
+
+    كل الكتابة جماعية: bulk_create للتوزيعات والإشعارات، bulk_update للمعاملات،
+    وتحديث العدادات مرة لكل (حالة، موظف). عدد الاستعلامات لا يعتمد على عدد المعاملات.
+    Returns the created TransactionDistribution objects (assigned_to is set).
+    """
+    with db_transaction.atomic():
+        transactions = list(
+            Transaction.objects.select_for_update().filter(
+                id__in=transaction_ids, assigned_to__isnull=True
+            ).exclude(status__in=CLOSED_TRANSACTION_STATUSES).order_by('created_at', 'id')
+        )
+        if not transactions:
+            return []
+
+        plan = plan_assignments(transactions, load_candidates(staff_queryset))
+        if not plan:
+            return []
+
+        now = timezone.now()
+        deltas = defaultdict(int)
+        distributions = []
+        notifications = []
+        content_type = ContentType.objects.get_for_model(Transaction)
+        for transaction, candidate in plan:
+            # bulk_update لا يستدعي save، لذلك نحدّث العدادات هنا
+            deltas[(transaction.status, None)] -= 1
+            deltas[(ASSIGNED_STATUS, candidate.id)] += 1
+
+            transaction.assigned_to_id = candidate.id
+            transaction.status = ASSIGNED_STATUS
+            transaction.updated_at = now
+            distributions.append(TransactionDistribution(
+                transaction=transaction,
+                assigned_from=assigned_by,
+                assigned_to_id=candidate.id,
+                manager_notes=manager_notes,
+            ))
+            notifications.append(Notification(
+                user_id=candidate.id,
+                message=f"تم إسناد المعاملة رقم {transaction.short_code} إليك.",
+                event_type=Notification.EventType.TRANSACTION_ASSIGNED,
+                link=f'/transactions/{transaction.id}',
+                content_type=content_type,
+                object_id=transaction.id,
+            ))
+
+        Transaction.objects.bulk_update(transactions, ['assigned_to', 'status', 'updated_at'])
+        created = TransactionDistribution.objects.bulk_create(distributions)
+        adjust_transaction_counters(deltas)
+        send_bulk_notifications(notifications)
+    return created
@@ -0,0 +1,170 @@
+# core/downloads.py
+
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from .storage import parse_blob_name
+from .streaming import streaming_content
+
+# من يرسل محتوى الملف:
+#   'django'     : Django يقرأ الملف ويرسله مع دعم Range (الافتراضي، يعمل بدون إعداد)
+#   'x-accel'    : nginx عبر X-Accel-Redirect إلى موقع internal يشير إلى MEDIA_ROOT
+#   'x-sendfile' : Apache (mod_xsendfile) أو lighttpd عبر X-Sendfile بالمسار الكامل
+FILE_DOWNLOAD_BACKEND = getattr(settings, 'FILE_DOWNLOAD_BACKEND', 'django')
+
+# بادئة الموقع الداخلي في nginx، مثال:
+#   location /protected-media/ { internal; alias /path/to/media/; }
+FILE_DOWNLOAD_ACCEL_PREFIX = getattr(settings, 'FILE_DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+
+# حجم القراءة عند الإرسال من Django
+READ_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _local_path(field):
+    try:
+        return field.path
+    except NotImplementedError:
+        # تخزين بعيد (S3 وغيره) بدون مسار محلي
+        return None
+
+
+def file_etag(name, size, modified):
+    """
+    ملفات الكتل تُعرَّف بمحتواها، فـ SHA-256 في اسمها ETag قوي لا يتغير.
+    الملفات القديمة تستخدم الحجم ووقت التعديل.
+    """
+    digest = parse_blob_name(name)
+    if digest:
+        return f'"{digest}"'
+    return f'"{size:x}-{int(modified or 0):x}"'
+
+
+def parse_range(header, size):
+    """
+    Parses a single-range Range header against a file of size bytes.
+    Returns (start, end) inclusive, None to send the whole file (no header,
+    multiple ranges or a unit other than bytes) or False when the range
+    cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-500: آخر 500 بايت
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    # If-Range: نرسل الجزء فقط إذا لم يتغير الملف منذ بدأ العميل تنزيله
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and last_modified is not None and int(last_modified) <= date
+
+
+def _iter_range(source, start, length):
+    with source:
+        source.seek(start)
+        while length:
+            data = source.read(min(READ_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def serve_file(request, field, filename=None, as_attachment=False):
+    """
+    Returns a response for a stored file after the caller has checked access.
+
+    Conditional requests get 304/412 from ETag and Last-Modified. The bytes
+    are then handed to the web server (FILE_DOWNLOAD_BACKEND 'x-accel' or
+    'x-sendfile'), which does its own Range handling, or streamed by Django
+    in READ_SIZE blocks with single-range support (206/416). Viewers can
+    then seek in large PDFs and resume broken downloads.
+    """
+    storage, name = field.storage, field.name
+    path = _local_path(field)
+    if path is not None:
+        stat = os.stat(path)
+        size, modified = stat.st_size, stat.st_mtime
+    else:
+        size = storage.size(name)
+        try:
+            modified = storage.get_modified_time(name).timestamp()
+        except NotImplementedError:
+            modified = None
+
+    etag = file_etag(name, size, modified)
+    last_modified = int(modified) if modified is not None else None
+    filename = filename or os.path.basename(name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    def finish(response):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # الملفات محمية: المتصفح يخزنها لكن يتحقق منها في كل مرة (304 رخيصة)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return finish(not_modified)
+
+    if FILE_DOWNLOAD_BACKEND in ('x-accel', 'x-sendfile') and path is not None:
+        response = HttpResponse(content_type=content_type)
+        if FILE_DOWNLOAD_BACKEND == 'x-accel':
+            response['X-Accel-Redirect'] = FILE_DOWNLOAD_ACCEL_PREFIX.rstrip('/') + '/' + quote(name.replace(os.sep, '/'))
+        else:
+            response['X-Sendfile'] = path
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+        return finish(response)
+
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    if byte_range is not None and not _if_range_matches(request, etag, last_modified):
+        byte_range = None
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+        return finish(response)
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+    source = storage.open(name, 'rb')
+    response = StreamingHttpResponse(
+        streaming_content(request, _iter_range(source, start, length)),
+        status=206 if byte_range else 200,
+        content_type=content_type,
+    )
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    if byte_range:
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+    response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    return finish(response)
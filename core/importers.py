@@ -0,0 +1,237 @@
+# core/importers.py
+
+import csv
+import io
+import os
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from .checklists import create_required_documents
+from .counters import adjust_transaction_counters, count_transactions
+from .models import Client, CompetentAuthority, CustomUser, Transaction, TransactionMainCategory, TransactionSubCategory
+from .search import index_objects
+from .sequences import allocate
+
+# أعمدة الحقول البسيطة، يتم التحقق منها عبر تعريف الحقل نفسه في النموذج
+FIELD_COLUMNS = (
+    'title', 'description', 'engineering_discipline', 'status', 'location',
+    'expected_start_date', 'expected_duration', 'doc_type', 'doc_classification',
+    'doc_number', 'doc_date', 'area_sq_meters', 'piece_number', 'plan_number',
+    'neighborhood', 'city', 'long_code',
+)
+
+# أعمدة العلاقات: اسم العمود -> (اسم الحقل في المعاملة، النموذج، حقل البحث)
+RELATION_COLUMNS = {
+    'client_code': ('client', Client, 'client_code'),
+    'main_category': ('main_category', TransactionMainCategory, 'code'),
+    'sub_category': ('sub_category', TransactionSubCategory, 'code'),
+    'competent_authority': ('competent_authority', CompetentAuthority, 'code'),
+    'assigned_to': ('assigned_to', CustomUser, 'username'),
+}
+
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx', '.xlsm')
+
+
+def _normalize_header(value):
+    return str(value).strip().lower() if value is not None else ''
+
+
+def _iter_csv_rows(fileobj):
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.reader(text)
+        header = [_normalize_header(h) for h in next(reader, [])]
+        for row_number, values in enumerate(reader, start=2):
+            yield row_number, dict(zip(header, values))
+    finally:
+        # نفصل الملف عن الغلاف حتى لا يُغلق الملف الأصلي مع الغلاف
+        text.detach()
+
+
+def _iter_xlsx_rows(fileobj):
+    from openpyxl import load_workbook
+
+    # وضع القراءة فقط يقرأ الصفوف تدريجيًا دون تحميل الملف كاملاً في الذاكرة
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [_normalize_header(h) for h in next(rows, ())]
+        for row_number, values in enumerate(rows, start=2):
+            yield row_number, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def iter_rows(fileobj, filename):
+    """
+    Streams (row_number, {column: value}) pairs from a CSV or XLSX file.
+    Row numbers match the spreadsheet (the header is row 1).
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    # ملفات Django المرفوعة تغلف الملف الفعلي في .file
+    fileobj = getattr(fileobj, 'file', fileobj)
+    if extension == '.csv':
+        return _iter_csv_rows(fileobj)
+    if extension in ('.xlsx', '.xlsm'):
+        return _iter_xlsx_rows(fileobj)
+    raise ValueError(f"نوع الملف غير مدعوم: {extension}. الأنواع المدعومة: {', '.join(SUPPORTED_EXTENSIONS)}")
+
+
+class ImportReport:
+    """نتيجة الاستيراد: عدد الصفوف المنشأة وقائمة أخطاء لكل صف."""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.total_rows = 0
+        self.created = 0
+        self.errors = []
+
+    def add_error(self, row_number, errors):
+        self.errors.append({'row': row_number, 'errors': errors})
+
+    def to_dict(self):
+        return {
+            'dry_run': self.dry_run,
+            'total_rows': self.total_rows,
+            'created': self.created,
+            'failed': len(self.errors),
+            'errors': self.errors,
+        }
+
+
+class TransactionImporter:
+    """
+    Bulk import of transactions from CSV/XLSX.
+
+    Rows are validated in chunks. Each valid chunk gets its short codes from a
+    single sequence allocation and is written, together with its required
+    documents checklist, with bulk_create inside one database transaction.
+    """
+
+    def __init__(self, chunk_size=1000, dry_run=False):
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self._fields = {name: Transaction._meta.get_field(name) for name in FIELD_COLUMNS}
+        # ذاكرة للبحث عن العلاقات: (النموذج، القيمة) -> الكائن أو None
+        self._lookup_cache = {}
+        self._seen_long_codes = set()
+
+    def run(self, fileobj, filename):
+        report = ImportReport(dry_run=self.dry_run)
+        rows = iter_rows(fileobj, filename)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            report.total_rows += len(chunk)
+            self._import_chunk(chunk, report)
+        return report
+
+    # --- التحقق من البيانات ---
+
+    def _clean_value(self, value):
+        if isinstance(value, str):
+            value = value.strip()
+            return value or None
+        return value
+
+    def _resolve_relations(self, chunk):
+        """يجلب كل الكائنات المرتبطة بالدفعة باستعلام واحد لكل نوع علاقة."""
+        for column, (_, model, lookup) in RELATION_COLUMNS.items():
+            wanted = {
+                self._clean_value(row.get(column))
+                for _, row in chunk
+            }
+            missing = {str(value) for value in wanted if value is not None and (model, str(value)) not in self._lookup_cache}
+            if not missing:
+                continue
+            for obj in model.objects.filter(**{f'{lookup}__in': missing}):
+                self._lookup_cache[(model, getattr(obj, lookup))] = obj
+            for value in missing:
+                self._lookup_cache.setdefault((model, value), None)
+
+    def _build_transaction(self, row):
+        values = {}
+        errors = {}
+
+        for name, field in self._fields.items():
+            value = self._clean_value(row.get(name))
+            if value is None and field.has_default():
+                value = field.get_default()
+            try:
+                values[name] = field.clean(value, None)
+            except ValidationError as e:
+                errors[name] = e.messages
+
+        for column, (field_name, model, lookup) in RELATION_COLUMNS.items():
+            value = self._clean_value(row.get(column))
+            if value is None:
+                continue
+            obj = self._lookup_cache.get((model, str(value)))
+            if obj is None:
+                errors[column] = [f"لا يوجد {model._meta.model_name} بالقيمة '{value}'."]
+            else:
+                values[field_name] = obj
+
+        if errors:
+            return None, errors
+        return Transaction(**values), None
+
+    def _import_chunk(self, chunk, report):
+        self._resolve_relations(chunk)
+
+        valid = []
+        for row_number, row in chunk:
+            transaction, errors = self._build_transaction(row)
+            if errors:
+                report.add_error(row_number, errors)
+            else:
+                valid.append((row_number, transaction))
+
+        # long_code فريد: نتحقق من التكرار داخل الملف ومع قاعدة البيانات باستعلام واحد
+        long_codes = {t.long_code for _, t in valid if t.long_code}
+        existing = set(Transaction.objects.filter(long_code__in=long_codes).values_list('long_code', flat=True)) if long_codes else set()
+        accepted = []
+        for row_number, transaction in valid:
+            if transaction.long_code:
+                if transaction.long_code in existing or transaction.long_code in self._seen_long_codes:
+                    report.add_error(row_number, {'long_code': ["هذا الرمز مستخدم بالفعل."]})
+                    continue
+                self._seen_long_codes.add(transaction.long_code)
+            accepted.append(transaction)
+
+        if not accepted:
+            return
+
+        with db_transaction.atomic():
+            # حجز كتلة أرقام واحدة للدفعة كاملة بدلاً من رقم لكل صف
+            now = timezone.now()
+            start = allocate('PROJ', now.year, now.month, count=len(accepted))
+            for offset, transaction in enumerate(accepted):
+                transaction.short_code = Transaction.build_short_code(
+                    transaction.engineering_discipline, now.year, now.month, start + offset
+                )
+                transaction.expected_end_date = transaction.compute_expected_end_date()
+
+            created = Transaction.objects.bulk_create(accepted)
+            if created and created[0].pk is None:
+                # بعض قواعد البيانات (MySQL) لا ترجع المفاتيح بعد bulk_create
+                ids = dict(Transaction.objects.filter(
+                    short_code__in=[t.short_code for t in created]
+                ).values_list('short_code', 'id'))
+                for transaction in created:
+                    transaction.pk = ids[transaction.short_code]
+
+            create_required_documents(created)
+            adjust_transaction_counters(count_transactions(created))
+
+            report.created += len(created)
+            if not self.dry_run:
+                # bulk_create لا يرسل post_save، لذلك نحدّث فهرس البحث هنا
+                index_objects(Transaction, created)
+            else:
+                # في وضع التجربة نتحقق من كل شيء ثم نتراجع عن الحفظ
+                db_transaction.set_rollback(True)
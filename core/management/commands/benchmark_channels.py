@@ -0,0 +1,141 @@
+# core/management/commands/benchmark_channels.py
+
+import asyncio
+import json
+import time
+import uuid
+
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.consumers import ChatConsumer
+from core.models import ChatRoom, CustomUser
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = ("Connects N simulated ChatConsumer clients to one room on each channel layer, "
+            "broadcasts messages and reports throughput and p50/p99 fan-out latency.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--layer', action='append', dest='layers',
+                            help="اسم الطبقة من CHANNEL_LAYERS (يمكن تكراره). الافتراضي: كل الطبقات المعرفة")
+        parser.add_argument('--clients', type=int, default=50, help="عدد الاتصالات في الغرفة")
+        parser.add_argument('--messages', type=int, default=200, help="عدد الرسائل المرسلة (من الاتصالات بالتناوب)")
+        parser.add_argument('--rate', type=float, default=0,
+                            help="رسائل في الثانية (0 = بأقصى سرعة، فيقيس الزمن تحت الضغط الكامل)")
+        parser.add_argument('--timeout', type=float, default=10, help="أقصى انتظار لرسالة واحدة (ثوان)")
+
+    def handle(self, *args, **options):
+        layers = options['layers'] or [alias for alias in settings.CHANNEL_LAYERS if alias != 'default']
+        unknown = [alias for alias in layers if alias not in settings.CHANNEL_LAYERS]
+        if unknown:
+            raise CommandError(f"طبقات غير معرفة في CHANNEL_LAYERS: {', '.join(unknown)}")
+        if options['clients'] < 2 or options['messages'] < 1:
+            raise CommandError("--clients يجب أن يكون 2 على الأقل و --messages 1 على الأقل")
+
+        # مستخدمون وغرفة مؤقتة حتى لا نلمس بيانات حقيقية
+        prefix = f"bench-{uuid.uuid4().hex[:8]}"
+        CustomUser.objects.bulk_create([
+            CustomUser(username=f"{prefix}-{i}", full_name_ar=f"{prefix}-{i}") for i in range(options['clients'])
+        ])
+        # MySQL لا ترجع المفاتيح بعد bulk_create
+        users = list(CustomUser.objects.filter(username__startswith=prefix).order_by('id'))
+        room = ChatRoom.objects.create(name=prefix, created_by=users[0], room_type='group')
+        room.participants.add(*users)
+
+        try:
+            for alias in layers:
+                try:
+                    result = asyncio.run(self.run_layer(
+                        alias, room, users, options['messages'], options['rate'], options['timeout']
+                    ))
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f"{alias}: فشل القياس: {e}"))
+                    continue
+                self.report(alias, options['clients'], result)
+        finally:
+            room.delete()
+            CustomUser.objects.filter(username__startswith=prefix).delete()
+
+    async def run_layer(self, alias, room, users, messages, rate, timeout):
+        # نفس ChatConsumer على الطبقة المطلوبة، بدون إشعارات المستخدمين المؤقتين
+        async def skip_notifications(self, message):
+            return None
+
+        consumer = type('BenchmarkChatConsumer', (ChatConsumer,), {
+            'channel_layer_alias': alias,
+            'notify_participants': skip_notifications,
+        })
+        application = consumer.as_asgi()
+
+        clients = []
+        try:
+            for user in users:
+                client = WebsocketCommunicator(application, f"/ws/chat/{room.id}/")
+                client.scope['user'] = user
+                client.scope['url_route'] = {'kwargs': {'room_id': str(room.id)}}
+                connected, _ = await client.connect(timeout=timeout)
+                if not connected:
+                    raise CommandError(f"رُفض اتصال المستخدم {user.username}")
+                clients.append(client)
+
+            sent_at = {}
+            latencies = []
+
+            async def receive_all(client):
+                # كل اتصال (ومنه المرسل) يستقبل كل رسالة في الغرفة؛ ما لم يصل قبل المهلة يُحسب مفقوداً
+                for _ in range(messages):
+                    try:
+                        data = json.loads(await client.receive_from(timeout=timeout))
+                    except asyncio.TimeoutError:
+                        return
+                    latencies.append(time.perf_counter() - sent_at[data['message']])
+
+            receivers = [asyncio.ensure_future(receive_all(client)) for client in clients]
+            started = time.perf_counter()
+            for i in range(messages):
+                if rate:
+                    await asyncio.sleep(max(0, started + i / rate - time.perf_counter()))
+                content = f"bench-{i}"
+                sent_at[content] = time.perf_counter()
+                await clients[i % len(clients)].send_to(text_data=json.dumps({'message': content}))
+            await asyncio.gather(*receivers)
+            elapsed = time.perf_counter() - started
+        finally:
+            for client in clients:
+                try:
+                    await client.disconnect()
+                except (Exception, asyncio.CancelledError):
+                    # الاتصال انتهى بخطأ (مثلاً تعذر الوصول إلى Redis)؛ الخطأ الأصلي هو المهم
+                    pass
+
+        return {
+            'messages': messages,
+            'deliveries': len(latencies),
+            'expected': messages * len(users),
+            'elapsed': elapsed,
+            'p50': percentile(latencies, 0.50),
+            'p99': percentile(latencies, 0.99),
+        }
+
+    def report(self, alias, clients, result):
+        backend = settings.CHANNEL_LAYERS[alias]['BACKEND'].rsplit('.', 1)[-1]
+        elapsed = result['elapsed']
+        self.stdout.write(
+            f"{alias} ({backend}) clients={clients} messages={result['messages']} "
+            f"deliveries={result['deliveries']}/{result['expected']} in {elapsed:.3f}s "
+            f"({result['messages'] / elapsed:.0f} msg/s, {result['deliveries'] / elapsed:.0f} deliveries/s) "
+            f"p50={result['p50'] * 1000:.2f}ms p99={result['p99'] * 1000:.2f}ms"
+        )
+        if result['deliveries'] < result['expected']:
+            self.stdout.write(self.style.WARNING(
+                f"{alias}: {result['expected'] - result['deliveries']} رسالة لم تصل (السعة أو المهلة)"
+            ))
@@ -0,0 +1,67 @@
+# core/management/commands/benchmark_sequences.py
+
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.models import CodeSequence
+from core.sequences import BlockAllocator, allocate
+
+
+class Command(BaseCommand):
+    help = "Allocates codes from several threads at once and verifies that no number is handed out twice."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help="عدد العمليات المتزامنة")
+        parser.add_argument('--per-thread', type=int, default=250, help="عدد الأكواد لكل عملية")
+        parser.add_argument('--block-size', type=int, default=1, help="حجم الكتلة المحجوزة لكل عملية (1 = بدون حجز)")
+
+    def handle(self, *args, **options):
+        threads_count = options['threads']
+        per_thread = options['per_thread']
+        block_size = options['block_size']
+
+        # بادئة مؤقتة حتى لا نلمس عدادات البيانات الحقيقية
+        prefix = f"BENCH-{uuid.uuid4().hex[:8]}"
+        year = 2000
+        results = [[] for _ in range(threads_count)]
+        errors = []
+
+        def worker(index):
+            # كل عملية تمثل worker مستقل بكتلة حجز خاصة به
+            allocator = BlockAllocator(block_size) if block_size > 1 else None
+            try:
+                for _ in range(per_thread):
+                    if allocator:
+                        results[index].append(allocator.next_value(prefix, year))
+                    else:
+                        results[index].append(allocate(prefix, year))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(threads_count)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        CodeSequence.objects.filter(prefix=prefix).delete()
+
+        if errors:
+            raise CommandError(f"فشلت {len(errors)} عملية: {errors[0]}")
+
+        allocated = [number for numbers in results for number in numbers]
+        duplicates = len(allocated) - len(set(allocated))
+
+        self.stdout.write(f"threads={threads_count} per_thread={per_thread} block_size={block_size}")
+        self.stdout.write(f"allocated={len(allocated)} in {elapsed:.3f}s ({len(allocated) / elapsed:.0f} codes/s)")
+        if duplicates:
+            raise CommandError(f"تم توليد {duplicates} رقم مكرر!")
+        self.stdout.write(self.style.SUCCESS("No duplicate codes."))
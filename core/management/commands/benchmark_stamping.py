@@ -0,0 +1,70 @@
+# core/management/commands/benchmark_stamping.py
+
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from PyPDF2 import PdfReader
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from core.stamping import _stamp_file, create_process_pool, get_overlay, stamp_pdf
+
+
+def build_sample_pdf(path, pages):
+    pdf = canvas.Canvas(path, pagesize=A4)
+    for number in range(1, pages + 1):
+        pdf.setFont('Helvetica', 14)
+        pdf.drawString(72, A4[1] - 72, f"Benchmark page {number}")
+        for line in range(40):
+            pdf.drawString(72, A4[1] - 100 - line * 16, "Lorem ipsum dolor sit amet " * 3)
+        pdf.showPage()
+    pdf.save()
+
+
+class Command(BaseCommand):
+    help = "Stamps generated PDFs in one process and in a process pool and reports pages per second."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--files', type=int, default=16, help="عدد الملفات")
+        parser.add_argument('--pages', type=int, default=20, help="عدد الصفحات في كل ملف")
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="عدد العمليات في وضع الدفعات")
+
+    def handle(self, *args, **options):
+        files, pages, workers = options['files'], options['pages'], options['workers']
+        if files < 1 or pages < 1 or workers < 1:
+            raise CommandError("--files و --pages و --workers يجب أن تكون 1 على الأقل")
+
+        work_dir = tempfile.mkdtemp(prefix='stamping-bench-')
+        try:
+            source = os.path.join(work_dir, 'source.pdf')
+            build_sample_pdf(source, pages)
+            total_pages = files * pages
+
+            # تجهيز طبقة الختم مسبقاً حتى لا يُحسب رسمها الأول
+            get_overlay(PdfReader(source).pages[0].mediabox)
+
+            started = time.perf_counter()
+            for _ in range(files):
+                stamp_pdf(source, io.BytesIO())
+            sequential = time.perf_counter() - started
+
+            outputs = [os.path.join(work_dir, f"out-{i}.pdf") for i in range(files)]
+            with create_process_pool(workers) as executor:
+                # تشغيل العمليات قبل القياس
+                list(executor.map(_stamp_file, [source] * workers, outputs[:workers]))
+                started = time.perf_counter()
+                stamped = sum(executor.map(_stamp_file, [source] * files, outputs))
+                pooled = time.perf_counter() - started
+
+            if stamped != total_pages:
+                raise CommandError(f"تم ختم {stamped} صفحة من أصل {total_pages}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        self.stdout.write(f"files={files} pages_per_file={pages} workers={workers}")
+        self.stdout.write(f"single process: {total_pages} pages in {sequential:.3f}s ({total_pages / sequential:.0f} pages/s)")
+        self.stdout.write(f"process pool:   {total_pages} pages in {pooled:.3f}s ({total_pages / pooled:.0f} pages/s)")
@@ -0,0 +1,185 @@
+# core/management/commands/check_query_plans.py
+
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.models import (
+    Attendance, ChatMessage, ChatRoom, Client, CustomUser, Invoice, JournalEntry,
+    Notification, Task, Transaction,
+)
+from core.chat import advance_read_cursor, unread_messages
+from core.pagination import KeysetPagination
+from core.views import (
+    AttendanceViewSet, ChatMessageViewSet, InvoiceViewSet, JournalEntryViewSet, NotificationViewSet,
+    TaskViewSet, TransactionViewSet,
+)
+
+# (الاسم، الـ ViewSet، المستخدم: admin أو staff، معاملات المسار، معاملات الطلب)
+ENDPOINT_CHECKS = [
+    ('transactions (all)', TransactionViewSet, 'admin', {}, {}),
+    ('transactions (assigned)', TransactionViewSet, 'staff', {}, {}),
+    ('transactions (assigned, active)', TransactionViewSet, 'staff', {}, {'is_active': 'true'}),
+    ('tasks (all)', TaskViewSet, 'admin', {}, {}),
+    ('notifications', NotificationViewSet, 'staff', {}, {}),
+    ('chat messages', ChatMessageViewSet, 'staff', {'room_pk': 'room'}, {}),
+    ('attendance', AttendanceViewSet, 'admin', {}, {}),
+    ('invoices', InvoiceViewSet, 'admin', {}, {}),
+    ('journal entries', JournalEntryViewSet, 'admin', {}, {}),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs EXPLAIN on the main query of each high-volume endpoint and fails "
+        "if any of them needs a full table scan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help="عدد السجلات التجريبية لكل جدول (تُحذف في النهاية). 0 = استخدام البيانات الحالية",
+        )
+
+    def handle(self, *args, **options):
+        failures = []
+        with transaction.atomic():
+            if options['seed']:
+                admin, staff, room = self._seed(options['seed'])
+            else:
+                admin = CustomUser.objects.filter(is_superuser=True).first()
+                staff = CustomUser.objects.filter(is_superuser=False).first()
+                room = ChatRoom.objects.filter(participants=staff).first() if staff else None
+                if not admin or not staff:
+                    raise CommandError("يجب وجود مدير ومستخدم عادي على الأقل، أو استخدم --seed.")
+
+            users = {'admin': admin, 'staff': staff}
+            for name, queryset in self._querysets(users, room):
+                full_scans = self._full_scans(queryset)
+                if full_scans:
+                    failures.append((name, full_scans))
+                    self.stdout.write(self.style.ERROR(f"FULL SCAN  {name}: {', '.join(full_scans)}"))
+                else:
+                    self.stdout.write(f"ok         {name}")
+
+            # البيانات التجريبية لا تُحفظ
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f"{len(failures)} quer{'y' if len(failures) == 1 else 'ies'} need a full table scan.")
+        self.stdout.write(self.style.SUCCESS("No full table scans."))
+
+    # --- بناء الاستعلامات ---
+
+    def _endpoint_queryset(self, viewset_class, user, kwargs, params):
+        request = Request(APIRequestFactory().get('/', params))
+        request.user = user
+        view = viewset_class(request=request, kwargs=kwargs, format_kwarg=None, action='list')
+        queryset = view.filter_queryset(view.get_queryset())
+        # نفس الترتيب والحد الذي يطبقه ترقيم الصفحات بالمؤشر
+        paginator = KeysetPagination()
+        ordering = paginator.get_default_ordering(queryset, view)
+        return queryset.order_by(*ordering)[:paginator.page_size + 1]
+
+    def _querysets(self, users, room):
+        for name, viewset_class, user_kind, kwargs, params in ENDPOINT_CHECKS:
+            if 'room_pk' in kwargs:
+                if room is None:
+                    continue
+                kwargs = {'room_pk': room.pk}
+            yield name, self._endpoint_queryset(viewset_class, users[user_kind], kwargs, params)
+
+        # استعلامات العدادات (غير المقروء، حضور اليوم)
+        staff = users['staff']
+        yield 'unread notifications', Notification.objects.filter(user=staff, is_read=False).values('id')
+        if room is not None:
+            yield 'unread chat messages', unread_messages(room.pk, staff.pk).values('id')
+        yield 'tasks (assigned)', Task.objects.filter(assigned_to=staff).order_by('-created_at')[:51]
+        yield "today's attendance", Attendance.objects.filter(date=timezone.localdate()).order_by('-check_in')
+        today = timezone.localdate()
+        yield 'invoices (date range)', Invoice.objects.filter(issue_date__range=(today - timedelta(days=30), today))
+
+    # --- تحليل خطة التنفيذ ---
+
+    def _full_scans(self, queryset):
+        sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute(f'EXPLAIN {sql}', params)
+                columns = [column[0] for column in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                return [row['table'] for row in rows if row.get('type') == 'ALL']
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                details = [row[-1] for row in cursor.fetchall()]
+                # "SCAN table" بدون "USING ... INDEX" تعني قراءة الجدول كاملاً
+                return [detail for detail in details if detail.startswith('SCAN ') and ' USING ' not in detail]
+        raise CommandError(f"قاعدة البيانات {connection.vendor} غير مدعومة.")
+
+    # --- البيانات التجريبية ---
+
+    def _seed(self, count):
+        tag = uuid.uuid4().hex[:8]
+        now = timezone.now()
+        today = timezone.localdate()
+
+        admin = CustomUser.objects.create(username=f'plan-admin-{tag}', is_superuser=True, is_staff=True)
+        staff = CustomUser.objects.create(username=f'plan-staff-{tag}')
+        others = CustomUser.objects.bulk_create([CustomUser(username=f'plan-user-{tag}-{i}') for i in range(10)])
+        if others and others[0].pk is None:
+            others = list(CustomUser.objects.filter(username__startswith=f'plan-user-{tag}-'))
+        assignees = [staff, *others]
+
+        statuses = [choice for choice, _ in Transaction.StatusChoices.choices]
+        Transaction.objects.bulk_create([
+            Transaction(
+                short_code=f'PLAN-{tag}-{i}', title=f'Transaction {i}',
+                assigned_to=assignees[i % len(assignees)], status=statuses[i % len(statuses)],
+            )
+            for i in range(count)
+        ], batch_size=1000)
+        Task.objects.bulk_create([
+            Task(title=f'Task {i}', assigned_to=assignees[i % len(assignees)], created_by=admin)
+            for i in range(count)
+        ], batch_size=1000)
+        Notification.objects.bulk_create([
+            Notification(user=assignees[i % len(assignees)], message=f'Notification {i}', is_read=bool(i % 3))
+            for i in range(count)
+        ], batch_size=1000)
+
+        room = ChatRoom.objects.create(name=f'plan-{tag}', created_by=admin)
+        room.participants.add(staff, admin)
+        other_room = ChatRoom.objects.create(name=f'plan-other-{tag}', created_by=admin)
+        ChatMessage.objects.bulk_create([
+            ChatMessage(room=room if i % 10 == 0 else other_room, sender=admin, content=f'Message {i}')
+            for i in range(count)
+        ], batch_size=1000)
+        # مؤشر القراءة في منتصف رسائل الغرفة
+        middle = ChatMessage.objects.filter(room=room).order_by('id').values_list('id', flat=True)[count // 20:count // 20 + 1]
+        if middle:
+            advance_read_cursor(room.pk, staff.pk, middle[0])
+
+        Attendance.objects.bulk_create([
+            Attendance(employee=assignees[i % len(assignees)], date=today - timedelta(days=i // len(assignees)), check_in=now)
+            for i in range(count)
+        ], batch_size=1000)
+
+        client = Client.objects.create(name_ar=f'plan-{tag}')
+        Invoice.objects.bulk_create([
+            Invoice(
+                invoice_number=f'PLAN-{tag}-{i}', client=client,
+                issue_date=today - timedelta(days=i % 720), due_date=today,
+            )
+            for i in range(count)
+        ], batch_size=1000)
+        JournalEntry.objects.bulk_create([
+            JournalEntry(date=today - timedelta(days=i % 720), description=f'Entry {i}', created_by=admin)
+            for i in range(count)
+        ], batch_size=1000)
+
+        return admin, staff, room
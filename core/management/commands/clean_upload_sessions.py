@@ -0,0 +1,18 @@
+# core/management/commands/clean_upload_sessions.py
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.uploads import discard_expired_uploads
+
+
+class Command(BaseCommand):
+    help = "Deletes chunked upload sessions that were abandoned before finalize, with their temporary files. Run it from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help="حذف الجلسات التي لم تستقبل أي جزء منذ هذه المدة")
+
+    def handle(self, *args, **options):
+        removed = discard_expired_uploads(timedelta(hours=options['hours']))
+        self.stdout.write(f"removed {removed} upload sessions")
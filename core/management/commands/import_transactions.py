@@ -0,0 +1,45 @@
+# core/management/commands/import_transactions.py
+
+import csv
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importers import TransactionImporter
+
+
+class Command(BaseCommand):
+    help = "Imports transactions from a CSV or XLSX file and reports the errors of each rejected row."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="مسار ملف CSV أو XLSX")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="عدد الصفوف في كل دفعة")
+        parser.add_argument('--dry-run', action='store_true', help="التحقق من البيانات دون حفظها")
+        parser.add_argument('--report', help="حفظ تقرير الأخطاء في ملف CSV")
+
+    def handle(self, *args, **options):
+        importer = TransactionImporter(chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        started = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                report = importer.run(fileobj, options['path'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        if options['report']:
+            with open(options['report'], 'w', newline='', encoding='utf-8-sig') as out:
+                writer = csv.writer(out)
+                writer.writerow(['row', 'errors'])
+                for error in report.errors:
+                    writer.writerow([error['row'], json.dumps(error['errors'], ensure_ascii=False)])
+        else:
+            for error in report.errors:
+                self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'], ensure_ascii=False)}")
+
+        prefix = "[dry-run] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}rows={report.total_rows} created={report.created} "
+            f"failed={len(report.errors)} in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,45 @@
+# core/management/commands/process_notification_outbox.py
+
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.outbox import NOTIFICATION_OUTBOX_RETENTION_DAYS, deliver_pending, purge_sent
+
+# في وضع --loop يُحذف القديم مرة كل ساعة، لا في كل دورة
+PURGE_INTERVAL_SECONDS = 3600
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends pending real-time notification events from the outbox. "
+        "Run it once from cron, or with --loop as a long-running worker. "
+        "Sent events older than --purge-sent-older-than days are deleted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="الاستمرار في العمل وفحص الصندوق كل --interval ثانية")
+        parser.add_argument('--interval', type=float, default=2.0, help="الانتظار بين الدورات بالثواني")
+        parser.add_argument('--batch-size', type=int, default=None, help="عدد الأحداث المحجوزة في كل دورة")
+        parser.add_argument('--purge-sent-older-than', type=float, default=NOTIFICATION_OUTBOX_RETENTION_DAYS,
+                            help="حذف الأحداث المرسلة الأقدم من هذا العدد من الأيام (0 لتعطيل الحذف)")
+
+    def handle(self, *args, **options):
+        retention = options['purge_sent_older_than']
+        last_purge = None
+        while True:
+            close_old_connections()
+            sent, failed = deliver_pending(batch_size=options['batch_size'])
+            if sent or failed or not options['loop']:
+                self.stdout.write(f"sent {sent}, failed {failed}")
+
+            if retention > 0 and (last_purge is None or time.monotonic() - last_purge >= PURGE_INTERVAL_SECONDS):
+                purged = purge_sent(timedelta(days=retention))
+                last_purge = time.monotonic()
+                if purged or not options['loop']:
+                    self.stdout.write(f"purged {purged} sent events")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
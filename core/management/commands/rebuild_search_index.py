@@ -0,0 +1,32 @@
+# core/management/commands/rebuild_search_index.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.search import SEARCHABLE_MODELS, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the Arabic search index for transactions, clients and tasks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', action='append', dest='models',
+            help="اسم النموذج (transaction, client, task). يمكن تكراره. الافتراضي: كل النماذج",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help="عدد السجلات في كل دفعة")
+
+    def handle(self, *args, **options):
+        models_by_name = {model._meta.model_name: model for model in SEARCHABLE_MODELS}
+        names = options['models'] or list(models_by_name)
+        unknown = [name for name in names if name not in models_by_name]
+        if unknown:
+            raise CommandError(f"نموذج غير معروف: {', '.join(unknown)}. المتاح: {', '.join(models_by_name)}")
+
+        for name in names:
+            started = time.perf_counter()
+            count = rebuild_index(models_by_name[name], batch_size=options['batch_size'])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{name}: indexed {count} rows in {elapsed:.2f}s")
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
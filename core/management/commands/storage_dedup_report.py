@@ -0,0 +1,84 @@
+# core/management/commands/storage_dedup_report.py
+
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q, Sum
+
+from core.models import Blob, ChatMessage, Document
+from core.storage import BLOB_PREFIX
+
+# الحقول المخزنة في التخزين المعنون بالمحتوى
+FILE_FIELDS = [
+    (Document, 'file'),
+    (Document, 'stamped_file'),
+    (ChatMessage, 'file'),
+]
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size} B"
+        size /= 1024
+
+
+class Command(BaseCommand):
+    help = ("Reports how much disk content-addressed storage saves (dedup ratio). "
+            "With --adopt, moves files uploaded before it into blobs first.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--adopt', action='store_true',
+                            help="نقل الملفات القديمة (transaction_{id}/...) إلى الكتل وحذف النسخ المكررة")
+
+    def handle(self, *args, **options):
+        if options['adopt']:
+            adopted, missing = self.adopt_legacy_files()
+            self.stdout.write(f"adopted {adopted} legacy files ({missing} missing on disk)")
+
+        totals = Blob.objects.filter(ref_count__gt=0).aggregate(
+            physical=Sum('size'), logical=Sum(F('size') * F('ref_count')), references=Sum('ref_count'),
+        )
+        blobs = Blob.objects.filter(ref_count__gt=0).count()
+        physical = totals['physical'] or 0
+        logical = totals['logical'] or 0
+        ratio = logical / physical if physical else 1.0
+
+        legacy = sum(self.legacy_rows(model, field).count() for model, field in FILE_FIELDS)
+
+        self.stdout.write(f"blobs={blobs} references={totals['references'] or 0}")
+        self.stdout.write(f"logical size:  {format_size(logical)}")
+        self.stdout.write(f"on disk:       {format_size(physical)}")
+        self.stdout.write(f"saved:         {format_size(logical - physical)}")
+        self.stdout.write(self.style.SUCCESS(f"dedup ratio:   {ratio:.2f}x"))
+        if legacy:
+            self.stdout.write(self.style.WARNING(f"{legacy} files are still outside blob storage (use --adopt)"))
+
+    def legacy_rows(self, model, field):
+        return model.objects.exclude(Q(**{f'{field}__isnull': True}) | Q(**{field: ''})).exclude(
+            **{f'{field}__startswith': f'{BLOB_PREFIX}/'}
+        )
+
+    def adopt_legacy_files(self):
+        adopted = missing = 0
+        for model, field in FILE_FIELDS:
+            storage = model._meta.get_field(field).storage
+            for pk, name in self.legacy_rows(model, field).values_list('pk', field).iterator():
+                if not storage.exists(name):
+                    missing += 1
+                    continue
+                # زيادة مرجع الكتلة وتحديث الصف معاً: إذا فشل التحديث يُلغى المرجع أيضاً
+                with transaction.atomic(), storage.open(name, 'rb') as content:
+                    new_name = storage.save(os.path.basename(name), content,
+                                            max_length=model._meta.get_field(field).max_length)
+                    model.objects.filter(pk=pk).update(**{field: new_name})
+                adopted += 1
+                # النسخة القديمة تُحذف إذا لم يعد أي سجل يشير إليها
+                still_used = any(
+                    other_model.objects.filter(**{other_field: name}).exists()
+                    for other_model, other_field in FILE_FIELDS
+                )
+                if not still_used:
+                    storage.delete(name)
+        return adopted, missing
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-17 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_client_sub_specialization_alter_client_client_code_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='role',
+            name='permissions_version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 4.2.23 on 2026-10-17 12:31
+
+import re
+
+from django.db import migrations, models
+
+# أنماط الأكواد الحالية: PROJ-ARCH-2025-09-0001 و CL-CC-2025-00001 و INV-2025-00001
+TRANSACTION_CODE_RE = re.compile(r'^PROJ-[A-Z]+-(\d{4})-(\d{2})-(\d+)$')
+CLIENT_CODE_RE = re.compile(r'^(CL-[A-Z]+)-(\d{4})-(\d+)$')
+INVOICE_NUMBER_RE = re.compile(r'^INV-(\d{4})-(\d+)$')
+
+
+def seed_code_sequences(apps, schema_editor):
+    """
+    يبدأ كل عداد من أعلى رقم مستخدم حاليًا حتى لا تتكرر الأكواد الموجودة.
+    """
+    CodeSequence = apps.get_model('core', 'CodeSequence')
+    Transaction = apps.get_model('core', 'Transaction')
+    Client = apps.get_model('core', 'Client')
+    Invoice = apps.get_model('core', 'Invoice')
+
+    counters = {}
+
+    def track(key, value):
+        counters[key] = max(counters.get(key, 0), int(value))
+
+    for code in Transaction.objects.values_list('short_code', flat=True).iterator():
+        match = TRANSACTION_CODE_RE.match(code or '')
+        if match:
+            year, month, seq = match.groups()
+            track(('PROJ', int(year), int(month)), seq)
+
+    for code in Client.objects.values_list('client_code', flat=True).iterator():
+        match = CLIENT_CODE_RE.match(code or '')
+        if match:
+            prefix, year, seq = match.groups()
+            track((prefix, int(year), 0), seq)
+
+    for number in Invoice.objects.values_list('invoice_number', flat=True).iterator():
+        match = INVOICE_NUMBER_RE.match(number or '')
+        if match:
+            year, seq = match.groups()
+            track(('INV', int(year), 0), seq)
+
+    CodeSequence.objects.bulk_create([
+        CodeSequence(prefix=prefix, year=year, month=month, last_value=last_value)
+        for (prefix, year, month), last_value in counters.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_role_permissions_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='invoice',
+            name='invoice_number',
+            field=models.CharField(blank=True, help_text='يتم إنشاؤه تلقائيًا إذا تُرك فارغًا. مثال: INV-2025-00001', max_length=50, unique=True),
+        ),
+        migrations.CreateModel(
+            name='CodeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=30)),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField(default=0)),
+                ('last_value', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'عداد تسلسلي',
+                'verbose_name_plural': 'العدادات التسلسلية',
+                'unique_together': {('prefix', 'year', 'month')},
+            },
+        ),
+        migrations.RunPython(seed_code_sequences, migrations.RunPython.noop),
+    ]
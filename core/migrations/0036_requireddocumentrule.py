@@ -0,0 +1,56 @@
+# Generated by Django 4.2.23 on 2026-10-17 12:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# القوائم التي كانت مكتوبة في الكود، تُنقل كقواعد في قاعدة البيانات
+BUILD_LICENSE_DOCUMENTS = [f"DOC{number:03}" for number in range(1, 23)]
+DEFAULT_DOCUMENTS = ["DOC001", "DOC005"]
+
+
+def seed_required_document_rules(apps, schema_editor):
+    DocumentType = apps.get_model('core', 'DocumentType')
+    TransactionSubCategory = apps.get_model('core', 'TransactionSubCategory')
+    RequiredDocumentRule = apps.get_model('core', 'RequiredDocumentRule')
+
+    existing_codes = set(DocumentType.objects.values_list('code', flat=True))
+    build_license = TransactionSubCategory.objects.filter(code='BUILD-LIC').first()
+
+    rules = []
+    if build_license:
+        rules += [
+            RequiredDocumentRule(sub_category=build_license, document_type_id=code, order=order)
+            for order, code in enumerate(BUILD_LICENSE_DOCUMENTS) if code in existing_codes
+        ]
+    rules += [
+        RequiredDocumentRule(sub_category=None, document_type_id=code, order=order)
+        for order, code in enumerate(DEFAULT_DOCUMENTS) if code in existing_codes
+    ]
+    RequiredDocumentRule.objects.bulk_create(rules)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0035_codesequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequiredDocumentRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order', models.PositiveSmallIntegerField(default=0, verbose_name='الترتيب')),
+                ('competent_authority', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='document_rules', to='core.competentauthority', verbose_name='الجهة المختصة')),
+                ('document_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rules', to='core.documenttype', verbose_name='نوع المستند')),
+                ('sub_category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='document_rules', to='core.transactionsubcategory', verbose_name='التصنيف الفرعي')),
+            ],
+            options={
+                'verbose_name': 'قاعدة مستند مطلوب',
+                'verbose_name_plural': 'قواعد المستندات المطلوبة',
+                'ordering': ['order', 'document_type'],
+                'unique_together': {('sub_category', 'competent_authority', 'document_type')},
+            },
+        ),
+        migrations.RunPython(seed_required_document_rules, migrations.RunPython.noop),
+    ]
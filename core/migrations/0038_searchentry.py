@@ -0,0 +1,44 @@
+# Generated by Django 4.2.23 on 2026-10-17 12:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def add_fulltext_index(apps, schema_editor):
+    # فهرس FULLTEXT مدعوم في MySQL فقط، وباقي قواعد البيانات تستخدم فهرس البحث في الذاكرة
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute('ALTER TABLE core_searchentry ADD FULLTEXT INDEX searchentry_text_ft (text)')
+
+
+def remove_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute('ALTER TABLE core_searchentry DROP INDEX searchentry_text_ft')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('core', '0037_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('text', models.TextField(verbose_name='نص البحث')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'سجل فهرس البحث',
+                'verbose_name_plural': 'فهرس البحث',
+                'unique_together': {('content_type', 'object_id')},
+            },
+        ),
+        migrations.RunPython(add_fulltext_index, remove_fulltext_index),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.23 on 2026-10-17 12:45
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def seed_transaction_counters(apps, schema_editor):
+    Transaction = apps.get_model('core', 'Transaction')
+    TransactionStatusCounter = apps.get_model('core', 'TransactionStatusCounter')
+    TransactionStatusCounter.objects.bulk_create([
+        TransactionStatusCounter(status=row['status'], assignee_id=row['assigned_to'] or 0, count=row['total'])
+        for row in Transaction.objects.order_by().values('status', 'assigned_to').annotate(total=Count('id'))
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0039_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionStatusCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=20, verbose_name='الحالة')),
+                ('assignee_id', models.PositiveIntegerField(default=0, verbose_name='الموظف')),
+                ('count', models.IntegerField(default=0, verbose_name='العدد')),
+            ],
+            options={
+                'verbose_name': 'عداد المعاملات',
+                'verbose_name_plural': 'عدادات المعاملات',
+                'unique_together': {('status', 'assignee_id')},
+            },
+        ),
+        migrations.RunPython(seed_transaction_counters, migrations.RunPython.noop),
+    ]
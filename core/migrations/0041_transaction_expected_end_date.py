@@ -0,0 +1,38 @@
+# Generated by Django 4.2.23 on 2026-10-17 12:47
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_expected_end_date(apps, schema_editor):
+    Transaction = apps.get_model('core', 'Transaction')
+    queryset = Transaction.objects.filter(
+        expected_start_date__isnull=False, expected_duration__isnull=False
+    ).only('id', 'expected_start_date', 'expected_duration').order_by('pk')
+
+    batch = []
+    for transaction in queryset.iterator(chunk_size=1000):
+        transaction.expected_end_date = transaction.expected_start_date + timedelta(days=transaction.expected_duration)
+        batch.append(transaction)
+        if len(batch) == 1000:
+            Transaction.objects.bulk_update(batch, ['expected_end_date'])
+            batch = []
+    if batch:
+        Transaction.objects.bulk_update(batch, ['expected_end_date'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0040_transactionstatuscounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='expected_end_date',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='تاريخ الانتهاء المتوقع'),
+        ),
+        migrations.RunPython(backfill_expected_end_date, migrations.RunPython.noop),
+    ]
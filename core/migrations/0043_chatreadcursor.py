@@ -0,0 +1,66 @@
+# Generated by Django 4.2.23 on 2026-10-17 12:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Max, Min
+
+
+def collapse_read_statuses(apps, schema_editor):
+    """
+    يحوّل صفوف MessageReadStatus إلى مؤشر واحد لكل (غرفة، مشارك).
+    من لديه رسائل غير مقروءة يقف مؤشره قبل أول رسالة غير مقروءة، والباقون عند آخر رسالة
+    في الغرفة (لم تكن لديهم رسائل غير مقروءة).
+    """
+    ChatMessage = apps.get_model('core', 'ChatMessage')
+    ChatRoom = apps.get_model('core', 'ChatRoom')
+    ChatReadCursor = apps.get_model('core', 'ChatReadCursor')
+    MessageReadStatus = apps.get_model('core', 'MessageReadStatus')
+
+    latest = dict(ChatMessage.objects.order_by().values('room_id').annotate(last=Max('id')).values_list('room_id', 'last'))
+    first_unread = {
+        (row['message__room_id'], row['user_id']): row['first']
+        for row in MessageReadStatus.objects.filter(is_read=False).order_by().values(
+            'message__room_id', 'user_id'
+        ).annotate(first=Min('message_id')).iterator()
+    }
+
+    batch = []
+    participants = ChatRoom.participants.through.objects.values_list('chatroom_id', 'customuser_id')
+    for room_id, user_id in participants.iterator():
+        unread = first_unread.get((room_id, user_id))
+        last_read = unread - 1 if unread else latest.get(room_id, 0)
+        batch.append(ChatReadCursor(room_id=room_id, user_id=user_id, last_read_message_id=last_read))
+        if len(batch) >= 1000:
+            ChatReadCursor.objects.bulk_create(batch)
+            batch = []
+    ChatReadCursor.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0042_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatReadCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_cursors', to='core.chatroom')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_read_cursors', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'مؤشر قراءة المحادثة',
+                'verbose_name_plural': 'مؤشرات قراءة المحادثات',
+                'unique_together': {('room', 'user')},
+            },
+        ),
+        migrations.RunPython(collapse_read_statuses, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='MessageReadStatus',
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.23 on 2026-10-17 12:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Substr
+
+
+def backfill_room_summaries(apps, schema_editor):
+    """يملأ ملخص كل غرفة (آخر رسالة وعدد المشاركين) بثلاثة تحديثات."""
+    ChatRoom = apps.get_model('core', 'ChatRoom')
+    ChatMessage = apps.get_model('core', 'ChatMessage')
+    Participants = ChatRoom.participants.through
+
+    counts = Participants.objects.filter(chatroom_id=OuterRef('pk')).order_by().values('chatroom_id').annotate(
+        total=Count('id')
+    ).values('total')
+    ChatRoom.objects.update(participants_count=Coalesce(Subquery(counts, output_field=IntegerField()), Value(0)))
+
+    latest = ChatMessage.objects.filter(room_id=OuterRef('pk')).order_by('-id').values('id')[:1]
+    ChatRoom.objects.update(last_message_id=Subquery(latest))
+
+    last_message = ChatMessage.objects.filter(id=OuterRef('last_message_id'))
+    ChatRoom.objects.filter(last_message__isnull=False).update(
+        last_message_preview=Subquery(last_message.annotate(preview=Substr('content', 1, 100)).values('preview')[:1]),
+        last_message_at=Subquery(last_message.values('created_at')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0043_chatreadcursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.chatmessage'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='participants_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_room_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.23 on 2026-10-17 13:15
+
+import core.models
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0045_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'محتوى ملف',
+                'verbose_name_plural': 'محتويات الملفات',
+            },
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='file',
+            field=models.FileField(blank=True, null=True, storage=core.storage.document_storage, upload_to='chat_files/', verbose_name='ملف مرفق'),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='file',
+            field=models.FileField(storage=core.storage.document_storage, upload_to=core.models.transaction_directory_path),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='stamped_file',
+            field=models.FileField(blank=True, null=True, storage=core.storage.document_storage, upload_to='documents/stamped/', verbose_name='الملف المختوم'),
+        ),
+    ]
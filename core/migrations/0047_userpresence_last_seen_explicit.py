@@ -0,0 +1,19 @@
+# Generated by Django 4.2.23 on 2026-10-17 13:36
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0046_blob_storage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userpresence',
+            name='last_seen',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
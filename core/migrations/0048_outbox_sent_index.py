@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-17 13:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0047_userpresence_last_seen_explicit'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificationoutbox',
+            index=models.Index(fields=['status', 'sent_at'], name='outbox_sent_idx'),
+        ),
+    ]
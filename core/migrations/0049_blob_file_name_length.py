@@ -0,0 +1,30 @@
+# Generated by Django 4.2.23 on 2026-10-17 13:48
+
+import core.models
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0048_outbox_sent_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='file',
+            field=models.FileField(blank=True, max_length=255, null=True, storage=core.storage.document_storage, upload_to='chat_files/', verbose_name='ملف مرفق'),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='file',
+            field=models.FileField(max_length=255, storage=core.storage.document_storage, upload_to=core.models.transaction_directory_path),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='stamped_file',
+            field=models.FileField(blank=True, max_length=255, null=True, storage=core.storage.document_storage, upload_to='documents/stamped/', verbose_name='الملف المختوم'),
+        ),
+    ]
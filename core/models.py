@@ -1,16 +1,20 @@
 # engineering_office/back-end/core/models.py
 
 from django.utils import timezone
+from datetime import timedelta
 import os
+import uuid
 import qrcode
 import base64
 from io import BytesIO
 from django.db import models
+from django.db import transaction as db_transaction
 from django.contrib.auth.models import AbstractUser
 from decimal import Decimal
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from .storage import document_storage
 
 # ===============================================
 # نموذج الصلاحيات (Permissions)
@@ -32,6 +36,8 @@ class Permission(models.Model):
 class Role(models.Model):
     name = models.CharField(max_length=100, unique=True)
     permissions = models.ManyToManyField(Permission, blank=True)
+    # يزداد مع كل تعديل على صلاحيات الدور، ويُقارن بالقيمة المخزنة في التوكن
+    permissions_version = models.PositiveIntegerField(default=1, editable=False)
 
     def __str__(self):
         return self.name
@@ -66,9 +72,49 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.username
 
+# ===============================================
+# عدادات الأكواد التسلسلية (المعاملات، العملاء، الفواتير)
+# ===============================================
+class CodeSequence(models.Model):
+    """
+    صف عداد واحد لكل (بادئة، سنة، شهر)، يُزاد بشكل ذري عند توليد كود جديد.
+    الشهر = 0 يعني أن التسلسل سنوي.
+    """
+    prefix = models.CharField(max_length=30)
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField(default=0)
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('prefix', 'year', 'month')
+        verbose_name = "عداد تسلسلي"
+        verbose_name_plural = "العدادات التسلسلية"
+
+    def __str__(self):
+        return f"{self.prefix}-{self.year}-{str(self.month).zfill(2)}: {self.last_value}"
+
 # ===============================================
 # تم وضع نموذج العميل قبل نموذج المعاملة لحل الخطأ
 # ===============================================
+class TransactionStatusCounter(models.Model):
+    """
+    عدد المعاملات لكل (حالة، موظف مسند إليه). يُحدّث مع كل إنشاء أو تغيير حالة أو حذف
+    لمعاملة، حتى لا تحتاج لوحة التحكم إلى COUNT على جدول المعاملات.
+    """
+    status = models.CharField(max_length=20, verbose_name="الحالة")
+    # معرف الموظف، و 0 للمعاملات غير المسندة (حتى يعمل القيد الفريد بدون NULL)
+    assignee_id = models.PositiveIntegerField(default=0, verbose_name="الموظف")
+    count = models.IntegerField(default=0, verbose_name="العدد")
+
+    class Meta:
+        unique_together = ('status', 'assignee_id')
+        verbose_name = "عداد المعاملات"
+        verbose_name_plural = "عدادات المعاملات"
+
+    def __str__(self):
+        return f"{self.status} / {self.assignee_id}: {self.count}"
+
+
 class Client(models.Model):
     # === START: إضافة أنواع العملاء الجديدة من ملف PDF ===
     class ClientTypeChoices(models.TextChoices):
@@ -134,18 +180,9 @@ class Client(models.Model):
             # تحديد الرمز الفرعي (إذا وجد)
             type_code = self.sub_specialization if self.sub_specialization else self.client_type
 
-            # البحث عن آخر عميل من نفس النوع والسنة للحصول على الرقم التسلسلي
-            last_client = Client.objects.filter(
-                client_code__startswith=f'CL-{type_code}-{year}'
-            ).order_by('client_code').last()
-            
-            sequence = 1
-            if last_client:
-                try:
-                    last_sequence_str = last_client.client_code.split('-')[-1]
-                    sequence = int(last_sequence_str) + 1
-                except (ValueError, IndexError):
-                    pass # في حال وجود خطأ، يبقى التسلسل 1
+            # الحصول على الرقم التسلسلي التالي من عداد (النوع، السنة)
+            from .sequences import next_value
+            sequence = next_value(f'CL-{type_code}', year)
 
             # بناء الكود بالشكل الجديد: CL-P-2025-00001 أو CL-CC-2025-00001
             self.client_code = f"CL-{type_code}-{year}-{str(sequence).zfill(5)}"
@@ -217,6 +254,8 @@ class Transaction(models.Model):
     location = models.CharField(max_length=255, blank=True, null=True, verbose_name="الموقع الجغرافي")
     expected_start_date = models.DateField(null=True, blank=True, verbose_name="تاريخ البدء المتوقع")
     expected_duration = models.PositiveIntegerField(null=True, blank=True, help_text="المدة بالأيام", verbose_name="المدة الزمنية المتوقعة")
+    # تاريخ الانتهاء المتوقع (البدء + المدة) محفوظ حتى يمكن فلترة المعاملات المتأخرة في SQL
+    expected_end_date = models.DateField(null=True, blank=True, editable=False, verbose_name="تاريخ الانتهاء المتوقع")
 
     main_category = models.ForeignKey('TransactionMainCategory', on_delete=models.SET_NULL, null=True, blank=True)
     sub_category = models.ForeignKey('TransactionSubCategory', on_delete=models.SET_NULL, null=True, blank=True)
@@ -235,6 +274,14 @@ class Transaction(models.Model):
     city = models.CharField(max_length=100, blank=True, null=True)
     # === END: التصحيح ===
 
+    class Meta:
+        # فهرس لترقيم الصفحات بالمؤشر (created_at, id)
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='transaction_created_idx'),
+            # قائمة "معاملاتي" وفلترة الحالة للموظف
+            models.Index(fields=['assigned_to', 'status', 'created_at'], name='transaction_assignee_idx'),
+        ]
+
     def __str__(self):
         display_name = self.short_code if self.short_code else self.title
         return f"{display_name}"
@@ -244,23 +291,55 @@ class Transaction(models.Model):
             now = timezone.now()
             year = now.year
             month = now.month
-            last_transaction = Transaction.objects.filter(
-                created_at__year=year,
-                created_at__month=month
-            ).order_by('-short_code').first()
-            sequence = 1
-            if last_transaction and last_transaction.short_code:
-                try:
-                    last_sequence_str = last_transaction.short_code.split('-')[-1]
-                    sequence = int(last_sequence_str) + 1
-                except (IndexError, ValueError):
-                    pass
-            self.short_code = (
-                f"PROJ-{self.engineering_discipline}"
-                f"-{year}-{str(month).zfill(2)}"
-                f"-{str(sequence).zfill(4)}"
-            )
-        super().save(*args, **kwargs)
+            # تسلسل شهري مشترك لكل التخصصات (كما كان سابقًا)
+            from .sequences import next_value
+            sequence = next_value('PROJ', year, month)
+            self.short_code = self.build_short_code(self.engineering_discipline, year, month, sequence)
+
+        self.expected_end_date = self.compute_expected_end_date()
+        if kwargs.get('update_fields') is not None and {'expected_start_date', 'expected_duration'} & set(kwargs['update_fields']):
+            kwargs['update_fields'] = [*kwargs['update_fields'], 'expected_end_date']
+
+        from .counters import adjust_transaction_counters
+        # تحديث العدادات في نفس معاملة قاعدة البيانات مع الحفظ
+        with db_transaction.atomic():
+            # الحالة الحالية من الصف نفسه مع قفله: نسخة محملة قديمة أو حفظ متزامن
+            # لنفس المعاملة لا يطرحان من مفتاح لم تعد المعاملة فيه
+            old_state = None
+            if self.pk is not None:
+                old_state = Transaction.objects.select_for_update().filter(pk=self.pk).values_list(
+                    'status', 'assigned_to_id'
+                ).first()
+
+            update_fields = kwargs.get('update_fields')
+            new_state = (self.status, self.assigned_to_id)
+            if update_fields is not None and old_state is not None:
+                # الحقول التي لم تُحفظ تبقى كما هي في قاعدة البيانات
+                update_fields = set(update_fields)
+                new_state = (
+                    self.status if 'status' in update_fields else old_state[0],
+                    self.assigned_to_id if {'assigned_to', 'assigned_to_id'} & update_fields else old_state[1],
+                )
+
+            super().save(*args, **kwargs)
+            if old_state != new_state:
+                deltas = {new_state: 1}
+                if old_state is not None:
+                    deltas[old_state] = -1
+                adjust_transaction_counters(deltas)
+
+    def compute_expected_end_date(self):
+        if self.expected_start_date and self.expected_duration:
+            return self.expected_start_date + timedelta(days=self.expected_duration)
+        return None
+
+    @staticmethod
+    def build_short_code(discipline, year, month, sequence):
+        return (
+            f"PROJ-{discipline}"
+            f"-{year}-{str(month).zfill(2)}"
+            f"-{str(sequence).zfill(4)}"
+        )
 
 
 def transaction_directory_path(instance, filename):
@@ -272,12 +351,12 @@ class Document(models.Model):
     
     transaction_document = models.ForeignKey('TransactionDocument', on_delete=models.CASCADE, related_name='files', null=True, blank=True)
     
-    file = models.FileField(upload_to=transaction_directory_path)
+    file = models.FileField(upload_to=transaction_directory_path, storage=document_storage, max_length=255)
     description = models.CharField(max_length=255, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     uploaded_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True)
     # === START: أضف الحقلين التاليين ===
-    stamped_file = models.FileField(upload_to='documents/stamped/', null=True, blank=True, verbose_name="الملف المختوم")
+    stamped_file = models.FileField(upload_to='documents/stamped/', storage=document_storage, max_length=255, null=True, blank=True, verbose_name="الملف المختوم")
     is_stamped = models.BooleanField(default=False, verbose_name="هل تم الختم؟")
     # === END: الإضافة هنا ===
 
@@ -285,6 +364,57 @@ class Document(models.Model):
     def __str__(self):
         return os.path.basename(self.file.name)
 
+
+class Blob(models.Model):
+    """
+    محتوى ملف مخزن مرة واحدة (core.storage). ref_count عدد الملفات التي تشير إليه
+    في Document و ChatMessage؛ يُحذف المحتوى مع آخر مرجع.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "محتوى ملف"
+        verbose_name_plural = "محتويات الملفات"
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count})"
+
+
+class UploadSession(models.Model):
+    """
+    رفع ملف كبير على أجزاء (core.uploads). الأجزاء تُلحق بملف مؤقت بالترتيب،
+    وعند الإنهاء يُنشأ Document كما في الرفع العادي.
+    """
+    class Status(models.TextChoices):
+        ACTIVE = 'active', 'قيد الرفع'
+        COMPLETE = 'complete', 'مكتمل'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='upload_sessions')
+    transaction_document = models.ForeignKey('TransactionDocument', on_delete=models.CASCADE, null=True, blank=True, related_name='upload_sessions')
+    created_by = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    description = models.CharField(max_length=255, blank=True)
+    total_size = models.PositiveBigIntegerField()
+    received_bytes = models.PositiveBigIntegerField(default=0)
+    # SHA-256 الذي أرسله العميل (اختياري) والمحسوب من الأجزاء عند الإنهاء
+    expected_sha256 = models.CharField(max_length=64, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.ACTIVE)
+    document = models.ForeignKey(Document, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "جلسة رفع"
+        verbose_name_plural = "جلسات الرفع"
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_bytes}/{self.total_size})"
+
 class Task(models.Model):
     class TaskTypeChoices(models.TextChoices):
         PLAN_REVIEW = 'PLAN_REVIEW', 'تدقيق مخطط'
@@ -319,6 +449,12 @@ class Task(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     due_date = models.DateField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='task_created_idx'),
+            models.Index(fields=['assigned_to', 'created_at'], name='task_assignee_created_idx'),
+        ]
+
     def clean(self):
         super().clean()
         if self.pk: # التحقق فقط عند التحديث وليس الإنشاء
@@ -353,7 +489,7 @@ class Invoice(models.Model):
         PAID = 'paid', 'مدفوعة'
         CANCELLED = 'cancelled', 'ملغاة'
 
-    invoice_number = models.CharField(max_length=50, unique=True)
+    invoice_number = models.CharField(max_length=50, unique=True, blank=True, help_text="يتم إنشاؤه تلقائيًا إذا تُرك فارغًا. مثال: INV-2025-00001")
     client = models.ForeignKey(Client, on_delete=models.PROTECT, related_name='invoices')
     transaction = models.ForeignKey(Transaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='invoices')
     status = models.CharField(max_length=20, choices=StatusChoices.choices, default=StatusChoices.DRAFT)
@@ -365,6 +501,11 @@ class Invoice(models.Model):
     # --- هذا هو الحقل الجديد لتخزين صورة QR Code ---
     qr_code_image = models.TextField(blank=True, null=True, verbose_name="QR Code Image (Base64)")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['issue_date', 'id'], name='invoice_issue_date_idx'),
+        ]
+
     def __str__(self):
         return f"Invoice {self.invoice_number} for {self.client.name_ar}"
 
@@ -395,6 +536,11 @@ class Invoice(models.Model):
         return base64.b64encode(tlv_string).decode('utf-8')
 
     def save(self, *args, **kwargs):
+        if not self.invoice_number:
+            from .sequences import next_value
+            year = self.issue_date.year if self.issue_date else timezone.now().year
+            self.invoice_number = f"INV-{year}-{str(next_value('INV', year)).zfill(5)}"
+
         # إنشاء وتحديث QR Code قبل الحفظ
         qr_data = self._generate_qr_code_data()
         qr_img = qrcode.make(qr_data)
@@ -485,6 +631,29 @@ class TransactionDocument(models.Model):
         return f"{self.transaction.short_code}: {self.document_type.name_ar} ({self.status})"
 
 
+class RequiredDocumentRule(models.Model):
+    """
+    يحدد المستندات المطلوبة للمعاملة حسب التصنيف الفرعي، واختياريًا حسب الجهة المختصة.
+    القواعد بدون تصنيف فرعي تمثل القائمة الافتراضية.
+    """
+    sub_category = models.ForeignKey(TransactionSubCategory, on_delete=models.CASCADE, null=True, blank=True, related_name='document_rules', verbose_name="التصنيف الفرعي")
+    competent_authority = models.ForeignKey(CompetentAuthority, on_delete=models.CASCADE, null=True, blank=True, related_name='document_rules', verbose_name="الجهة المختصة")
+    document_type = models.ForeignKey(DocumentType, on_delete=models.CASCADE, related_name='rules', verbose_name="نوع المستند")
+    order = models.PositiveSmallIntegerField(default=0, verbose_name="الترتيب")
+
+    class Meta:
+        unique_together = ('sub_category', 'competent_authority', 'document_type')
+        ordering = ['order', 'document_type']
+        verbose_name = "قاعدة مستند مطلوب"
+        verbose_name_plural = "قواعد المستندات المطلوبة"
+
+    def __str__(self):
+        scope = self.sub_category.code if self.sub_category else "افتراضي"
+        if self.competent_authority:
+            scope = f"{scope} / {self.competent_authority.code}"
+        return f"{scope}: {self.document_type_id}"
+
+
 
 class Project(models.Model):
     STATUS_CHOICES = [
@@ -597,6 +766,9 @@ class Attendance(models.Model):
         # يضمن عدم تكرار سجل الحضور للموظف في نفس اليوم
         unique_together = ('employee', 'date')
         ordering = ['-date', '-check_in']
+        indexes = [
+            models.Index(fields=['date', 'check_in'], name='attendance_date_idx'),
+        ]
 
 class LeaveRequest(models.Model):
     LEAVE_TYPE_CHOICES = [
@@ -669,6 +841,9 @@ class JournalEntry(models.Model):
         verbose_name = "قيد يومية"
         verbose_name_plural = "قيود اليومية"
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['date', 'id'], name='journal_entry_date_idx'),
+        ]
 
 
 class JournalEntryItem(models.Model):
@@ -751,11 +926,52 @@ class Notification(models.Model):
         ordering = ['-created_at']
         verbose_name = "إشعار"
         verbose_name_plural = "الإشعارات"
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='notification_user_created_idx'),
+            # عدد الإشعارات غير المقروءة وتحديدها كمقروءة
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notification_unread_idx'),
+        ]
 
     def __str__(self):
         return f"إشعار لـ {self.user.username}: {self.message[:20]}"
 
-    
+
+class NotificationOutbox(models.Model):
+    """
+    حدث فوري (Pusher) ينتظر الإرسال. يُحفظ في نفس معاملة قاعدة البيانات مع الإشعار،
+    ويرسله عامل في الخلفية مع إعادة المحاولة، فلا ينتظر الطلب اتصال Pusher.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'بانتظار الإرسال'
+        SENT = 'sent', 'تم الإرسال'
+        FAILED = 'failed', 'فشل'
+
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, null=True, blank=True, related_name='outbox_entries')
+    channel = models.CharField(max_length=200)
+    event = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # موعد المحاولة التالية، ويُستخدم أيضاً كمهلة حجز أثناء الإرسال
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True, default='')
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "حدث بانتظار الإرسال"
+        verbose_name_plural = "صندوق الإرسال"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_pending_idx'),
+            # حذف الأحداث المرسلة القديمة (purge_sent)
+            models.Index(fields=['status', 'sent_at'], name='outbox_sent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event} -> {self.channel} ({self.status})"
+
+
 class TransactionDistribution(models.Model):
     """
     يسجل هذا الموديل كل عملية توزيع لمعاملة من مدير إلى موظف.
@@ -799,6 +1015,13 @@ class ChatRoom(models.Model):
     department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, blank=True, 
                                   verbose_name="القسم المرتبط")
 
+    # ملخص الغرفة لقائمة المحادثات، يُحدّث عند حفظ الرسائل وتغيير المشاركين (core.chat)
+    last_message = models.ForeignKey('ChatMessage', on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='+', editable=False)
+    last_message_preview = models.CharField(max_length=255, blank=True, default='', editable=False)
+    last_message_at = models.DateTimeField(null=True, blank=True, editable=False)
+    participants_count = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         verbose_name = "غرفة محادثة"
         verbose_name_plural = "غرف المحادثات"
@@ -807,8 +1030,19 @@ class ChatRoom(models.Model):
     def __str__(self):
         return f"{self.name} ({self.get_room_type_display()})"
 
+    # حقول الملخص تُحدّث فقط عبر core.chat، فلا يكتبها save() بقيم قديمة من نسخة محملة مسبقاً
+    SUMMARY_FIELDS = ('last_message', 'last_message_preview', 'last_message_at', 'participants_count')
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.SUMMARY_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def get_participants_count(self):
-        return self.participants.count()
+        return self.participants_count
 
 class ChatMessage(models.Model):
     """نموذج للرسائل في المحادثات"""
@@ -821,7 +1055,7 @@ class ChatMessage(models.Model):
         ('image', 'صورة'),
         ('system', 'نظام')
     ])
-    file = models.FileField(upload_to='chat_files/', null=True, blank=True, verbose_name="ملف مرفق")
+    file = models.FileField(upload_to='chat_files/', storage=document_storage, max_length=255, null=True, blank=True, verbose_name="ملف مرفق")
     is_read = models.BooleanField(default=False, verbose_name="تم القراءة")
     created_at = models.DateTimeField(auto_now_add=True)
     parent_message = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, 
@@ -831,27 +1065,34 @@ class ChatMessage(models.Model):
         verbose_name = "رسالة محادثة"
         verbose_name_plural = "رسائل المحادثات"
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['room', 'created_at', 'id'], name='chat_message_room_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender.username}: {self.content[:50]}"
 
-class MessageReadStatus(models.Model):
-    """تتبع حالة قراءة الرسائل"""
-    message = models.ForeignKey(ChatMessage, on_delete=models.CASCADE, related_name='read_status')
-    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='message_reads')
-    is_read = models.BooleanField(default=False)
-    read_at = models.DateTimeField(null=True, blank=True)
+class ChatReadCursor(models.Model):
+    """
+    آخر رسالة قرأها المستخدم في الغرفة. كل الرسائل ذات المعرف الأكبر غير مقروءة،
+    فيكفي صف واحد لكل (غرفة، مستخدم) بدلاً من صف لكل (رسالة، مستخدم).
+    """
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='read_cursors')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='chat_read_cursors')
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        unique_together = ('message', 'user')
-        verbose_name = "حالة قراءة الرسالة"
-        verbose_name_plural = "حالات قراءة الرسائل"
+        unique_together = ('room', 'user')
+        verbose_name = "مؤشر قراءة المحادثة"
+        verbose_name_plural = "مؤشرات قراءة المحادثات"
 
 class UserPresence(models.Model):
     """تتبع حالة الاتصال للمستخدمين"""
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='presence')
     is_online = models.BooleanField(default=False)
-    last_seen = models.DateTimeField(auto_now=True)
+    # يُكتب صراحة من core.presence بوقت آخر نبضة، لا بوقت الحفظ
+    last_seen = models.DateTimeField(default=timezone.now)
     device_token = models.CharField(max_length=255, blank=True, null=True)
 
     class Meta:
@@ -861,3 +1102,22 @@ class UserPresence(models.Model):
     def __str__(self):
         return f"{self.user.username} - {'Online' if self.is_online else 'Offline'}"
 
+
+
+class SearchEntry(models.Model):
+    """
+    نص البحث الموحد (بعد توحيد الحروف العربية) لكل سجل قابل للبحث.
+    على MySQL يوجد على عمود النص فهرس FULLTEXT.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    text = models.TextField(verbose_name="نص البحث")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('content_type', 'object_id')
+        verbose_name = "سجل فهرس البحث"
+        verbose_name_plural = "فهرس البحث"
+
+    def __str__(self):
+        return f"{self.content_type_id}:{self.object_id}"
@@ -0,0 +1,239 @@
+# core/outbox.py
+
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import pusher
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+# صنف الإرسال الافتراضي (settings.NOTIFICATION_DELIVERY_BACKEND).
+# في الاختبارات يمكن استخدام core.outbox.LocalDeliveryBackend
+DEFAULT_DELIVERY_BACKEND = 'core.outbox.PusherDeliveryBackend'
+
+# عدد المحاولات قبل اعتبار الحدث فاشلاً نهائياً
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = getattr(settings, 'NOTIFICATION_OUTBOX_MAX_ATTEMPTS', 8)
+
+# عدد الأحداث التي يحجزها العامل في كل دورة
+NOTIFICATION_OUTBOX_BATCH_SIZE = getattr(settings, 'NOTIFICATION_OUTBOX_BATCH_SIZE', 100)
+
+# مدة الحجز: إذا توقف العامل أثناء الإرسال تعود الأحداث للانتظار بعدها
+NOTIFICATION_OUTBOX_LEASE_SECONDS = getattr(settings, 'NOTIFICATION_OUTBOX_LEASE_SECONDS', 60)
+
+# إرسال فوري في خيط بالخلفية بعد حفظ المعاملة. بدونه يعتمد الإرسال على أمر process_notification_outbox
+NOTIFICATION_OUTBOX_DISPATCH_ON_COMMIT = getattr(settings, 'NOTIFICATION_OUTBOX_DISPATCH_ON_COMMIT', True)
+
+# الأحداث المرسلة تُحذف بعد هذه المدة (أيام) حتى لا يكبر الجدول بلا حد. الفاشلة تبقى للمراجعة
+NOTIFICATION_OUTBOX_RETENTION_DAYS = getattr(settings, 'NOTIFICATION_OUTBOX_RETENTION_DAYS', 7)
+
+# الانتظار بين المحاولات: 5 ثوان ثم يتضاعف حتى ساعة
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 3600
+
+
+# --- عميل Pusher المشترك ---
+
+_pusher_client = None
+_pusher_lock = threading.Lock()
+
+
+def get_pusher_client():
+    """
+    عميل Pusher واحد لكل عملية. يحتفظ بجلسة HTTP واحدة فيُعاد استخدام الاتصال
+    بدلاً من فتح اتصال TLS جديد لكل إشعار.
+    """
+    global _pusher_client
+    if _pusher_client is None:
+        with _pusher_lock:
+            if _pusher_client is None:
+                _pusher_client = pusher.Pusher(
+                    app_id=settings.PUSHER_APP_ID,
+                    key=settings.PUSHER_KEY,
+                    secret=settings.PUSHER_SECRET,
+                    cluster=settings.PUSHER_CLUSTER,
+                    ssl=True
+                )
+    return _pusher_client
+
+
+# --- أصناف الإرسال ---
+
+class PusherDeliveryBackend:
+    """Sends events with Pusher trigger_batch, which accepts up to 10 events per request."""
+    max_batch_size = 10
+
+    def send(self, events):
+        get_pusher_client().trigger_batch([
+            {'channel': event['channel'], 'name': event['name'], 'data': event['data']}
+            for event in events
+        ])
+
+
+class LocalDeliveryBackend:
+    """يحتفظ بالأحداث في الذاكرة بدلاً من إرسالها (للاختبارات والتطوير بدون شبكة)."""
+    max_batch_size = 100
+    sent = []
+
+    def send(self, events):
+        LocalDeliveryBackend.sent.extend(events)
+
+
+_backends = {}
+
+
+def get_delivery_backend():
+    path = getattr(settings, 'NOTIFICATION_DELIVERY_BACKEND', DEFAULT_DELIVERY_BACKEND)
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+# --- الإضافة إلى صندوق الإرسال ---
+
+def enqueue_events(events):
+    """
+    Adds events to the outbox in the current database transaction.
+
+    Each event is a dict with channel, name, data and optionally notification.
+    Nothing is sent here; the rows are delivered after commit, so a rolled
+    back request never pushes anything and the request never waits on Pusher.
+    """
+    if not events:
+        return []
+    entries = NotificationOutbox.objects.bulk_create([
+        NotificationOutbox(
+            notification=event.get('notification'),
+            channel=event['channel'],
+            event=event['name'],
+            payload=event['data'],
+        )
+        for event in events
+    ])
+    if NOTIFICATION_OUTBOX_DISPATCH_ON_COMMIT:
+        transaction.on_commit(dispatch_in_background)
+    return entries
+
+
+def enqueue_event(channel, name, data, notification=None):
+    return enqueue_events([{'channel': channel, 'name': name, 'data': data, 'notification': notification}])
+
+
+# --- العامل ---
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def dispatch_in_background():
+    """يطلب تفريغ الصندوق في خيط الخلفية. خيط واحد فقط، فالطلبات المتتالية تُنفذ بالترتيب."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='notification-outbox')
+    _executor.submit(_background_drain)
+
+
+def _background_drain():
+    close_old_connections()
+    try:
+        deliver_pending()
+    except Exception:
+        logger.exception("تعذر تفريغ صندوق الإشعارات")
+    finally:
+        close_old_connections()
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+def _claim(batch_size):
+    """يحجز دفعة من الأحداث المستحقة بتحديث واحد حتى لا يرسلها عاملان معاً."""
+    now = timezone.now()
+    candidates = list(NotificationOutbox.objects.filter(
+        status=NotificationOutbox.Status.PENDING, next_attempt_at__lte=now
+    ).order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+    if not candidates:
+        return []
+
+    token = uuid.uuid4().hex
+    NotificationOutbox.objects.filter(
+        id__in=candidates, status=NotificationOutbox.Status.PENDING, next_attempt_at__lte=now
+    ).update(claim_token=token, next_attempt_at=now + timedelta(seconds=NOTIFICATION_OUTBOX_LEASE_SECONDS))
+    return list(NotificationOutbox.objects.filter(claim_token=token).order_by('id'))
+
+
+def _mark_failed(entries, error):
+    now = timezone.now()
+    by_attempts = {}
+    for entry in entries:
+        by_attempts.setdefault(entry.attempts + 1, []).append(entry.id)
+
+    for attempts, ids in by_attempts.items():
+        updates = {'attempts': attempts, 'last_error': str(error)[:1000], 'claim_token': ''}
+        if attempts >= NOTIFICATION_OUTBOX_MAX_ATTEMPTS:
+            updates['status'] = NotificationOutbox.Status.FAILED
+        else:
+            updates['next_attempt_at'] = now + _retry_delay(attempts)
+        NotificationOutbox.objects.filter(id__in=ids).update(**updates)
+
+
+def deliver_pending(batch_size=None, backend=None):
+    """
+    Drains the outbox until nothing is due. Returns (sent, failed).
+
+    Claimed rows are sent in groups of the backend's max_batch_size; a group
+    that raises is retried later with exponential backoff and marked failed
+    after NOTIFICATION_OUTBOX_MAX_ATTEMPTS.
+    """
+    backend = backend or get_delivery_backend()
+    batch_size = batch_size or NOTIFICATION_OUTBOX_BATCH_SIZE
+    sent = failed = 0
+    while True:
+        entries = _claim(batch_size)
+        if not entries:
+            return sent, failed
+
+        for start in range(0, len(entries), backend.max_batch_size):
+            group = entries[start:start + backend.max_batch_size]
+            try:
+                backend.send([{'channel': e.channel, 'name': e.event, 'data': e.payload} for e in group])
+            except Exception as e:
+                logger.warning(f"فشل إرسال {len(group)} حدث عبر {type(backend).__name__}: {e}")
+                _mark_failed(group, e)
+                failed += len(group)
+                continue
+            NotificationOutbox.objects.filter(id__in=[entry.id for entry in group]).update(
+                status=NotificationOutbox.Status.SENT, sent_at=timezone.now(), claim_token='',
+            )
+            sent += len(group)
+
+
+def purge_sent(older_than=None, batch_size=1000):
+    """
+    Deletes SENT rows whose sent_at is older than older_than (a timedelta,
+    NOTIFICATION_OUTBOX_RETENTION_DAYS by default), batch_size rows per
+    DELETE so no statement locks a large part of the table. Returns the
+    number of rows deleted.
+    """
+    if older_than is None:
+        older_than = timedelta(days=NOTIFICATION_OUTBOX_RETENTION_DAYS)
+    cutoff = timezone.now() - older_than
+    deleted = 0
+    while True:
+        ids = list(NotificationOutbox.objects.filter(
+            status=NotificationOutbox.Status.SENT, sent_at__lt=cutoff
+        ).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += NotificationOutbox.objects.filter(id__in=ids).delete()[0]
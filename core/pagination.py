@@ -0,0 +1,74 @@
+# core/pagination.py
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.settings import api_settings
+
+
+class OffsetPagination(PageNumberPagination):
+    """ترقيم صفحات تقليدي (?page=N) لشاشات الإدارة التي تحتاج رقم الصفحة والعدد الكلي."""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination built on DRF's CursorPagination. Each page
+    filters on the first ordering field only (`WHERE created_at < cursor`)
+    and skips the rows that share the cursor's value with a small offset
+    stored in the cursor, so its cost does not grow with the table size.
+    The trailing id keeps the order stable; it is not part of the filter.
+
+    The ordering comes from the view's `cursor_ordering`, otherwise
+    ('-created_at', '-id') when the model has a created_at field, otherwise '-pk'.
+    Sending ?page=N switches to offset pagination (OffsetPagination), and so
+    does ?search=, since search results are ordered by relevance.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-created_at', '-id')
+    offset_query_param = 'page'
+    offset_pagination_class = OffsetPagination
+
+    def __init__(self):
+        self.offset_paginator = None
+
+    def get_default_ordering(self, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering:
+            return ordering
+        try:
+            queryset.model._meta.get_field('created_at')
+        except FieldDoesNotExist:
+            return ('-pk',)
+        return ('-created_at', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        self.ordering = self.get_default_ordering(queryset, view)
+        return super().get_ordering(request, queryset, view)
+
+    def use_offset_pagination(self, request, view=None):
+        if self.offset_query_param in request.query_params:
+            return True
+        return bool(request.query_params.get(api_settings.SEARCH_PARAM, '').strip())
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_offset_pagination(request, view):
+            self.offset_paginator = self.offset_pagination_class()
+            page = self.offset_paginator.paginate_queryset(queryset, request, view)
+            self.display_page_controls = self.offset_paginator.display_page_controls
+            return page
+        self.offset_paginator = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.offset_paginator is not None:
+            return self.offset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.offset_paginator is not None:
+            return self.offset_paginator.to_html()
+        return super().to_html()
@@ -0,0 +1,21 @@
+# core/permissions.py
+
+from rest_framework.permissions import BasePermission
+
+from .authorization import user_has_permission
+
+
+class HasRolePermission(BasePermission):
+    """
+    Grants access when the user holds every code listed in the view's
+    `required_permissions` attribute. Superusers always pass.
+
+    مثال:
+        permission_classes = [IsAuthenticated, HasRolePermission]
+        required_permissions = ['PERM144']
+    """
+    message = 'You do not have permission to perform this action.'
+
+    def has_permission(self, request, view):
+        required = getattr(view, 'required_permissions', ())
+        return all(user_has_permission(request.user, code) for code in required)
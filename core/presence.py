@@ -0,0 +1,150 @@
+# core/presence.py
+
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .models import UserPresence
+
+logger = logging.getLogger(__name__)
+
+# المستخدم متصل ما دامت آخر نبضة (heartbeat) أحدث من هذه المدة (ثوان).
+# يجب أن تكون أطول من فترة النبضات في الواجهة
+PRESENCE_TTL = getattr(settings, 'PRESENCE_TTL', 60)
+
+# كل كم ثانية يُكتب last_seen المتراكم في جدول UserPresence (دفعة واحدة)
+PRESENCE_FLUSH_INTERVAL = getattr(settings, 'PRESENCE_FLUSH_INTERVAL', 60)
+
+# last_seen الذي لم يُكتب بعد في قاعدة البيانات: user_id -> (unix time, is_online)
+_pending = {}
+_pending_lock = threading.Lock()
+_flusher = None
+
+
+def _cache_key(user_id):
+    return f'presence:{user_id}'
+
+
+# --- التحديث ---
+
+def heartbeat(user_id):
+    """
+    Marks the user online for PRESENCE_TTL seconds. Called on websocket
+    connect, on every heartbeat and on the REST ping. One cache write; the
+    database only sees the batched last_seen flush.
+    """
+    now = time.time()
+    cache.set(_cache_key(user_id), now, PRESENCE_TTL)
+    _record(user_id, now, True)
+
+
+def mark_offline(user_id):
+    """
+    يحذف حالة الاتصال فوراً (قطع الاتصال أو طلب صريح).
+    إذا كان للمستخدم اتصال آخر مفتوح تعيده نبضته التالية متصلاً.
+    """
+    cache.delete(_cache_key(user_id))
+    _record(user_id, time.time(), False)
+
+
+def _record(user_id, seen_at, is_online):
+    with _pending_lock:
+        _pending[user_id] = (seen_at, is_online)
+    _start_flusher()
+
+
+def _start_flusher():
+    """
+    Starts, once per process, the daemon thread that writes the buffer every
+    PRESENCE_FLUSH_INTERVAL seconds, whether or not more pings arrive, and
+    registers a last flush for when the process exits.
+    """
+    global _flusher
+    if _flusher is not None:
+        return
+    with _pending_lock:
+        if _flusher is not None:
+            return
+        _flusher = threading.Thread(target=_flush_periodically, name='presence-flush', daemon=True)
+        _flusher.start()
+    atexit.register(_flush_at_exit)
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(PRESENCE_FLUSH_INTERVAL)
+        try:
+            flush_last_seen()
+        except Exception as e:
+            logger.error(f"فشل حفظ حالة الاتصال: {e}", exc_info=True)
+        finally:
+            # اتصال قاعدة البيانات الخاص بهذا الخيط لا يبقى مفتوحاً بين الدفعات
+            connection.close()
+
+
+def _flush_at_exit():
+    try:
+        flush_last_seen()
+    except Exception as e:
+        logger.error(f"فشل حفظ حالة الاتصال عند إيقاف العملية: {e}")
+
+
+def flush_last_seen():
+    """
+    Writes the buffered last_seen values to UserPresence: one bulk_update for
+    existing rows and one bulk_create for new ones. Returns the number of users.
+    """
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return 0
+
+    values = {
+        user_id: (datetime.fromtimestamp(seen_at, tz=dt_timezone.utc), is_online)
+        for user_id, (seen_at, is_online) in pending.items()
+    }
+    existing = list(UserPresence.objects.filter(user_id__in=values))
+    for presence in existing:
+        presence.last_seen, presence.is_online = values.pop(presence.user_id)
+    UserPresence.objects.bulk_update(existing, ['last_seen', 'is_online'])
+    UserPresence.objects.bulk_create([
+        UserPresence(user_id=user_id, last_seen=last_seen, is_online=is_online)
+        for user_id, (last_seen, is_online) in values.items()
+    ], ignore_conflicts=True)
+    return len(pending)
+
+
+# --- القراءة ---
+
+def online_user_ids(user_ids):
+    """مجموعة المتصلين من بين user_ids بقراءة واحدة من الـ cache."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return set()
+    found = cache.get_many([_cache_key(user_id) for user_id in user_ids])
+    return {user_id for user_id in user_ids if _cache_key(user_id) in found}
+
+
+def is_online(user_id):
+    return cache.get(_cache_key(user_id)) is not None
+
+
+def get_presence(user_id):
+    """(is_online, last_seen) للمستخدم؛ last_seen من الـ cache أو من آخر قيمة في الذاكرة أو قاعدة البيانات."""
+    seen_at = cache.get(_cache_key(user_id))
+    if seen_at is not None:
+        return True, datetime.fromtimestamp(seen_at, tz=dt_timezone.utc)
+
+    with _pending_lock:
+        pending = _pending.get(user_id)
+    if pending:
+        return False, datetime.fromtimestamp(pending[0], tz=dt_timezone.utc)
+    last_seen = UserPresence.objects.filter(user_id=user_id).values_list('last_seen', flat=True).first()
+    return False, last_seen
@@ -0,0 +1,316 @@
+# core/search.py
+
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+from .models import Client, SearchEntry, Task, Transaction
+
+# أقصى عدد من النتائج المرتبة التي يرجعها البحث
+SEARCH_MAX_RESULTS = getattr(settings, 'SEARCH_MAX_RESULTS', 1000)
+
+# أقصر كلمة يفهرسها MySQL FULLTEXT (innodb_ft_min_token_size). الكلمات الأقصر يُبحث عنها بـ LIKE
+SEARCH_MIN_TOKEN_LENGTH = getattr(settings, 'SEARCH_MIN_TOKEN_LENGTH', 3)
+
+# التشكيل (الفتحة، الضمة، الكسرة، الشدة، السكون...) والألف الخنجرية والتطويل
+_DIACRITICS_RE = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_LETTER_VARIANTS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي', 'ئ': 'ي',
+    'ؤ': 'و',
+    # الأرقام العربية والفارسية إلى أرقام لاتينية
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},
+})
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize_arabic(text):
+    """
+    توحيد النص للبحث: حذف التشكيل والتطويل، توحيد أشكال الهمزة والتاء المربوطة
+    والألف المقصورة، وتحويل الأرقام والحروف اللاتينية إلى شكل واحد.
+    """
+    if not text:
+        return ''
+    text = _DIACRITICS_RE.sub('', str(text))
+    return text.translate(_LETTER_VARIANTS).lower()
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(normalize_arabic(text))
+
+
+# --- النماذج القابلة للبحث ---
+
+def _transaction_text(transaction):
+    client_name = transaction.client.name_ar if transaction.client_id else None
+    return [transaction.short_code, transaction.long_code, transaction.title, client_name]
+
+
+def _client_text(client):
+    return [client.client_code, client.name_ar, client.phone_number, client.email, client.commercial_register]
+
+
+def _task_text(task):
+    return [task.title, task.description]
+
+
+# النموذج -> (دالة النص، العلاقات المطلوبة لبناء النص)
+SEARCHABLE_MODELS = {
+    Transaction: (_transaction_text, ('client',)),
+    Client: (_client_text, ()),
+    Task: (_task_text, ()),
+}
+
+
+def build_search_text(instance):
+    text_func, _ = SEARCHABLE_MODELS[type(instance)]
+    return ' '.join(tokenize(' '.join(str(part) for part in text_func(instance) if part)))
+
+
+# --- محركات البحث ---
+
+class MySQLFullTextBackend:
+    """يبحث في عمود النص الموحد عبر فهرس FULLTEXT في MySQL (BOOLEAN MODE)."""
+
+    def index(self, content_type_id, entries):
+        # الجدول نفسه هو الفهرس، ولا يوجد ما نحدثه في الذاكرة
+        pass
+
+    def remove(self, content_type_id, object_ids):
+        pass
+
+    def clear(self, content_type_id):
+        pass
+
+    def search(self, content_type_id, tokens, limit, candidates=None):
+        long_tokens = [token for token in tokens if len(token) >= SEARCH_MIN_TOKEN_LENGTH]
+        short_tokens = [token for token in tokens if len(token) < SEARCH_MIN_TOKEN_LENGTH]
+
+        queryset = SearchEntry.objects.filter(content_type_id=content_type_id)
+        if candidates is not None:
+            # تقييد النتائج بما يراه المستخدم داخل نفس الاستعلام (استعلام فرعي) قبل LIMIT
+            queryset = queryset.filter(object_id__in=candidates)
+        for token in short_tokens:
+            queryset = queryset.filter(text__contains=token)
+
+        if long_tokens:
+            # كل كلمة مطلوبة (+) مع مطابقة البادئة (*)
+            against = ' '.join(f'+{token}*' for token in long_tokens)
+            match = 'MATCH (text) AGAINST (%s IN BOOLEAN MODE)'
+            queryset = queryset.annotate(score=RawSQL(match, (against,))).extra(
+                where=[match], params=[against]
+            ).order_by('-score', '-object_id')
+        else:
+            queryset = queryset.order_by('-object_id')
+
+        return list(queryset.values_list('object_id', flat=True)[:limit])
+
+
+class InMemorySearchBackend:
+    """
+    Inverted index kept in process memory, for SQLite and tests.
+    Loaded from the SearchEntry table on first use and updated on every save.
+    Results are ranked with TF-IDF and query words match as prefixes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        # كلمة -> {(content_type_id, object_id): عدد مرات الظهور}
+        self._postings = defaultdict(dict)
+        # (content_type_id, object_id) -> الكلمات
+        self._documents = {}
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for content_type_id, object_id, text in SearchEntry.objects.values_list('content_type_id', 'object_id', 'text').iterator():
+                self._add((content_type_id, object_id), text.split())
+            self._loaded = True
+
+    def _add(self, key, tokens):
+        self._documents[key] = tokens
+        for token in tokens:
+            postings = self._postings[token]
+            postings[key] = postings.get(key, 0) + 1
+
+    def _discard(self, key):
+        for token in self._documents.pop(key, ()):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[token]
+
+    def index(self, content_type_id, entries):
+        if not self._loaded:
+            # سيُحمّل كل شيء من الجدول عند أول بحث
+            return
+        with self._lock:
+            for object_id, text in entries.items():
+                key = (content_type_id, object_id)
+                self._discard(key)
+                self._add(key, text.split())
+
+    def remove(self, content_type_id, object_ids):
+        if not self._loaded:
+            return
+        with self._lock:
+            for object_id in object_ids:
+                self._discard((content_type_id, object_id))
+
+    def clear(self, content_type_id):
+        if not self._loaded:
+            return
+        with self._lock:
+            for key in [key for key in self._documents if key[0] == content_type_id]:
+                self._discard(key)
+
+    def reset(self):
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._loaded = False
+
+    def search(self, content_type_id, tokens, limit, candidates=None):
+        self._ensure_loaded()
+        # المعرفات المسموح بها تُقرأ قبل القفل؛ الترتيب والقص يتمان عليها فقط
+        allowed = set(candidates) if candidates is not None else None
+        total = len(self._documents) or 1
+        scores = None
+        with self._lock:
+            for token in tokens:
+                token_scores = {}
+                for word, postings in self._postings.items():
+                    if not word.startswith(token):
+                        continue
+                    idf = math.log(1 + total / len(postings))
+                    for (doc_type_id, object_id), count in postings.items():
+                        if doc_type_id == content_type_id and (allowed is None or object_id in allowed):
+                            token_scores[object_id] = max(token_scores.get(object_id, 0), count * idf)
+                if scores is None:
+                    scores = token_scores
+                else:
+                    # كل كلمات البحث يجب أن تظهر في النتيجة
+                    scores = {object_id: score + token_scores[object_id] for object_id, score in scores.items() if object_id in token_scores}
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return [object_id for object_id, _ in ranked[:limit]]
+
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Returns the configured search backend (settings.SEARCH_BACKEND), defaulting
+    to MySQL FULLTEXT on MySQL and to the in-memory index elsewhere.
+    """
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'SEARCH_BACKEND', None)
+        if path is None:
+            path = 'core.search.MySQLFullTextBackend' if connection.vendor == 'mysql' else 'core.search.InMemorySearchBackend'
+        _backend = import_string(path)()
+    return _backend
+
+
+# --- تحديث الفهرس ---
+
+def index_objects(model, objects):
+    """يحدّث سجلات البحث لمجموعة من الكائنات باستعلامين (حذف ثم bulk_create)."""
+    objects = [obj for obj in objects if obj.pk is not None]
+    if not objects:
+        return
+    content_type = ContentType.objects.get_for_model(model)
+    entries = {obj.pk: build_search_text(obj) for obj in objects}
+
+    SearchEntry.objects.filter(content_type=content_type, object_id__in=list(entries)).delete()
+    SearchEntry.objects.bulk_create([
+        SearchEntry(content_type=content_type, object_id=object_id, text=text)
+        for object_id, text in entries.items()
+    ])
+    get_search_backend().index(content_type.id, entries)
+
+
+def remove_objects(model, object_ids):
+    object_ids = list(object_ids)
+    if not object_ids:
+        return
+    content_type = ContentType.objects.get_for_model(model)
+    SearchEntry.objects.filter(content_type=content_type, object_id__in=object_ids).delete()
+    get_search_backend().remove(content_type.id, object_ids)
+
+
+def rebuild_index(model, batch_size=1000):
+    """يعيد بناء فهرس البحث لنموذج كامل على دفعات. يرجع عدد السجلات المفهرسة."""
+    _, related = SEARCHABLE_MODELS[model]
+    queryset = model.objects.select_related(*related).order_by('pk')
+    content_type = ContentType.objects.get_for_model(model)
+    SearchEntry.objects.filter(content_type=content_type).delete()
+    get_search_backend().clear(content_type.id)
+
+    count = 0
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        index_objects(model, batch)
+        count += len(batch)
+        last_pk = batch[-1].pk
+    return count
+
+
+def search(model, query, limit=None, queryset=None):
+    """
+    يرجع معرفات الكائنات المطابقة مرتبة حسب الصلة (الأفضل أولاً).
+    إذا مُرر queryset تُرتب وتُقص فقط الكائنات الموجودة فيه (مثلاً المعاملات التي يراها المستخدم).
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    content_type = ContentType.objects.get_for_model(model)
+    candidates = queryset.order_by().values_list('pk', flat=True) if queryset is not None else None
+    return get_search_backend().search(content_type.id, tokens, limit or SEARCH_MAX_RESULTS, candidates)
+
+
+class ArabicSearchFilter(BaseFilterBackend):
+    """
+    يستبدل SearchFilter: يبحث في فهرس البحث بدلاً من LIKE '%term%' على الجداول،
+    ويرتب النتائج حسب الصلة.
+    """
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+
+        # الصلاحيات والفلاتر السابقة تُطبق قبل حد SEARCH_MAX_RESULTS، لا بعده
+        object_ids = search(queryset.model, query, queryset=queryset)
+        if not object_ids:
+            return queryset.none()
+
+        ranking = Case(
+            *[When(pk=object_id, then=Value(position)) for position, object_id in enumerate(object_ids)],
+            output_field=IntegerField(),
+        )
+        return queryset.filter(pk__in=object_ids).annotate(search_rank=ranking).order_by('search_rank')
@@ -0,0 +1,81 @@
+# core/sequences.py
+
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from .models import CodeSequence
+
+# عدد الأرقام التي تحجزها كل عملية (worker) دفعة واحدة. القيمة 1 تعني بدون حجز مسبق.
+# الحجز المسبق يقلل الضغط على صف العداد، لكنه قد يترك فجوات في الترقيم إذا توقفت العملية.
+CODE_SEQUENCE_BLOCK_SIZE = getattr(settings, 'CODE_SEQUENCE_BLOCK_SIZE', 1)
+
+
+def allocate(prefix, year, month=0, count=1):
+    """
+    Atomically reserves `count` consecutive numbers on the (prefix, year, month)
+    counter and returns the first one.
+
+    The UPDATE takes a row lock that is held until the surrounding transaction
+    commits, so concurrent workers can never receive the same number.
+    """
+    if count < 1:
+        raise ValueError("count must be at least 1")
+
+    lookup = {'prefix': prefix, 'year': year, 'month': month}
+    with transaction.atomic():
+        updated = CodeSequence.objects.filter(**lookup).update(last_value=F('last_value') + count)
+        if not updated:
+            # أول رقم لهذه الفترة: ننشئ صف العداد. إذا سبقتنا عملية أخرى نعود للتحديث.
+            try:
+                with transaction.atomic():
+                    CodeSequence.objects.create(last_value=count, **lookup)
+                return 1
+            except IntegrityError:
+                CodeSequence.objects.filter(**lookup).update(last_value=F('last_value') + count)
+
+        last_value = CodeSequence.objects.filter(**lookup).values_list('last_value', flat=True).get()
+    return last_value - count + 1
+
+
+class BlockAllocator:
+    """
+    Hands out numbers from blocks reserved per process, so only one in
+    `block_size` codes touches the counter row.
+    """
+
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    def next_value(self, prefix, year, month=0):
+        key = (prefix, year, month)
+        with self._lock:
+            next_number, last_number = self._blocks.get(key, (1, 0))
+            if next_number > last_number:
+                next_number = allocate(prefix, year, month, count=self.block_size)
+                last_number = next_number + self.block_size - 1
+            self._blocks[key] = (next_number + 1, last_number)
+        return next_number
+
+    def reset(self):
+        with self._lock:
+            self._blocks.clear()
+
+
+_block_allocator = BlockAllocator(CODE_SEQUENCE_BLOCK_SIZE)
+
+
+def next_value(prefix, year, month=0):
+    """
+    يرجع الرقم التسلسلي التالي لـ (البادئة، السنة، الشهر).
+
+    داخل معاملة قاعدة بيانات مفتوحة نحجز رقمًا واحدًا فقط، لأن التراجع عن
+    المعاملة سيلغي حجز الكتلة بينما تبقى أرقامها في ذاكرة العملية فتتكرر.
+    """
+    if CODE_SEQUENCE_BLOCK_SIZE > 1 and not connection.in_atomic_block:
+        return _block_allocator.next_value(prefix, year, month)
+    return allocate(prefix, year, month)
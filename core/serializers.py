@@ -1,10 +1,16 @@
 # core/serializers.py
 
 from rest_framework import serializers
-from .models import Account, Attendance, Budget, BudgetItem, ChatMessage, ChatRoom, Client, CompetentAuthority, GeneratedReport, JournalEntry, JournalEntryItem, LeaveRequest, CustomUser, Department, Document, DocumentType, Invoice, InvoiceItem, LandBoundary, MessageReadStatus, Notification, Payment, PermissionRequest, Project, ReportTemplate, Role, Permission, Task, Transaction, TransactionDistribution, TransactionDocument, TransactionMainCategory, TransactionSubCategory
+from .models import Account, Attendance, Budget, BudgetItem, ChatMessage, ChatRoom, Client, CompetentAuthority, GeneratedReport, JournalEntry, JournalEntryItem, LeaveRequest, CustomUser, Department, Document, DocumentType, Invoice, InvoiceItem, LandBoundary, Notification, Payment, PermissionRequest, Project, ReportTemplate, RequiredDocumentRule, Role, Permission, Task, Transaction, TransactionDistribution, TransactionDocument, TransactionMainCategory, TransactionSubCategory, UploadSession
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.db import transaction
+from .authorization import get_role_permission_codes, get_role_permissions_version
+from .distribution import AUTO_DISTRIBUTION_MAX_BATCH
+from .chat import unread_count
+from .uploads import CHUNKED_UPLOAD_CHUNK_SIZE, CHUNKED_UPLOAD_MAX_SIZE
+from . import presence
 from datetime import timedelta
+from django.urls import reverse
 
 class PermissionSerializer(serializers.ModelSerializer):
     class Meta:
@@ -53,14 +59,22 @@ class DocumentTypeSerializer(serializers.ModelSerializer):
         model = DocumentType
         fields = ['code', 'name_ar']
 
+def protected_download_url(request, view_name, obj):
+    """رابط التنزيل المحمي (core.downloads)، يعمل في الإنتاج بعكس روابط MEDIA_URL."""
+    if request is None:
+        return None
+    return request.build_absolute_uri(reverse(view_name, args=[obj.pk]))
+
 class DocumentSerializer(serializers.ModelSerializer):
     uploaded_by_name = serializers.CharField(source='uploaded_by.username', read_only=True)
     file_url = serializers.SerializerMethodField()
+    # رابط التنزيل المحمي (يعمل في الإنتاج، مع Range و ETag)
+    download_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Document
-        fields = ['id', 'file', 'file_url', 'description', 'uploaded_at', 'uploaded_by_name', 'transaction_document']
-        read_only_fields = ['id', 'uploaded_at', 'uploaded_by_name', 'file_url']
+        fields = ['id', 'file', 'file_url', 'download_url', 'description', 'uploaded_at', 'uploaded_by_name', 'transaction_document']
+        read_only_fields = ['id', 'uploaded_at', 'uploaded_by_name', 'file_url', 'download_url']
 
     def get_file_url(self, obj):
         request = self.context.get('request')
@@ -72,6 +86,42 @@ class DocumentSerializer(serializers.ModelSerializer):
         # إذا لم يتحقق الشرط، أرجع قيمة فارغة بدلاً من التسبب في انهيار الخادم
         return None
 
+    def get_download_url(self, obj):
+        return protected_download_url(self.context.get('request'), 'document-download', obj)
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """بدء رفع ملف على أجزاء وعرض تقدمه"""
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'transaction', 'transaction_document', 'filename', 'description', 'total_size',
+                  'expected_sha256', 'received_bytes', 'status', 'sha256', 'document', 'chunk_size', 'created_at']
+        read_only_fields = ['id', 'received_bytes', 'status', 'sha256', 'document', 'chunk_size', 'created_at']
+        extra_kwargs = {
+            'transaction': {'required': False},
+            'total_size': {'min_value': 1, 'max_value': CHUNKED_UPLOAD_MAX_SIZE},
+        }
+
+    def get_chunk_size(self, obj):
+        return CHUNKED_UPLOAD_CHUNK_SIZE
+
+    def validate_expected_sha256(self, value):
+        value = (value or '').lower()
+        if value and (len(value) != 64 or any(c not in '0123456789abcdef' for c in value)):
+            raise serializers.ValidationError("SHA-256 يجب أن يكون 64 حرفاً ست عشرياً.")
+        return value
+
+    def validate(self, attrs):
+        # كما في الرفع العادي: بند قائمة المتطلبات يحدد المعاملة
+        transaction_document = attrs.get('transaction_document')
+        if transaction_document:
+            attrs['transaction'] = transaction_document.transaction
+        elif not attrs.get('transaction'):
+            raise serializers.ValidationError("A transaction must be specified to upload a document.")
+        return attrs
+
+
 # class TransactionDocumentSerializer(serializers.ModelSerializer):
 #     document_type = DocumentTypeSerializer(read_only=True)
 #     # --- [هذا هو التعديل] ---
@@ -140,6 +190,9 @@ class TransactionSerializer(serializers.ModelSerializer):
         }
 
     def get_assignment_date(self, obj):
+        # القيمة محسوبة مسبقًا في get_queryset عبر annotate
+        if hasattr(obj, 'last_assigned_at'):
+            return obj.last_assigned_at or obj.created_at
         last_distribution = obj.distributions.order_by('-assigned_at').first()
         if last_distribution:
             return last_distribution.assigned_at
@@ -167,6 +220,15 @@ class TransactionSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
     # === END: الدالة المصححة ===
 
+class TransactionSummarySerializer(serializers.ModelSerializer):
+    """عرض مختصر للمعاملة (لوحة التحكم) بدون قائمة المستندات والملفات."""
+    client_name = serializers.CharField(source='client.name_ar', read_only=True, allow_null=True)
+    assigned_to_name = serializers.CharField(source='assigned_to.username', read_only=True, allow_null=True)
+
+    class Meta:
+        model = Transaction
+        fields = ['id', 'short_code', 'title', 'status', 'client', 'client_name', 'assigned_to', 'assigned_to_name', 'created_at', 'updated_at']
+
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
@@ -183,11 +245,10 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         # === END: الإضافة المهمة هنا ===
 
         # Get permissions from the user's assigned role
-        if hasattr(user, 'role') and user.role and hasattr(user.role, 'permissions'):
-            permissions = user.role.permissions.all().values_list('code', flat=True)
-            token['permissions'] = list(permissions)
-        else:
-            token['permissions'] = []
+        # رقم الإصدار يسمح بالتحقق من الصلاحيات من التوكن مباشرة دون الرجوع لقاعدة البيانات
+        token['role_id'] = user.role_id
+        token['perm_version'] = get_role_permissions_version(user.role_id)
+        token['permissions'] = sorted(get_role_permission_codes(user.role_id))
             
         # Add role and department info
         if hasattr(user, 'role') and user.role:
@@ -291,10 +352,15 @@ class StaffSerializer(serializers.ModelSerializer):
         user.save()
         return user
 
+    # القيم محسوبة مسبقًا في استعلام الموظفين (annotate_active_counts)، مع حساب احتياطي
     def get_active_transactions(self, obj):
+        if hasattr(obj, 'active_transactions_count'):
+            return obj.active_transactions_count
         return obj.transactions.exclude(status__in=['completed', 'cancelled']).count()
 
     def get_active_tasks(self, obj):
+        if hasattr(obj, 'active_tasks_count'):
+            return obj.active_tasks_count
         return obj.tasks.exclude(status__in=['approved', 'cancelled']).count()
 
 class DepartmentSerializer(serializers.ModelSerializer):
@@ -326,6 +392,10 @@ class InvoiceSerializer(serializers.ModelSerializer):
         ]
         # الحقول التي يتم حسابها تلقائيًا أو جلبها من نماذج أخرى يجب أن تكون للقراءة فقط
         read_only_fields = ['id', 'total_amount', 'client_name', 'transaction_code', 'qr_code_image']
+        # رقم الفاتورة يُولد تلقائيًا من العداد التسلسلي إذا لم يُرسل
+        extra_kwargs = {
+            'invoice_number': {'required': False}
+        }
 
 class RoleSerializer(serializers.ModelSerializer):
     # عند عرض الأدوار، سنعرض التفاصيل الكاملة لكل صلاحية
@@ -366,6 +436,12 @@ class CompetentAuthoritySerializer(serializers.ModelSerializer):
         model = CompetentAuthority
         fields = ['id', 'name', 'code']
 
+class RequiredDocumentRuleSerializer(serializers.ModelSerializer):
+    document_type_name = serializers.CharField(source='document_type.name_ar', read_only=True)
+    class Meta:
+        model = RequiredDocumentRule
+        fields = ['id', 'sub_category', 'competent_authority', 'document_type', 'document_type_name', 'order']
+
 class PaymentSerializer(serializers.ModelSerializer):
     created_by_name = serializers.CharField(source='created_by.username', read_only=True)
     class Meta:
@@ -531,10 +607,14 @@ class ReportTemplateSerializer(serializers.ModelSerializer):
 class GeneratedReportSerializer(serializers.ModelSerializer):
     template_name = serializers.CharField(source='template.name', read_only=True)
     created_by_name = serializers.CharField(source='created_by.get_full_name', read_only=True)
+    download_url = serializers.SerializerMethodField()
 
     class Meta:
         model = GeneratedReport
-        fields = ['id', 'transaction', 'template', 'template_name', 'generated_file', 'created_by', 'created_by_name', 'created_at']
+        fields = ['id', 'transaction', 'template', 'template_name', 'generated_file', 'download_url', 'created_by', 'created_by_name', 'created_at']
+
+    def get_download_url(self, obj):
+        return protected_download_url(self.context.get('request'), 'report-download', obj)
 
 class NotificationSerializer(serializers.ModelSerializer):
     """
@@ -558,6 +638,18 @@ class TransactionDistributionSerializer(serializers.ModelSerializer):
         read_only_fields = ['assigned_from', 'assigned_at', 'responded_at']
 
 
+class AutoDistributeSerializer(serializers.Serializer):
+    """
+    مدخلات التوزيع التلقائي: قائمة معاملات محددة، أو أقدم المعاملات غير المسندة حتى limit.
+    """
+    transactions = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_empty=False, max_length=AUTO_DISTRIBUTION_MAX_BATCH
+    )
+    department = serializers.PrimaryKeyRelatedField(queryset=Department.objects.all(), required=False, allow_null=True)
+    limit = serializers.IntegerField(required=False, default=500, min_value=1, max_value=AUTO_DISTRIBUTION_MAX_BATCH)
+    manager_notes = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
 class ChatUserSerializer(serializers.ModelSerializer):
     """Serializer مختصر لعرض بيانات المستخدم في المحادثات"""
     department_name = serializers.CharField(source='department.name', read_only=True)
@@ -568,10 +660,27 @@ class ChatUserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'full_name_ar', 'department', 'department_name', 'is_online']
     
     def get_is_online(self, obj):
-        try:
-            return obj.presence.is_online
-        except:
-            return False
+        # القوائم تمرر المتصلين مسبقاً في الـ context (قراءة واحدة من الـ cache)
+        online_user_ids = self.context.get('online_user_ids')
+        if online_user_ids is not None:
+            return obj.id in online_user_ids
+        return presence.is_online(obj.id)
+
+class ChatSenderSerializer(serializers.ModelSerializer):
+    """عرض مختصر للمرسل في سجل الرسائل"""
+    class Meta:
+        model = CustomUser
+        fields = ['id', 'username', 'full_name_ar']
+
+
+class ChatMessageListSerializer(serializers.ModelSerializer):
+    """الرسالة في سجل المحادثة (REST و WebSocket) مع مرسل مختصر"""
+    sender = ChatSenderSerializer(read_only=True)
+
+    class Meta:
+        model = ChatMessage
+        fields = ['id', 'room', 'sender', 'content', 'message_type', 'created_at']
+
 
 class ChatMessageSerializer(serializers.ModelSerializer):
     sender = UserSerializer(read_only=True)  # نعرض معلومات المرسل فقط، ولا نسمح بإرسالها من الـ frontend
@@ -598,15 +707,7 @@ class ChatMessageSerializer(serializers.ModelSerializer):
             sender=request.user
         )
 
-        # إنشاء حالات القراءة للمشاركين الآخرين
-        participants = room.participants.exclude(id=request.user.id)
-        for participant in participants:
-            MessageReadStatus.objects.get_or_create(
-                message=message,
-                user=participant,
-                defaults={'is_read': False}
-            )
-
+        # حالات القراءة والإشعارات تُنشأ دفعة واحدة في ChatMessageViewSet.perform_create (core.chat)
         return message
 
 
@@ -615,27 +716,29 @@ class ChatRoomSerializer(serializers.ModelSerializer):
     participants = ChatUserSerializer(many=True, read_only=True)
     last_message = serializers.SerializerMethodField()
     unread_count = serializers.SerializerMethodField()
-    participants_count = serializers.IntegerField(source='get_participants_count', read_only=True)
+    participants_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = ChatRoom
         fields = [
             'id', 'name', 'room_type', 'participants', 'created_by', 'created_at',
-            'is_active', 'department', 'last_message', 'unread_count', 'participants_count'
+            'is_active', 'department', 'last_message', 'last_message_preview', 'last_message_at',
+            'unread_count', 'participants_count'
         ]
         read_only_fields = ['created_by', 'created_at']
     
     def get_last_message(self, obj):
-        last_msg = obj.messages.last()
+        # آخر رسالة محفوظة في ملخص الغرفة (select_related في ChatRoomViewSet)
+        last_msg = obj.last_message
         return ChatMessageSerializer(last_msg, context=self.context).data if last_msg else None
     
     def get_unread_count(self, obj):
+        # القيمة محسوبة مسبقًا في get_queryset عبر annotate
+        if hasattr(obj, 'unread_count'):
+            return obj.unread_count
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.messages.filter(
-                read_status__user=request.user,
-                read_status__is_read=False
-            ).exclude(sender=request.user).count()
+            return unread_count(obj.id, request.user.id)
         return 0
 
 class CreateChatRoomSerializer(serializers.ModelSerializer):
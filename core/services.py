@@ -2,19 +2,33 @@
 
 from django.contrib.contenttypes.models import ContentType
 from .models import Notification
-from django.conf import settings
-import pusher
+from django.db import connections, router, transaction as db_transaction
+from .outbox import enqueue_events
 import logging
 
 # إعداد logging لتتبع الأخطاء
 logger = logging.getLogger(__name__)
 
+
+def _notification_events(notifications):
+    """يبني أحداث Pusher (قناة المستخدم الخاصة) لقائمة إشعارات محفوظة."""
+    from .serializers import NotificationSerializer
+    return [
+        {
+            'channel': f'private-user-{notification.user_id}',
+            'name': 'new_notification',
+            'data': {'notification': data},
+            'notification': notification,
+        }
+        for notification, data in zip(notifications, NotificationSerializer(notifications, many=True).data)
+    ]
+
+
 def create_and_send_notification(user, message, event_type, link=None, related_object=None):
     """
     دالة مركزية لإنشاء إشعار وإرساله عبر Pusher.
+    الإشعار وحدث الإرسال يُحفظان معاً، ويُرسل الحدث في الخلفية (core.outbox).
     """
-    print(f"--- بدء إنشاء إشعار للمستخدم: {user.username} ---")
-    
     try:
         # 1. إنشاء الإشعار في قاعدة البيانات
         notification_data = {
@@ -27,35 +41,37 @@ def create_and_send_notification(user, message, event_type, link=None, related_o
             notification_data['content_type'] = ContentType.objects.get_for_model(related_object)
             notification_data['object_id'] = related_object.pk
 
-        notification = Notification.objects.create(**notification_data)
-        print(f"تم إنشاء الإشعار بنجاح في قاعدة البيانات (ID: {notification.id})")
-
-        # 2. تهيئة Pusher
-        pusher_client = pusher.Pusher(
-            app_id=settings.PUSHER_APP_ID,
-            key=settings.PUSHER_KEY,
-            secret=settings.PUSHER_SECRET,
-            cluster=settings.PUSHER_CLUSTER,
-            ssl=True
-        )
-
-        # 3. تجهيز البيانات للإرسال
-        from .serializers import NotificationSerializer
-        serializer = NotificationSerializer(notification)
-        channel_name = f'private-user-{user.id}'
-        event_name = 'new_notification'
-        
-        print(f"سيتم إرسال الإشعار إلى القناة: {channel_name} بالحدث: {event_name}")
-        print(f"بيانات الإشعار: {serializer.data}")
-
-        # 4. إرسال الإشعار عبر Pusher
-        pusher_client.trigger(channel_name, event_name, {'notification': serializer.data})
-        
-        print(f"--- اكتمل إرسال الإشعار بنجاح لـ {user.username} ---")
+        with db_transaction.atomic():
+            notification = Notification.objects.create(**notification_data)
+            # 2. إضافة الحدث إلى صندوق الإرسال
+            enqueue_events(_notification_events([notification]))
         return notification
 
     except Exception as e:
         # استخدام logging لتسجيل الأخطاء بشكل أفضل
-        logger.error(f"حدث خطأ أثناء إنشاء أو إرسال الإشعار للمستخدم {user.username}: {e}", exc_info=True)
-        print(f"!!! خطأ فادح أثناء إرسال الإشعار: {e} !!!")
-        return None
\ No newline at end of file
+        logger.error(f"حدث خطأ أثناء إنشاء الإشعار للمستخدم {user.username}: {e}", exc_info=True)
+        return None
+
+
+def send_bulk_notifications(notifications):
+    """
+    Saves a list of unsaved Notification objects with one bulk_create and
+    queues their Pusher events in the outbox with a second one. Databases that
+    do not return primary keys from a bulk insert (MySQL) save the notifications
+    one by one instead, so every outbox row points at its own notification.
+    """
+    if not notifications:
+        return []
+
+    using = router.db_for_write(Notification)
+    with db_transaction.atomic(using=using):
+        if connections[using].features.can_return_rows_from_bulk_insert:
+            created = Notification.objects.using(using).bulk_create(notifications)
+        else:
+            # لا يمكن مطابقة المفاتيح بالمحتوى: إشعاران متطابقان أو object_id فارغ يختلطان
+            for notification in notifications:
+                notification.save(using=using)
+            created = list(notifications)
+
+        enqueue_events(_notification_events(created))
+    return created
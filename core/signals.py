@@ -1,17 +1,14 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save, m2m_changed
+from django.db import transaction
 from django.dispatch import receiver
-from django.conf import settings
-import pusher
-from .models import Task, Notification
-
-# تهيئة عميل Pusher
-pusher_client = pusher.Pusher(
-  app_id=settings.PUSHER_APP_ID,
-  key=settings.PUSHER_KEY,
-  secret=settings.PUSHER_SECRET,
-  cluster=settings.PUSHER_CLUSTER,
-  ssl=True
-)
+from .models import Task, Notification, Role, CustomUser, RequiredDocumentRule, Transaction, Client, ChatRoom, ChatReadCursor, ChatMessage, Document
+from .authorization import bump_role_permissions_version, invalidate_role_permissions, invalidate_user_permissions
+from .checklists import invalidate_required_document_rules
+from .search import index_objects, remove_objects
+from .counters import adjust_transaction_counters, reassign_counters
+from .outbox import enqueue_event
+from .storage import release_files, release_replaced_files
+from .chat import create_read_cursors, record_last_message, refresh_participant_counts, revoke_room_access
 
 @receiver(post_save, sender=Task)
 def create_task_notification(sender, instance, created, **kwargs):
@@ -28,16 +25,176 @@ def create_task_notification(sender, instance, created, **kwargs):
             link=link
         )
 
-        # 2. إرسال الإشعار الفوري عبر Pusher
-        channel_name = f'private-user-{user_to_notify.id}'
-        event_name = 'new_notification'
-        
-        pusher_client.trigger(
-            channel_name, 
-            event_name, 
+        # 2. إضافة الحدث الفوري إلى صندوق الإرسال (يُرسل عبر Pusher في الخلفية)
+        enqueue_event(
+            f'private-user-{user_to_notify.id}',
+            'new_notification',
             {
                 'id': notification.id,
                 'message': message,
                 'link': link
-            }
-        )
\ No newline at end of file
+            },
+            notification=notification,
+        )
+
+
+# ===============================================
+# إبطال الصلاحيات المخزنة مؤقتًا
+# ===============================================
+@receiver(m2m_changed, sender=Role.permissions.through)
+def bump_role_permissions_on_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # permission.role_set.clear() لا يرسل الأدوار المتأثرة، لذلك نحفظها قبل الحذف
+        instance._cleared_role_ids = list(instance.role_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        # role.permissions.add/remove/clear
+        bump_role_permissions_version([instance.pk])
+    elif action == 'post_clear':
+        bump_role_permissions_version(instance.__dict__.pop('_cleared_role_ids', []))
+    else:
+        # permission.role_set.add/remove
+        bump_role_permissions_version(pk_set or [])
+
+
+@receiver(post_delete, sender=Role)
+def invalidate_deleted_role_permissions(sender, instance, **kwargs):
+    invalidate_role_permissions([instance.pk])
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_user_permissions_on_save(sender, instance, **kwargs):
+    # قد يكون الدور قد تغير، لذلك نحذف الصلاحيات المخزنة على كائن المستخدم
+    invalidate_user_permissions(instance)
+
+
+@receiver(post_save, sender=RequiredDocumentRule)
+@receiver(post_delete, sender=RequiredDocumentRule)
+def required_document_rules_changed(sender, **kwargs):
+    # أي تعديل على قواعد المستندات المطلوبة يلغي النسخة المخزنة في كل العمليات.
+    # الإلغاء بعد الحفظ: قبله قد تعيد عملية أخرى تحميل القواعد القديمة وتخزنها تحت الإصدار الجديد
+    transaction.on_commit(invalidate_required_document_rules)
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Task)
+def update_search_index(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    index_objects(sender, [instance])
+
+    if sender is Client and not created:
+        # اسم العميل جزء من نص البحث لمعاملاته، لذلك نعيد فهرستها على دفعات
+        transactions = instance.transactions.select_related('client').order_by('pk')
+        last_pk = 0
+        while True:
+            batch = list(transactions.filter(pk__gt=last_pk)[:1000])
+            if not batch:
+                break
+            index_objects(Transaction, batch)
+            last_pk = batch[-1].pk
+
+
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Task)
+def remove_from_search_index(sender, instance, **kwargs):
+    remove_objects(sender, [instance.pk])
+
+
+@receiver(pre_delete, sender=Transaction)
+def lock_deleted_transaction_state(sender, instance, **kwargs):
+    # الحذف يعمل داخل معاملة: نقفل الصف ونقرأ حالته الفعلية بدلاً من النسخة المحملة
+    instance._deleted_state = Transaction.objects.select_for_update().filter(pk=instance.pk).values_list(
+        'status', 'assigned_to_id'
+    ).first()
+
+
+@receiver(post_delete, sender=Transaction)
+def decrement_transaction_counters(sender, instance, **kwargs):
+    state = getattr(instance, '_deleted_state', None)
+    if state is not None:
+        adjust_transaction_counters({state: -1})
+
+
+@receiver(pre_delete, sender=CustomUser)
+def move_counters_of_deleted_user(sender, instance, **kwargs):
+    # معاملات الموظف ستصبح غير مسندة (SET NULL) بدون استدعاء save
+    reassign_counters(instance.pk)
+
+
+# ===============================================
+# مؤشرات القراءة وملخص الغرف عند تغيير المشاركين أو إضافة رسالة
+# ===============================================
+@receiver(m2m_changed, sender=ChatRoom.participants.through)
+def sync_chat_participants(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # user.chat_rooms.clear() لا يرسل الغرف المتأثرة، لذلك نحفظها قبل الحذف
+        instance._cleared_room_ids = list(instance.chat_rooms.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        # room.participants.add/remove/clear
+        room_ids = [instance.pk]
+        if action == 'post_add':
+            create_read_cursors(instance.pk, pk_set or [])
+        elif action == 'post_remove':
+            ChatReadCursor.objects.filter(room_id=instance.pk, user_id__in=pk_set or []).delete()
+            revoke_room_access(instance.pk, pk_set or [])
+        else:
+            ChatReadCursor.objects.filter(room_id=instance.pk).delete()
+            revoke_room_access(instance.pk)
+    else:
+        # user.chat_rooms.add/remove/clear
+        room_ids = instance.__dict__.pop('_cleared_room_ids', []) if action == 'post_clear' else list(pk_set or [])
+        if action == 'post_add':
+            for room_id in room_ids:
+                create_read_cursors(room_id, [instance.pk])
+        else:
+            ChatReadCursor.objects.filter(user_id=instance.pk, room_id__in=room_ids).delete()
+            for room_id in room_ids:
+                revoke_room_access(room_id, [instance.pk])
+
+    refresh_participant_counts(room_ids)
+
+
+@receiver(post_delete, sender=ChatRoom)
+def close_deleted_room_connections(sender, instance, **kwargs):
+    revoke_room_access(instance.pk)
+
+
+@receiver(post_save, sender=ChatMessage)
+def update_room_summary(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record_last_message(instance)
+
+
+# ===============================================
+# تحرير مراجع الملفات (core.storage) عند حذف المستندات والرسائل أو استبدال ملفاتها
+# ===============================================
+@receiver(pre_save, sender=Document)
+def release_replaced_document_files(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        release_replaced_files(instance, ['file', 'stamped_file'], update_fields)
+
+
+@receiver(pre_save, sender=ChatMessage)
+def release_replaced_chat_message_file(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        release_replaced_files(instance, ['file'], update_fields)
+
+
+@receiver(post_delete, sender=Document)
+def release_document_files(sender, instance, **kwargs):
+    release_files(instance.file, instance.stamped_file)
+
+
+@receiver(post_delete, sender=ChatMessage)
+def release_chat_message_file(sender, instance, **kwargs):
+    release_files(instance.file)
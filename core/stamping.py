@@ -0,0 +1,352 @@
+# core/stamping.py
+
+import io
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import connections, transaction
+from django.utils import timezone
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from .models import Document
+
+logger = logging.getLogger(__name__)
+
+STAMP_IMAGE_PATH = Path(__file__).resolve().parent / 'assets' / 'office_stamp.png'
+
+# عرض الختم على الصفحة وبعده عن الحافة اليمنى والسفلى (نقاط PDF)
+STAMP_WIDTH = getattr(settings, 'STAMP_WIDTH', 110)
+STAMP_MARGIN = getattr(settings, 'STAMP_MARGIN', 36)
+
+# عدد العمليات في وضع الدفعات (None = عدد المعالجات)
+STAMPING_WORKERS = getattr(settings, 'STAMPING_WORKERS', None)
+
+# مدة بقاء حالة آخر عملية ختم دفعات، وأقصى مدة لقفل المعاملة إذا توقفت العملية قبل تحريره
+STAMPING_STATUS_TIMEOUT = getattr(settings, 'STAMPING_STATUS_TIMEOUT', 24 * 3600)
+STAMPING_LOCK_TIMEOUT = getattr(settings, 'STAMPING_LOCK_TIMEOUT', 3600)
+
+# حجم الملف المختوم الذي يبقى في الذاكرة قبل الكتابة إلى ملف مؤقت على القرص
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+# --- طبقة الختم ---
+
+@dataclass(frozen=True)
+class Overlay:
+    """محتوى الختم الجاهز لمقاس صفحة: أوامر الرسم (غير مضغوطة) وصورة الختم كـ XObject."""
+    content: bytes
+    xobjects: DictionaryObject
+
+
+# صورة الختم وطبقة PDF جاهزة لكل مقاس صفحة، مرة واحدة لكل عملية
+_stamp_image = None
+_overlays = {}
+_overlay_lock = threading.Lock()
+
+
+# تحويل إحداثيات العرض (بعد /Rotate) إلى إحداثيات الصفحة: (a, b, c, d) لكل دوران
+_ROTATION_MATRICES = {0: (1, 0, 0, 1), 90: (0, 1, -1, 0), 180: (-1, 0, 0, -1), 270: (0, -1, 1, 0)}
+
+
+def _render_overlay(left, bottom, width, height, rotation):
+    global _stamp_image
+    if _stamp_image is None:
+        _stamp_image = ImageReader(str(STAMP_IMAGE_PATH))
+    image_width, image_height = _stamp_image.getSize()
+    stamp_height = STAMP_WIDTH * image_height / image_width
+
+    # الصفحة المدارة تُعرض بأبعاد معكوسة؛ نرسم في إحداثيات العرض حتى يظهر الختم
+    # مستقيماً في أسفل يمين الصفحة كما يراها المستخدم، بدون تعديل محتوى الصفحة نفسها
+    display_width = height if rotation in (90, 270) else width
+    a, b, c, d = _ROTATION_MATRICES[rotation]
+    e = left + (width if rotation in (90, 180) else 0)
+    f = bottom + (height if rotation in (180, 270) else 0)
+
+    buffer = io.BytesIO()
+    # الطبقة تُضاف بدون تحويل، لذلك نرسم بإحداثيات الصفحة نفسها (قد لا يبدأ mediabox من الصفر)
+    pdf = canvas.Canvas(buffer, pagesize=(left + width, bottom + height))
+    pdf.transform(a, b, c, d, e, f)
+    pdf.drawImage(
+        _stamp_image, display_width - STAMP_WIDTH - STAMP_MARGIN, STAMP_MARGIN,
+        width=STAMP_WIDTH, height=stamp_height, mask='auto',
+    )
+    pdf.showPage()
+    pdf.save()
+    buffer.seek(0)
+    page = PdfReader(buffer).pages[0]
+    return Overlay(
+        content=page.get_contents().get_data(),
+        xobjects=page['/Resources'].get_object()['/XObject'].get_object(),
+    )
+
+
+def get_overlay(box, rotation=0):
+    """
+    Returns the stamp overlay for a page box and rotation. The PNG is decoded
+    once and each size (A4, A3, ...) is rendered once per process, then
+    reused for every page of every document.
+    """
+    key = tuple(round(float(value), 1) for value in (box.left, box.bottom, box.width, box.height)) + (rotation % 360,)
+    overlay = _overlays.get(key)
+    if overlay is None:
+        with _overlay_lock:
+            overlay = _overlays.get(key)
+            if overlay is None:
+                overlay = _overlays[key] = _render_overlay(*key)
+    return overlay
+
+
+def _stream(writer, data):
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    return writer._add_object(stream)
+
+
+class _OverlayWriter:
+    """
+    يضيف الختم إلى صفحات PdfWriter بدون تحليل محتوى الصفحة: يُحاط المحتوى الأصلي
+    بـ q/Q ويُلحق محتوى الختم كتدفق إضافي. التدفقات وصورة الختم تُكتب مرة واحدة
+    في الملف وتشير إليها كل الصفحات.
+    """
+    def __init__(self, writer):
+        self.writer = writer
+        self.save_state = _stream(writer, b"q\n")
+        self.parts = {}
+
+    def _parts(self, overlay):
+        parts = self.parts.get(id(overlay))
+        if parts is None:
+            parts = self.parts[id(overlay)] = (
+                _stream(self.writer, b"Q\n" + overlay.content),
+                overlay.xobjects.clone(self.writer),
+            )
+        return parts
+
+    def stamp(self, page, overlay):
+        stamp_content, stamp_xobjects = self._parts(overlay)
+
+        # الموارد قد تكون مشتركة بين الصفحات؛ إضافة الصورة إليها أكثر من مرة لا تغير شيئاً
+        if '/Resources' not in page:
+            page[NameObject('/Resources')] = DictionaryObject()
+        resources = page['/Resources'].get_object()
+        if '/XObject' not in resources:
+            resources[NameObject('/XObject')] = DictionaryObject()
+        resources['/XObject'].get_object().update(stamp_xobjects)
+
+        contents = page.get('/Contents')
+        if contents is None:
+            original = []
+        elif isinstance(contents.get_object(), ArrayObject):
+            original = list(contents.get_object())
+        else:
+            original = [contents]
+        page[NameObject('/Contents')] = ArrayObject([self.save_state, *original, stamp_content])
+
+
+# --- الختم ---
+
+def stamp_pdf(source, destination):
+    """
+    Stamps every page of the PDF in source (path or binary file) and writes
+    the result to destination. Pages are read lazily from the file and the
+    cached overlay is appended to each one without re-parsing its content
+    stream. Returns the number of pages.
+    """
+    reader = PdfReader(source)
+    writer = PdfWriter()
+    overlay_writer = _OverlayWriter(writer)
+    for page in reader.pages:
+        overlay = get_overlay(page.mediabox, page.rotation)
+        overlay_writer.stamp(writer.add_page(page), overlay)
+    writer.write(destination)
+    return len(reader.pages)
+
+
+def _stamped_name(document):
+    return f"stamped_{os.path.basename(document.file.name)}"
+
+
+def stamp_document(document):
+    """
+    يختم ملف مستند واحد ويحفظه في stamped_file.
+    ترجع (success, message) كما يتوقعها TransactionDocumentViewSet.stamp.
+    """
+    try:
+        with document.file.open('rb') as source, \
+                tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as output:
+            pages = stamp_pdf(source, output)
+            output.seek(0)
+            document.stamped_file.save(_stamped_name(document), File(output), save=False)
+        document.is_stamped = True
+        document.save(update_fields=['stamped_file', 'is_stamped'])
+        return True, f"تم ختم {pages} صفحة"
+    except Exception as e:
+        logger.error(f"فشل ختم المستند {document.pk}: {e}", exc_info=True)
+        return False, str(e)
+
+
+# --- وضع الدفعات ---
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def create_process_pool(max_workers=None):
+    """
+    Returns a process pool whose workers do not inherit the web process.
+    The default fork start method copies a daphne process that has running
+    threads (the event loop, the sync_to_async pool) and open DB
+    connections, which can deadlock a worker or break the parent's
+    connections. Workers are started from a forkserver (spawn where that is
+    unavailable) and set up Django before running _stamp_file.
+    """
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context(method), initializer=django.setup,
+    )
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = create_process_pool(STAMPING_WORKERS)
+    return _executor
+
+
+def _stamp_file(source_path, destination_path):
+    # يعمل في عملية منفصلة: ملفات فقط، بدون قاعدة البيانات
+    with open(destination_path, 'wb') as destination:
+        return stamp_pdf(source_path, destination)
+
+
+def _local_path(field):
+    try:
+        return field.path
+    except NotImplementedError:
+        # تخزين بعيد (S3 وغيره) بدون مسار محلي
+        return None
+
+
+def stamp_transaction_documents(transaction_id):
+    """
+    Stamps every uploaded, not yet stamped PDF of a transaction.
+
+    Files on local storage are stamped in parallel in a process pool, so
+    the CPU-bound merge uses every core instead of one; other storages fall
+    back to stamp_document one by one. Results are saved with one
+    bulk_update. Returns (stamped, failed) counts.
+    """
+    documents = [
+        document for document in Document.objects.filter(transaction_id=transaction_id, is_stamped=False)
+        if document.file and document.file.name.lower().endswith('.pdf')
+    ]
+    stamped, failed = [], 0
+
+    local = [(document, _local_path(document.file)) for document in documents]
+    remote = [document for document, path in local if path is None]
+    local = [(document, path) for document, path in local if path is not None]
+
+    if local:
+        work_dir = tempfile.mkdtemp(prefix='stamping-')
+        try:
+            executor = _get_executor()
+            futures = []
+            for document, path in local:
+                output_path = os.path.join(work_dir, f"{document.pk}.pdf")
+                futures.append((document, output_path, executor.submit(_stamp_file, path, output_path)))
+
+            for document, output_path, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"فشل ختم المستند {document.pk}: {e}")
+                    failed += 1
+                    continue
+                with open(output_path, 'rb') as output:
+                    document.stamped_file.save(_stamped_name(document), File(output), save=False)
+                document.is_stamped = True
+                stamped.append(document)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    Document.objects.bulk_update(stamped, ['stamped_file', 'is_stamped'])
+
+    for document in remote:
+        success, _ = stamp_document(document)
+        if success:
+            stamped.append(document)
+        else:
+            failed += 1
+    return len(stamped), failed
+
+
+# --- ختم الدفعات خارج الطلب ---
+
+# خيط واحد يشغل الدفعات بالترتيب؛ الختم نفسه يتوزع على عمليات _get_executor
+_job_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stamping')
+
+
+def _status_key(transaction_id):
+    return f"stamping:status:{transaction_id}"
+
+
+def _lock_key(transaction_id):
+    return f"stamping:lock:{transaction_id}"
+
+
+def get_stamping_status(transaction_id):
+    """حالة آخر عملية ختم للمعاملة: status (running/done/failed) و stamped و failed، أو None."""
+    return cache.get(_status_key(transaction_id))
+
+
+def start_stamping_job(transaction_id):
+    """
+    Queues stamp_transaction_documents for a transaction and returns at once
+    with (state, started). The work runs in a background thread after the
+    current DB transaction commits; its state is kept in the cache so any
+    server process can answer polling. While a job for the transaction is
+    running, the existing state is returned and no second job is started.
+    """
+    state = {
+        'status': 'running', 'stamped': 0, 'failed': 0,
+        'started_at': timezone.now().isoformat(), 'finished_at': None,
+    }
+    if not cache.add(_lock_key(transaction_id), True, STAMPING_LOCK_TIMEOUT):
+        # عملية أخرى تملك القفل (وربما لم تكتب الحالة بعد): لا نبدأ مهمة ثانية أبداً
+        return get_stamping_status(transaction_id) or state, False
+
+    cache.set(_status_key(transaction_id), state, STAMPING_STATUS_TIMEOUT)
+    transaction.on_commit(lambda: _job_executor.submit(_run_stamping_job, transaction_id, state))
+    return state, True
+
+
+def _run_stamping_job(transaction_id, state):
+    state = dict(state)
+    try:
+        stamped, failed = stamp_transaction_documents(transaction_id)
+        state.update(status='done', stamped=stamped, failed=failed)
+    except Exception as e:
+        logger.error(f"فشل ختم مستندات المعاملة {transaction_id}: {e}", exc_info=True)
+        state.update(status='failed', error=str(e))
+    finally:
+        state['finished_at'] = timezone.now().isoformat()
+        cache.set(_status_key(transaction_id), state, STAMPING_STATUS_TIMEOUT)
+        cache.delete(_lock_key(transaction_id))
+        # اتصال قاعدة البيانات الخاص بهذا الخيط
+        connections.close_all()
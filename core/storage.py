@@ -0,0 +1,218 @@
+# core/storage.py
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+# مجلد الكتل داخل MEDIA_ROOT: blobs/ab/cd/<sha256>/<اسم الملف>
+BLOB_PREFIX = 'blobs'
+
+READ_SIZE = 64 * 1024
+
+# طول بادئة الكتلة قبل اسم الملف: blobs/ab/cd/<64 حرفاً>/
+BLOB_NAME_PREFIX_LENGTH = len(BLOB_PREFIX) + len('/ab/cd/') + 64 + 1
+
+# الطول المفترض إذا لم يمرر الحقل max_length
+DEFAULT_MAX_LENGTH = 255
+
+# أطول اسم ملف يقبله نظام الملفات (بالبايت، والحرف العربي بايتان في UTF-8)
+FILENAME_MAX_BYTES = 255
+
+
+def blob_directory(digest):
+    return '/'.join([BLOB_PREFIX, digest[:2], digest[2:4], digest])
+
+
+def fit_filename(filename, max_length=None):
+    """
+    يقصّر اسم الملف (مع الإبقاء على الامتداد) حتى يتسع اسم الكتلة الكامل
+    blobs/ab/cd/<sha256>/<filename> لطول عمود الحقل في قاعدة البيانات،
+    ولا يتجاوز اسم الملف حد نظام الملفات بالبايت.
+    """
+    room = (max_length or DEFAULT_MAX_LENGTH) - BLOB_NAME_PREFIX_LENGTH
+    if room < 1:
+        raise ValueError(f"max_length={max_length} أقصر من اسم الكتلة")
+
+    def fits(name):
+        return len(name) <= room and len(name.encode()) <= FILENAME_MAX_BYTES
+
+    if fits(filename):
+        return filename
+    base, extension = os.path.splitext(filename)
+    if not fits(extension + 'x'):
+        base, extension = filename, ''
+    while base and not fits(base + extension):
+        base = base[:-1]
+    return (base.rstrip(' ._') or 'file') + extension
+
+
+def parse_blob_name(name):
+    """يرجع SHA-256 من اسم ملف مخزن ككتلة، أو None للأسماء القديمة (transaction_{id}/...)."""
+    parts = (name or '').replace('\\', '/').split('/')
+    if len(parts) == 5 and parts[0] == BLOB_PREFIX and len(parts[3]) == 64:
+        return parts[3]
+    return None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File storage that keeps one copy of each distinct content.
+
+    A saved file is hashed while it is written to a temporary file, then
+    stored as blobs/ab/cd/<sha256>/<filename>. When the blob already exists
+    the temporary copy is dropped and the name is a hard link to the
+    existing data (or the same name when the filename matches), so
+    re-uploads of the same deed or plan cost no disk space. Every save adds
+    a reference on the Blob row and delete() releases one; the blob
+    directory is removed with the last reference. Names saved before this
+    storage (transaction_{id}/...) keep working unchanged.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # المجلد النهائي يحدده المحتوى في _save، ولا يُستبدل ملف موجود أبداً.
+        # هنا نقصّر اسم الملف فقط حتى يتسع الاسم الكامل لعمود الحقل
+        return fit_filename(os.path.basename(name), max_length)
+
+    def _save(self, name, content):
+        # تجنب الاستيراد الدائري: models.py يستخدم هذا التخزين
+        from .models import Blob
+
+        filename = os.path.basename(name)
+        os.makedirs(self.path(BLOB_PREFIX), exist_ok=True)
+        temp_path, digest, size = self._hash_to_temp(content)
+        try:
+            directory = blob_directory(digest)
+            blob_name = f"{directory}/{filename}"
+            with transaction.atomic():
+                # القفل على صف الكتلة يمنع حذفها مع آخر مرجع أثناء إضافة مرجع جديد
+                blob = Blob.objects.select_for_update().filter(sha256=digest).first()
+                if blob is None:
+                    try:
+                        with transaction.atomic():
+                            Blob.objects.create(sha256=digest, size=size, ref_count=1)
+                    except IntegrityError:
+                        # أنشأها طلب آخر في نفس اللحظة
+                        Blob.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1)
+                else:
+                    Blob.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1)
+                self._place(directory, filename, temp_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return blob_name
+
+    def _hash_to_temp(self, content):
+        """
+        Computes the SHA-256 and size of content and leaves its bytes in a
+        temporary file in the blob area. Uploads that are already on disk
+        (chunked uploads, TemporaryUploadedFile) are read once and moved
+        there; other content is copied while hashing. Returns
+        (temp_path, digest, size).
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        if hasattr(content, 'temporary_file_path'):
+            with open(content.temporary_file_path(), 'rb') as source:
+                for data in iter(lambda: source.read(READ_SIZE), b''):
+                    hasher.update(data)
+                    size += len(data)
+            # ننقل الملف المؤقت بدلاً من نسخه إذا كانت الكتلة جديدة
+            temp_path = os.path.join(self.path(BLOB_PREFIX), f".incoming-{os.getpid()}-{id(content)}")
+            file_move_safe(content.temporary_file_path(), temp_path, allow_overwrite=True)
+            return temp_path, hasher.hexdigest(), size
+
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        fd, temp_path = tempfile.mkstemp(prefix='.incoming-', dir=self.path(BLOB_PREFIX))
+        with os.fdopen(fd, 'wb') as temp:
+            for data in content.chunks():
+                hasher.update(data)
+                size += len(data)
+                temp.write(data)
+        return temp_path, hasher.hexdigest(), size
+
+    def _place(self, directory, filename, temp_path):
+        """يضع الملف في مجلد الكتلة: نقل إذا كانت جديدة، ورابط صلب لاسم جديد إذا كانت موجودة."""
+        full_directory = self.path(directory)
+        target = os.path.join(full_directory, filename)
+        if os.path.exists(target):
+            return
+        os.makedirs(full_directory, exist_ok=True)
+        existing = next((entry.path for entry in os.scandir(full_directory) if entry.is_file()), None)
+        if existing is None:
+            os.replace(temp_path, target)
+        else:
+            try:
+                os.link(existing, target)
+            except OSError:
+                # نظام ملفات لا يدعم الروابط الصلبة
+                shutil.copyfile(existing, target)
+        if self.file_permissions_mode is not None:
+            os.chmod(target, self.file_permissions_mode)
+
+    def delete(self, name):
+        """يحرر مرجعاً واحداً؛ الكتلة تُحذف مع آخر مرجع. الأسماء القديمة تُحذف كالمعتاد."""
+        from .models import Blob
+
+        digest = parse_blob_name(name)
+        if digest is None:
+            return super().delete(name)
+
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(sha256=digest).first()
+            if blob is None:
+                return
+            if blob.ref_count > 1:
+                Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+                return
+            blob.delete()
+            shutil.rmtree(self.path(blob_directory(digest)), ignore_errors=True)
+
+
+def _release(storage, name):
+    if name and parse_blob_name(name):
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+def release_files(*fields):
+    """
+    Releases the blob references of deleted rows' file fields after commit.
+    Names from before content-addressed storage are left on disk as before.
+    """
+    for field in fields:
+        if field:
+            _release(field.storage, field.name)
+
+
+def release_replaced_files(instance, field_names, update_fields=None):
+    """
+    يحرر مراجع الملفات التي استُبدلت في صف موجود (رفع ملف جديد لنفس المستند،
+    أو ختم جديد) بعد نجاح الحفظ. يُستدعى من pre_save ويقارن بالأسماء المخزنة حالياً.
+    """
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None:
+        field_names = [name for name in field_names if name in update_fields]
+    if not field_names:
+        return
+    previous = type(instance)._default_manager.filter(pk=instance.pk).values(*field_names).first()
+    if previous is None:
+        return
+    for name in field_names:
+        field = getattr(instance, name)
+        if previous[name] and previous[name] != field.name:
+            _release(field.storage, previous[name])
+
+
+def document_storage():
+    """التخزين المستخدم لملفات المستندات والمحادثات (callable حتى لا يُثبَّت في الترحيلات)."""
+    return _document_storage
+
+
+_document_storage = ContentAddressedStorage()
@@ -0,0 +1,37 @@
+# core/streaming.py
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+
+def streaming_content(request, iterator):
+    """
+    Returns iterator in the form the current server can stream.
+
+    Under daphne (ASGI) Django 4.2 reads a synchronous iterator to the end
+    with sync_to_async(list) before sending anything, so the whole body
+    would sit in memory. For ASGI requests the iterator is wrapped in an
+    async one that pulls each chunk in a worker thread; WSGI requests get
+    it back unchanged.
+    """
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        return _async_chunks(iterator)
+    return iterator
+
+
+async def _async_chunks(iterator):
+    iterator = iter(iterator)
+    done = object()
+    # القراءة من الملفات لا تستخدم قاعدة البيانات، فلا حاجة لخيط المزامنة الرئيسي
+    next_chunk = sync_to_async(next, thread_sensitive=False)
+    try:
+        while True:
+            chunk = await next_chunk(iterator, done)
+            if chunk is done:
+                break
+            yield chunk
+    finally:
+        # إغلاق المولد (مثلاً عند انقطاع الاتصال) يغلق الملفات المفتوحة فيه
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=False)()
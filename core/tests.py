@@ -1,3 +1,335 @@
-from django.test import TestCase
+import fcntl
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from .models import (
+    CustomUser, Document, DocumentType, Notification, NotificationOutbox, Transaction, TransactionDistribution, TransactionDocument,
+    TransactionStatusCounter, UploadSession,
+)
+from .counters import get_status_counts, rebuild_transaction_counters
+from .management.commands.benchmark_stamping import build_sample_pdf
+from .search import get_search_backend
+from .services import send_bulk_notifications
+from . import stamping
+from .stamping import stamp_document
+from .uploads import append_chunk, part_path
+
+
+class TransactionListQueriesTests(TestCase):
+    """قائمة المعاملات يجب أن تُجلب بعدد ثابت من الاستعلامات مهما كان عدد المعاملات."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_superuser(username='admin', password='admin', email='admin@example.com')
+        document_types = [
+            DocumentType.objects.create(code=f'DOC{number:03}', name_ar=f'مستند {number}')
+            for number in range(1, 4)
+        ]
+        for index in range(100):
+            transaction = Transaction.objects.create(title=f'معاملة {index}', assigned_to=cls.user)
+            TransactionDistribution.objects.create(transaction=transaction, assigned_from=cls.user, assigned_to=cls.user)
+            for document_type in document_types:
+                item = TransactionDocument.objects.create(transaction=transaction, document_type=document_type)
+                Document.objects.create(
+                    transaction=transaction, transaction_document=item,
+                    file=f'transaction_files/{index}.pdf', uploaded_by=cls.user,
+                )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_uses_fixed_number_of_queries(self):
+        # المعاملات + المستندات المطلوبة + ملفاتها
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/transactions/?page_size=100')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 100)
+
+        first = response.data['results'][0]
+        self.assertIsNotNone(first['assignment_date'])
+        self.assertEqual(len(first['required_documents']), 3)
+        self.assertEqual(first['required_documents'][0]['files'][0]['uploaded_by_name'], 'admin')
+
+
+class ArabicSearchVisibilityTests(TestCase):
+    """البحث يُطبق صلاحيات المستخدم قبل حد النتائج، فلا تضيع معاملاته خلف نتائج لا يراها."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(username='admin', password='admin', email='admin@example.com')
+        cls.user = CustomUser.objects.create_user(username='employee', password='employee', email='employee@example.com')
+        # معاملة المستخدم أُنشئت أولاً وفيها الكلمة مرة واحدة، فترتيبها بعد كل المعاملات الأخرى
+        cls.own = Transaction.objects.create(title='محمد', assigned_to=cls.user)
+        for index in range(10):
+            Transaction.objects.create(title=f'محمد محمد {index}', assigned_to=cls.admin)
+
+    def setUp(self):
+        backend = get_search_backend()
+        if hasattr(backend, 'reset'):
+            backend.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_visible_match_below_global_cutoff_is_returned(self):
+        with mock.patch('core.search.SEARCH_MAX_RESULTS', 5):
+            response = self.client.get('/api/transactions/', {'search': 'محمد'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data['results']], [self.own.id])
+
+
+class ChunkedUploadTests(TestCase):
+    """بروتوكول الرفع على أجزاء: الاستئناف، الأجزاء المكررة، الفجوات، والتحقق من SHA-256."""
+
+    DATA = os.urandom(300_000)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_superuser(username='admin', password='admin', email='admin@example.com')
+        cls.transaction = Transaction.objects.create(title='معاملة', assigned_to=cls.user)
+        document_type = DocumentType.objects.create(code='DOC001', name_ar='صك الملكية')
+        cls.item = TransactionDocument.objects.create(transaction=cls.transaction, document_type=document_type)
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        upload_dir = mock.patch('core.uploads.CHUNKED_UPLOAD_DIR', os.path.join(media, 'chunked_uploads'))
+        upload_dir.start()
+        self.addCleanup(upload_dir.stop)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def start(self, **extra):
+        response = self.client.post('/api/uploads/', {
+            'transaction': self.transaction.id, 'transaction_document': self.item.id,
+            'filename': 'deed.pdf', 'total_size': len(self.DATA), **extra,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def put(self, session_id, offset, data):
+        return self.client.put(
+            f'/api/uploads/{session_id}/', data=data,
+            content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_retried_overlapping_chunk_is_accepted_once(self):
+        session_id = self.start()
+        self.assertEqual(self.put(session_id, 0, self.DATA[:200_000]).data['offset'], 200_000)
+        # إعادة إرسال جزء يتداخل مع ما وصل (بعد ضياع الرد): يُتجاهل الجزء المعروف
+        response = self.put(session_id, 100_000, self.DATA[100_000:])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Upload-Offset'], str(len(self.DATA)))
+
+        response = self.client.post(f'/api/uploads/{session_id}/finalize/')
+        self.assertEqual(response.status_code, 201, response.data)
+        with Document.objects.get(pk=response.data['id']).file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.DATA)
+
+    def test_gap_returns_conflict_with_offset(self):
+        session_id = self.start()
+        self.put(session_id, 0, self.DATA[:1000])
+        response = self.put(session_id, 5000, self.DATA[5000:6000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 1000)
+        self.assertEqual(response['Upload-Offset'], '1000')
+
+    def test_partial_chunk_then_resume(self):
+        session_id = self.start()
+        # انقطع الاتصال بعد 70000 بايت من جزء طوله 200000
+        session = append_chunk(session_id, 0, io.BytesIO(self.DATA[:70_000]), 200_000)
+        self.assertEqual(session.received_bytes, 70_000)
+
+        response = self.client.get(f'/api/uploads/{session_id}/')
+        self.assertEqual(response['Upload-Offset'], '70000')
+        # بيانات زائدة بعد آخر بايت مؤكد تُقص عند الاستئناف
+        with open(part_path(session), 'ab') as part:
+            part.write(b'garbage')
+        self.put(session_id, 70_000, self.DATA[70_000:])
+
+        response = self.client.post(f'/api/uploads/{session_id}/finalize/')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(UploadSession.objects.get(pk=session_id).sha256, hashlib.sha256(self.DATA).hexdigest())
+
+    def test_concurrent_writer_gets_conflict(self):
+        session_id = self.start()
+        self.put(session_id, 0, self.DATA[:1000])
+        with open(part_path(UploadSession.objects.get(pk=session_id)), 'r+b') as part:
+            # طلب آخر ما زال يكتب في نفس الجلسة
+            fcntl.flock(part.fileno(), fcntl.LOCK_EX)
+            response = self.put(session_id, 1000, self.DATA[1000:2000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 1000)
+
+    def test_sha256_mismatch_is_rejected(self):
+        session_id = self.start(expected_sha256='0' * 64)
+        self.put(session_id, 0, self.DATA)
+        response = self.client.post(f'/api/uploads/{session_id}/finalize/')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Document.objects.exists())
+        self.assertEqual(UploadSession.objects.get(pk=session_id).status, UploadSession.Status.ACTIVE)
+
+    def test_finalize_marks_missing_item_uploaded(self):
+        session_id = self.start(expected_sha256=hashlib.sha256(self.DATA).hexdigest())
+        self.put(session_id, 0, self.DATA)
+        response = self.client.post(f'/api/uploads/{session_id}/finalize/')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.status, 'uploaded')
+        self.assertEqual(Document.objects.get(pk=response.data['id']).transaction_document_id, self.item.id)
+        self.assertEqual(UploadSession.objects.get(pk=session_id).status, UploadSession.Status.COMPLETE)
+
+
+class BlobFileNameLengthTests(TestCase):
+    """أسماء الكتل (blobs/ab/cd/<sha256>/<filename>) يجب أن تتسع لعمود الحقل مهما طال اسم الملف."""
+
+    FILENAME = 'صك الملكية الإلكتروني للأرض رقم ٤٥٦٧٨٩ المخطط المعتمد من أمانة منطقة الرياض.pdf'
+    # أطول من المساحة المتبقية بعد بادئة الكتلة (255 - 77)، فيُقصّر مع الإبقاء على الامتداد
+    VERY_LONG_FILENAME = 'نسخة معتمدة من ' * 15 + 'المخطط.pdf'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_superuser(username='admin', password='admin', email='admin@example.com')
+        cls.transaction = Transaction.objects.create(title='معاملة', assigned_to=cls.user)
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.source = os.path.join(media, 'source.pdf')
+        build_sample_pdf(self.source, 1)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_long_filename_fits_file_and_stamped_file(self):
+        for filename in (self.FILENAME, self.VERY_LONG_FILENAME):
+            with self.subTest(length=len(filename)):
+                self.check_upload_and_stamp(filename)
+
+    def check_upload_and_stamp(self, filename):
+        with open(self.source, 'rb') as source:
+            upload = SimpleUploadedFile(filename, source.read(), content_type='application/pdf')
+        response = self.client.post(f'/api/transactions/{self.transaction.id}/documents/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        document = Document.objects.get(pk=response.data['id'])
+        self.assertLessEqual(len(document.file.name), Document._meta.get_field('file').max_length)
+        self.assertTrue(document.file.name.endswith('.pdf'))
+
+        success, message = stamp_document(document)
+        self.assertTrue(success, message)
+        document.refresh_from_db()
+        self.assertLessEqual(len(document.stamped_file.name), Document._meta.get_field('stamped_file').max_length)
+        self.assertTrue(document.stamped_file.name.endswith('.pdf'))
+
+
+class TransactionCounterTests(TestCase):
+    """العدادات تُحسب من الصف المقفول في قاعدة البيانات، لا من النسخة المحملة في الذاكرة."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.first = CustomUser.objects.create_user(username='first', password='first')
+        cls.second = CustomUser.objects.create_user(username='second', password='second')
+
+    def assertCountersMatchTable(self):
+        counted = {
+            (row.status, row.assignee_id): row.count
+            for row in TransactionStatusCounter.objects.exclude(count=0)
+        }
+        rebuild_transaction_counters()
+        expected = {
+            (row.status, row.assignee_id): row.count
+            for row in TransactionStatusCounter.objects.exclude(count=0)
+        }
+        self.assertEqual(counted, expected)
+
+    def test_status_change_and_reassignment(self):
+        transaction = Transaction.objects.create(title='معاملة', status=Transaction.StatusChoices.NEW, assigned_to=self.first)
+        self.assertEqual(get_status_counts(self.first.pk), {'new': 1})
+
+        transaction.status = Transaction.StatusChoices.PROCESSING
+        transaction.save()
+        self.assertEqual(get_status_counts(self.first.pk), {Transaction.StatusChoices.PROCESSING: 1})
+
+        transaction.assigned_to = self.second
+        transaction.save()
+        self.assertEqual(get_status_counts(self.first.pk), {})
+        self.assertEqual(get_status_counts(self.second.pk), {Transaction.StatusChoices.PROCESSING: 1})
+        self.assertCountersMatchTable()
+
+    def test_stale_instances(self):
+        transaction = Transaction.objects.create(title='معاملة', status=Transaction.StatusChoices.NEW, assigned_to=self.first)
+        stale = Transaction.objects.get(pk=transaction.pk)
+
+        transaction.status = Transaction.StatusChoices.PROCESSING
+        transaction.save()
+        # نسخة محملة قبل التغيير تحفظ موظفاً جديداً فقط
+        stale.assigned_to = self.second
+        stale.save(update_fields=['assigned_to'])
+        self.assertEqual(get_status_counts(self.second.pk), {Transaction.StatusChoices.PROCESSING: 1})
+        self.assertCountersMatchTable()
+
+        # ونسخة قديمة تحفظ كل الحقول: تعيد الحالة إلى new
+        stale.save()
+        self.assertEqual(get_status_counts(), {'new': 1})
+        self.assertCountersMatchTable()
+
+        # الحذف يطرح من الحالة المخزنة وليس من النسخة القديمة في الذاكرة
+        transaction.refresh_from_db()
+        transaction.status = Transaction.StatusChoices.PROCESSING
+        transaction.save()
+        stale.delete()
+        self.assertEqual(get_status_counts(), {})
+        self.assertCountersMatchTable()
+
+
+class StampingJobLockTests(TestCase):
+    """لا تبدأ مهمة ختم بدون امتلاك القفل، حتى لو لم تُكتب حالة المهمة الأخرى بعد."""
+
+    def test_held_lock_without_state_does_not_start_job(self):
+        cache.add(stamping._lock_key(42), True, stamping.STAMPING_LOCK_TIMEOUT)
+        self.addCleanup(cache.delete, stamping._lock_key(42))
+        cache.delete(stamping._status_key(42))
+
+        with mock.patch.object(stamping, '_job_executor') as executor, self.captureOnCommitCallbacks(execute=True):
+            state, started = stamping.start_stamping_job(42)
+        self.assertFalse(started)
+        self.assertEqual(state['status'], 'running')
+        executor.submit.assert_not_called()
+
+
+class BulkNotificationKeysTests(TestCase):
+    """كل حدث في صندوق الإرسال يشير إلى إشعاره، حتى بدون مفاتيح من bulk_create."""
+
+    def test_identical_notifications_without_returned_keys(self):
+        user = CustomUser.objects.create_user(username='user', password='user')
+        # نفس الإشعار مرتين وبدون object_id، كما في MySQL
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            created = send_bulk_notifications([
+                Notification(user=user, message='مستند جديد', event_type='document') for _ in range(2)
+            ])
+
+        self.assertEqual(len({notification.pk for notification in created}), 2)
+        self.assertNotIn(None, [notification.pk for notification in created])
+        self.assertEqual(
+            sorted(NotificationOutbox.objects.values_list('notification_id', flat=True)),
+            sorted(notification.pk for notification in created),
+        )
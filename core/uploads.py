@@ -0,0 +1,245 @@
+# core/uploads.py
+
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows (بيئة التطوير فقط)
+    fcntl = None
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Document, UploadSession
+
+# مجلد الملفات المؤقتة للرفع على أجزاء؛ يجب أن يكون مشتركاً بين عمليات الخادم
+CHUNKED_UPLOAD_DIR = getattr(settings, 'CHUNKED_UPLOAD_DIR', os.path.join(settings.MEDIA_ROOT, 'chunked_uploads'))
+
+# الحجم المقترح للجزء، والحد الأقصى لجزء واحد في طلب PUT
+CHUNKED_UPLOAD_CHUNK_SIZE = getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK_SIZE', 64 * 1024 * 1024)
+
+# أكبر ملف مسموح به
+CHUNKED_UPLOAD_MAX_SIZE = getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 ** 3)
+
+# حجم القراءة من الطلب والكتابة إلى الملف: الذاكرة لكل رفع لا تتجاوزه
+READ_SIZE = 64 * 1024
+
+
+class UploadConflict(Exception):
+    """الجزء لا يبدأ عند آخر بايت مستلم؛ يحمل الموضع الصحيح ليكمل العميل منه."""
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+
+# SHA-256 المتراكم لكل جلسة في هذه العملية: session_id -> (عدد البايتات المحسوبة، hasher)
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+def part_path(session):
+    return os.path.join(CHUNKED_UPLOAD_DIR, f"{session.pk}.part")
+
+
+def _hasher_for(session):
+    """
+    Returns the running SHA-256 of the bytes received so far. Kept in memory
+    per process; when the previous chunk went to another worker (or after a
+    restart) it is rebuilt by reading the part file once. The cached hasher
+    is taken out of the cache, so a failed append can never leave one behind
+    that has consumed bytes the session did not record.
+    """
+    with _hashers_lock:
+        cached = _hashers.pop(session.pk, None)
+    if cached and cached[0] == session.received_bytes:
+        return cached[1]
+
+    hasher = hashlib.sha256()
+    if session.received_bytes:
+        with open(part_path(session), 'rb') as part:
+            remaining = session.received_bytes
+            while remaining:
+                data = part.read(min(READ_SIZE, remaining))
+                if not data:
+                    break
+                hasher.update(data)
+                remaining -= len(data)
+    return hasher
+
+
+def start_upload(user, transaction_obj, filename, total_size, transaction_document=None,
+                 description='', expected_sha256=''):
+    if total_size > CHUNKED_UPLOAD_MAX_SIZE:
+        raise ValueError(f"حجم الملف أكبر من الحد المسموح ({CHUNKED_UPLOAD_MAX_SIZE} بايت)")
+    session = UploadSession.objects.create(
+        transaction=transaction_obj,
+        transaction_document=transaction_document,
+        created_by=user,
+        filename=os.path.basename(filename),
+        description=description or '',
+        total_size=total_size,
+        expected_sha256=(expected_sha256 or '').lower(),
+    )
+    os.makedirs(CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(part_path(session), 'wb').close()
+    return session
+
+
+@contextmanager
+def _locked_part(session):
+    """
+    Opens the part file with an exclusive, non-blocking lock, so one writer
+    at a time handles a session without holding a DB transaction or row
+    lock while it reads from a slow client. A second writer (for example a
+    retry while the first request is still streaming) gets UploadConflict
+    straight away. The lock is released when the file is closed, also if
+    the process dies.
+    """
+    try:
+        part = open(part_path(session), 'r+b')
+    except FileNotFoundError:
+        raise ValueError("جلسة الرفع منتهية")
+    with part:
+        if fcntl is not None:
+            try:
+                fcntl.flock(part.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadConflict("جزء آخر من نفس الملف قيد الاستلام", session.received_bytes)
+        yield part
+
+
+def append_chunk(session_id, offset, stream, length):
+    """
+    Appends a chunk that starts at byte offset, read from stream in
+    READ_SIZE pieces. A resent chunk that overlaps data already received is
+    accepted: the known prefix is skipped, so retries after a lost response
+    are safe. A chunk that starts past the received bytes raises
+    UploadConflict with the offset to resume from. Returns the session.
+    """
+    if length > CHUNKED_UPLOAD_MAX_CHUNK_SIZE:
+        raise ValueError(f"حجم الجزء أكبر من الحد المسموح ({CHUNKED_UPLOAD_MAX_CHUNK_SIZE} بايت)")
+
+    session = UploadSession.objects.get(pk=session_id)
+    if session.status != UploadSession.Status.ACTIVE:
+        raise ValueError("جلسة الرفع منتهية")
+
+    with _locked_part(session) as part:
+        # بعد أخذ القفل نقرأ الموضع من جديد: ربما أنهى كاتب سابق جزءه للتو
+        session.refresh_from_db(fields=['received_bytes', 'status'])
+        if session.status != UploadSession.Status.ACTIVE:
+            raise ValueError("جلسة الرفع منتهية")
+        if offset > session.received_bytes:
+            raise UploadConflict("الجزء لا يبدأ عند آخر بايت مستلم", session.received_bytes)
+        if offset + length > session.total_size:
+            raise ValueError("الجزء يتجاوز حجم الملف المعلن")
+
+        hasher = _hasher_for(session)
+        skip = session.received_bytes - offset
+        remaining = length
+        part.seek(session.received_bytes)
+        # إذا توقف الطلب في منتصف جزء سابق قد يكون في الملف بيانات بعد آخر بايت مؤكد
+        part.truncate()
+        try:
+            while remaining:
+                data = stream.read(min(READ_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                if skip:
+                    if len(data) <= skip:
+                        skip -= len(data)
+                        continue
+                    data = data[skip:]
+                    skip = 0
+                part.write(data)
+                hasher.update(data)
+                session.received_bytes += len(data)
+        finally:
+            # إذا انقطع الاتصال قبل اكتمال الجزء نحفظ ما وصل، ويكمل العميل من بعده.
+            # الحفظ استعلام قصير بعد انتهاء القراءة، بدون معاملة مفتوحة أثناءها
+            part.flush()
+            UploadSession.objects.filter(pk=session.pk, status=UploadSession.Status.ACTIVE).update(
+                received_bytes=session.received_bytes, updated_at=timezone.now(),
+            )
+            with _hashers_lock:
+                _hashers[session.pk] = (session.received_bytes, hasher)
+    return session
+
+
+def finish_upload(session_id):
+    """
+    Verifies size and checksum, moves the part file into storage as the
+    Document's file and marks a missing checklist item as uploaded, like a
+    normal upload through DocumentViewSet. Returns the Document.
+    """
+    session = UploadSession.objects.get(pk=session_id)
+    if session.status == UploadSession.Status.COMPLETE:
+        return session.document
+
+    # نفس قفل append_chunk: لا يُنقل الملف بينما يكتب فيه طلب آخر
+    with _locked_part(session), transaction.atomic():
+        session = UploadSession.objects.select_for_update().select_related('transaction_document').get(pk=session_id)
+        if session.status == UploadSession.Status.COMPLETE:
+            return session.document
+        if session.received_bytes != session.total_size:
+            raise UploadConflict("لم تكتمل أجزاء الملف", session.received_bytes)
+
+        digest = _hasher_for(session).hexdigest()
+        if session.expected_sha256 and digest != session.expected_sha256:
+            raise ValueError("SHA-256 للملف لا يطابق القيمة المرسلة")
+
+        document = Document(
+            transaction_id=session.transaction_id,
+            transaction_document=session.transaction_document,
+            description=session.description,
+            uploaded_by_id=session.created_by_id,
+        )
+        # مع التخزين المحلي يُنقل الملف المؤقت نقلاً بدلاً من نسخه
+        with open(part_path(session), 'rb') as part:
+            document.file.save(session.filename, _PartFile(part, session.filename), save=False)
+        document.save()
+
+        transaction_document = session.transaction_document
+        if transaction_document and transaction_document.status == 'missing':
+            transaction_document.status = 'uploaded'
+            transaction_document.save()
+
+        session.status = UploadSession.Status.COMPLETE
+        session.sha256 = digest
+        session.document = document
+        session.save(update_fields=['status', 'sha256', 'document', 'updated_at'])
+
+    discard_part(session)
+    return document
+
+
+def discard_expired_uploads(older_than):
+    """يحذف جلسات الرفع غير المكتملة التي لم تستقبل أي جزء منذ older_than (timedelta) وملفاتها المؤقتة."""
+    sessions = list(UploadSession.objects.filter(
+        status=UploadSession.Status.ACTIVE, updated_at__lt=timezone.now() - older_than
+    ))
+    for session in sessions:
+        discard_part(session)
+    UploadSession.objects.filter(pk__in=[session.pk for session in sessions]).delete()
+    return len(sessions)
+
+
+def discard_part(session):
+    with _hashers_lock:
+        _hashers.pop(session.pk, None)
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
+
+
+class _PartFile(File):
+    # FileSystemStorage ينقل الملفات التي لها temporary_file_path بدلاً من نسخها (مثل TemporaryUploadedFile)
+    def temporary_file_path(self):
+        return self.file.name
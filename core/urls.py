@@ -21,6 +21,7 @@ router.register(r'invoices', InvoiceViewSet, basename='invoice')
 router.register(r'transaction-main-categories', TransactionMainCategoryViewSet, basename='maincategory')
 router.register(r'transaction-sub-categories', TransactionSubCategoryViewSet, basename='subcategory')
 router.register(r'competent-authorities', CompetentAuthorityViewSet, basename='authority')
+router.register(r'required-document-rules', RequiredDocumentRuleViewSet, basename='requireddocumentrule')
 router.register(r'transaction-documents', TransactionDocumentViewSet, basename='transactiondocument')
 router.register(r'documents', DocumentViewSet, basename='document')
 router.register(r'departments', DepartmentViewSet, basename='department')
@@ -36,6 +37,7 @@ router.register(r'report-templates', ReportTemplateViewSet, basename='report-tem
 router.register(r'notifications', NotificationViewSet, basename='notification')
 router.register(r'transaction-distributions', TransactionDistributionViewSet, basename='transactiondistribution')
 router.register(r'chat/rooms', ChatRoomViewSet, basename='chat-room')
+router.register(r'uploads', UploadSessionViewSet, basename='upload-session')
 
 # === المسجلات المتداخلة ===
 transactions_router = routers.NestedSimpleRouter(router, r'transactions', lookup='transaction')
@@ -59,5 +61,8 @@ urlpatterns = [
     path('chat/users/', UserListView.as_view(), name='chat-users'),
     path('chat/presence/', UserPresenceView.as_view(), name='user-presence'),
     path('pusher/auth/', PusherAuthView.as_view(), name='pusher-auth'),
+    path('files/documents/<int:pk>/', DocumentDownloadView.as_view(), name='document-download'),
+    path('files/reports/<int:pk>/', GeneratedReportDownloadView.as_view(), name='report-download'),
+    path('files/chat-messages/<int:pk>/', ChatMessageFileDownloadView.as_view(), name='chat-message-file-download'),
   
 ]
@@ -1,8 +1,8 @@
 # core/views.py
 
+import logging
 from decimal import Decimal
 from django.conf import settings
-import pusher
 from rest_framework import viewsets, status, mixins
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -23,10 +23,36 @@ from rest_framework import filters
 from asgiref.sync import async_to_sync # <-- إضافة استيراد جديد
 from channels.layers import get_channel_layer
 from django.db.models import Sum, Case, When, Value, DecimalField
+from django.db.models import OuterRef, Prefetch, QuerySet, Subquery
 from .services import create_and_send_notification # استيراد الدالة الجديدة
+from .authorization import user_has_permission
+from .permissions import HasRolePermission
+from .checklists import create_required_documents
+from .importers import TransactionImporter
+from .search import ArabicSearchFilter
+from .counters import get_status_counts
+from .workload import CLOSED_TRANSACTION_STATUSES, annotate_active_counts, build_workload_summary
+from .distribution import auto_distribute
+from .outbox import get_pusher_client
+from .chat import (
+    advance_read_cursor, annotate_unread_counts, fan_out_message, history_page, mark_room_read,
+    parse_history_params, refresh_last_message,
+)
+from .uploads import UploadConflict, append_chunk, discard_part, finish_upload, start_upload
+from .stamping import get_stamping_status, stamp_document, start_stamping_job
+from .archives import iter_zip, transaction_package_entries
+from .streaming import streaming_content
+from .downloads import serve_file
+from .presence import get_presence, heartbeat, mark_offline, online_user_ids
+from django.db import transaction as db_transaction
+from django.core.cache import cache
+from django.http import Http404, StreamingHttpResponse
+from django.utils.http import content_disposition_header
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework_simplejwt.views import TokenObtainPairView
 
+logger = logging.getLogger(__name__)
+
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -36,6 +62,7 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = CustomUser.objects.all().order_by('-date_joined')
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-date_joined', '-id')
 
 class RoleViewSet(viewsets.ModelViewSet):
     """
@@ -44,6 +71,8 @@ class RoleViewSet(viewsets.ModelViewSet):
     queryset = Role.objects.all()
     serializer_class = RoleSerializer
     permission_classes = [IsAuthenticated]
+    # بيانات مرجعية صغيرة تُعرض كاملة في القوائم المنسدلة، لذلك بدون ترقيم صفحات
+    pagination_class = None
 
 class PermissionViewSet(viewsets.ModelViewSet):
     """
@@ -53,6 +82,8 @@ class PermissionViewSet(viewsets.ModelViewSet):
     queryset = Permission.objects.all()
     serializer_class = PermissionSerializer
     permission_classes = [IsAuthenticated]
+    # بيانات مرجعية صغيرة تُعرض كاملة في القوائم المنسدلة، لذلك بدون ترقيم صفحات
+    pagination_class = None
 
 class TransactionViewSet(viewsets.ModelViewSet):
     """
@@ -64,10 +95,11 @@ class TransactionViewSet(viewsets.ModelViewSet):
     parser_classes = [MultiPartParser, FormParser]
 
     # --- فلاتر البحث والترتيب ---
-    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter]
+    # البحث عبر فهرس البحث العربي (رمز المعاملة، العنوان، اسم العميل) بدلاً من LIKE
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, ArabicSearchFilter]
     filterset_fields = ['client', 'status', 'assigned_to', 'main_category']
-    search_fields = ['short_code', 'title', 'client__name_ar']
     ordering_fields = ['created_at', 'updated_at']
+    cursor_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
         """
@@ -76,14 +108,26 @@ class TransactionViewSet(viewsets.ModelViewSet):
         user = self.request.user
         
         # 1. نبدأ بالـ QuerySet الأساسي مع تحسينات الأداء
+        # تاريخ آخر إسناد يُحسب في نفس الاستعلام بدلاً من استعلام لكل معاملة
+        latest_assignment = TransactionDistribution.objects.filter(
+            transaction=OuterRef('pk')
+        ).order_by('-assigned_at').values('assigned_at')[:1]
+
+        # قائمة المستندات المطلوبة مع نوع كل مستند وملفاته ورافعها، باستعلام واحد لكل مستوى
+        required_documents = TransactionDocument.objects.select_related('document_type').prefetch_related(
+            Prefetch('files', queryset=Document.objects.select_related('uploaded_by'))
+        )
+
         queryset = Transaction.objects.all().select_related(
             'client', 'assigned_to', 'main_category', 'sub_category'
         ).prefetch_related(
-            'distributions', 'required_documents'
+            Prefetch('required_documents', queryset=required_documents)
+        ).annotate(
+            last_assigned_at=Subquery(latest_assignment)
         ).order_by('-created_at')
 
         # 2. نطبق فلترة الصلاحيات
-        if not (user.is_superuser or (user.role and user.role.permissions.filter(code='PERM039').exists())):
+        if not user_has_permission(user, 'PERM039'):
             # إذا لم يكن المستخدم مشرفًا أو لديه صلاحية عرض الكل،
             # فإنه يرى فقط المعاملات المسندة إليه
             queryset = queryset.filter(assigned_to=user)
@@ -100,29 +144,7 @@ class TransactionViewSet(viewsets.ModelViewSet):
         إنشاء معاملة جديدة وتوليد قائمة المستندات المطلوبة لها تلقائيًا.
         """
         transaction = serializer.save()
-        
-        required_docs_codes = []
-        sub_category_code = transaction.sub_category.code if transaction.sub_category else None
-
-        if sub_category_code == 'BUILD-LIC': # رخصة بناء جديدة
-            required_docs_codes = [
-                "DOC001", "DOC002", "DOC003", "DOC004", "DOC005", "DOC006", 
-                "DOC007", "DOC008", "DOC009", "DOC010", "DOC011", "DOC012",
-                "DOC013", "DOC014", "DOC015", "DOC016", "DOC017", "DOC018",
-                "DOC019", "DOC020", "DOC021", "DOC022"
-            ]
-        else: # قائمة افتراضية
-            required_docs_codes = ["DOC001", "DOC005"]
-
-        for code in required_docs_codes:
-            try:
-                doc_type = DocumentType.objects.get(code=code)
-                TransactionDocument.objects.create(
-                    transaction=transaction,
-                    document_type=doc_type
-                )
-            except DocumentType.DoesNotExist:
-                print(f"Warning: DocumentType with code {code} not found.")
+        create_required_documents([transaction])
 
     def perform_update(self, serializer):
         boundaries_data = serializer.validated_data.pop('boundaries', None)
@@ -149,6 +171,26 @@ class TransactionViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
     # === END: الإضافة هنا ===
 
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_transactions(self, request):
+        """
+        استيراد معاملات من ملف CSV أو XLSX وإرجاع تقرير بالأخطاء لكل صف.
+        للملفات الكبيرة جدًا يفضل استخدام أمر: manage.py import_transactions
+        """
+        if not user_has_permission(request.user, 'PERM036'):
+            return Response({'detail': 'Action forbidden.'}, status=status.HTTP_403_FORBIDDEN)
+
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({'detail': 'يجب إرفاق ملف (file).'}, status=status.HTTP_400_BAD_REQUEST)
+
+        dry_run = request.data.get('dry_run') in ['true', 'True', '1']
+        try:
+            report = TransactionImporter(dry_run=dry_run).run(upload, upload.name)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report.to_dict())
+
     def _check_permission(self, user, transaction):
         """دالة مساعدة للتحقق مما إذا كان المستخدم هو المسند إليه المعاملة."""
         return user.is_superuser or transaction.assigned_to == user
@@ -188,11 +230,50 @@ class TransactionViewSet(viewsets.ModelViewSet):
         transaction.save()
         return Response({'status': 'Transaction marked as completed'})
 
+    @action(detail=True, methods=['get', 'post'], url_path='stamp-documents')
+    def stamp_documents(self, request, pk=None):
+        """
+        POST: يبدأ ختم كل ملفات PDF المرفوعة وغير المختومة في المعاملة في الخلفية ويرجع 202 فوراً.
+        GET: حالة آخر عملية ختم (running/done/failed مع عدد الملفات المختومة والفاشلة).
+        """
+        transaction = self.get_object()
+        if not self._check_permission(request.user, transaction):
+            return Response({'detail': 'Action forbidden.'}, status=status.HTTP_403_FORBIDDEN)
+
+        if request.method == 'GET':
+            state = get_stamping_status(transaction.pk)
+            if state is None:
+                return Response({'detail': 'لا توجد عملية ختم لهذه المعاملة.'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(state)
+
+        state, _ = start_stamping_job(transaction.pk)
+        return Response(state, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'], url_path='download-package')
+    def download_package(self, request, pk=None):
+        """
+        تنزيل كل مستندات المعاملة في ملف ZIP واحد (النسخة المختومة إن وجدت)، مقسمة في مجلدات حسب نوع المستند.
+        الأرشيف يُكتب أثناء الإرسال، فلا يُبنى في الذاكرة ولا على القرص.
+        """
+        transaction = self.get_object()
+        entries = transaction_package_entries(transaction)
+        response = StreamingHttpResponse(
+            streaming_content(request, iter_zip(entries)), content_type='application/zip'
+        )
+        response['Content-Disposition'] = content_disposition_header(
+            True, f"{transaction.short_code or transaction.pk}.zip"
+        )
+        return response
+
     
 
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
+# لوحة التحكم مشتركة لكل المستخدمين، لذلك نخزن نتيجتها لثوانٍ قليلة
+DASHBOARD_STATS_CACHE_KEY = 'dashboard_stats'
+DASHBOARD_STATS_CACHE_TIMEOUT = getattr(settings, 'DASHBOARD_STATS_CACHE_TIMEOUT', 10)
+
 class DashboardStatsView(APIView):
     """
     A view to retrieve aggregated statistics for the main dashboard.
@@ -200,23 +281,23 @@ class DashboardStatsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, format=None):
-        status_counts = Transaction.objects.values('status').annotate(count=Count('status'))
-        
-        stats = {item['status']: item['count'] for item in status_counts}
-
-        recent_transactions = Transaction.objects.order_by('-created_at')[:5]
-        
-        # FIX: Pass the request context to the serializer so it can build full URLs for files if needed.
-        recent_transactions_serializer = TransactionSerializer(recent_transactions, many=True, context={'request': request})
-
-        # FIX: Updated to use the new, more detailed status fields from the model
-        data = {
-            'total_transactions': Transaction.objects.count(),
-            'new_transactions': stats.get('new', 0) + stats.get('under_review', 0),
-            'in_progress_transactions': stats.get('processing', 0) + stats.get('docs_required', 0),
-            'completed_transactions': stats.get('completed', 0),
-            'recent_transactions': recent_transactions_serializer.data,
-        }
+        data = cache.get(DASHBOARD_STATS_CACHE_KEY)
+        if data is None:
+            # العدادات تُحدّث مع كل حفظ للمعاملة، لذلك لا نحتاج COUNT على جدول المعاملات
+            stats = get_status_counts()
+
+            recent_transactions = Transaction.objects.select_related('client', 'assigned_to').order_by('-created_at', '-id')[:5]
+            recent_transactions_serializer = TransactionSummarySerializer(recent_transactions, many=True)
+
+            # FIX: Updated to use the new, more detailed status fields from the model
+            data = {
+                'total_transactions': sum(stats.values()),
+                'new_transactions': stats.get('new', 0) + stats.get('under_review', 0),
+                'in_progress_transactions': stats.get('processing', 0) + stats.get('docs_required', 0),
+                'completed_transactions': stats.get('completed', 0),
+                'recent_transactions': recent_transactions_serializer.data,
+            }
+            cache.set(DASHBOARD_STATS_CACHE_KEY, data, DASHBOARD_STATS_CACHE_TIMEOUT)
         return Response(data)
 
 class ClientViewSet(viewsets.ModelViewSet):
@@ -225,6 +306,7 @@ class ClientViewSet(viewsets.ModelViewSet):
     """
     serializer_class = ClientSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [ArabicSearchFilter]
 
     # --- [هذا هو التطوير] ---
     # إضافة منطق للتحقق من الصلاحيات قبل عرض البيانات
@@ -237,11 +319,11 @@ class ClientViewSet(viewsets.ModelViewSet):
         user = self.request.user
 
         # تحقق إذا كان المستخدم هو مدير خارق أو يملك صلاحية عرض كل العملاء
-        if user.is_superuser or (user.role and user.role.permissions.filter(code='PERM054').exists()):
+        if user_has_permission(user, 'PERM054'):
             return Client.objects.all().order_by('-created_at')
         
         # في المستقبل، يمكنك إضافة منطق لعرض العملاء المسندين لموظف معين هنا
-        # if user.role and user.role.permissions.filter(code='PERM055').exists():
+        # if user_has_permission(user, 'PERM055'):
         #     return Client.objects.filter(assigned_to=user).order_by('-created_at')
 
         # إذا لم يكن لدى المستخدم أي من الصلاحيات السابقة، قم بإرجاع قائمة فارغة
@@ -312,6 +394,91 @@ class DocumentViewSet(viewsets.ModelViewSet):
             transaction_document=transaction_document
         )
 
+class UploadSessionViewSet(
+    mixins.RetrieveModelMixin,
+    mixins.CreateModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet
+):
+    """
+    رفع الملفات الكبيرة على أجزاء (core.uploads):
+    POST /uploads/ لبدء الجلسة، PUT /uploads/{id}/ مع Upload-Offset لكل جزء (الجسم هو البايتات نفسها)،
+    GET /uploads/{id}/ لمعرفة الموضع بعد انقطاع الاتصال، ثم POST /uploads/{id}/finalize/.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(created_by=self.request.user)
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        try:
+            serializer.instance = start_upload(
+                self.request.user, data['transaction'], data['filename'], data['total_size'],
+                transaction_document=data.get('transaction_document'),
+                description=data.get('description', ''),
+                expected_sha256=data.get('expected_sha256', ''),
+            )
+        except ValueError as e:
+            from rest_framework.exceptions import ValidationError
+            raise ValidationError(str(e))
+
+    def update(self, request, pk=None):
+        """استقبال جزء: البايتات تُقرأ من الطلب على دفعات صغيرة ولا تُحمّل في الذاكرة."""
+        session = self.get_object()
+        try:
+            offset = int(request.headers.get('Upload-Offset', request.query_params.get('offset', '')))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return Response({'detail': 'Upload-Offset و Content-Length مطلوبان كأرقام صحيحة.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if offset < 0 or length <= 0:
+            return Response({'detail': 'Upload-Offset و Content-Length مطلوبان كأرقام صحيحة.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            session = append_chunk(session.pk, offset, request.stream, length)
+        except UploadConflict as e:
+            return self._offset_response({'detail': str(e), 'offset': e.offset}, e.offset, status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return self._offset_response({
+            'offset': session.received_bytes,
+            'complete': session.received_bytes == session.total_size,
+        }, session.received_bytes)
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        response['Upload-Offset'] = str(response.data['received_bytes'])
+        return response
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        """إنهاء الرفع: التحقق من الحجم و SHA-256 وإنشاء المستند كما في الرفع العادي."""
+        session = self.get_object()
+        try:
+            document = finish_upload(session.pk)
+        except UploadConflict as e:
+            return self._offset_response({'detail': str(e), 'offset': e.offset}, e.offset, status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = DocumentSerializer(document, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def perform_destroy(self, instance):
+        # إلغاء الرفع وحذف الملف المؤقت
+        discard_part(instance)
+        instance.delete()
+
+    def _offset_response(self, data, offset, status_code=status.HTTP_200_OK):
+        response = Response(data, status=status_code)
+        response['Upload-Offset'] = str(offset)
+        return response
+
+
 class ProjectViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows projects to be viewed or edited.
@@ -333,6 +500,7 @@ class TaskViewSet(viewsets.ModelViewSet):
     """
     serializer_class = TaskSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [ArabicSearchFilter]
 
     def get_queryset(self):
         """
@@ -343,7 +511,7 @@ class TaskViewSet(viewsets.ModelViewSet):
         user = self.request.user
         
         # Superuser or user with "View All Tasks" permission
-        if user.is_superuser or (user.role and user.role.permissions.filter(code='PERM141').exists()):
+        if user_has_permission(user, 'PERM141'):
             return Task.objects.all().order_by('-created_at')
             
         # Regular user sees only their own tasks (assigned or created)
@@ -387,20 +555,24 @@ class StaffViewSet(viewsets.ModelViewSet):
     """
     serializer_class = StaffSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('full_name_ar', 'id')
 
     def get_queryset(self):
+        return annotate_active_counts(self.get_staff_queryset()).select_related('role', 'department')
+
+    def get_staff_queryset(self):
         user = self.request.user
         
         # المديرون والمشرفون يمكنهم رؤية جميع الموظفين
-        if user.is_superuser or (user.role and user.role.permissions.filter(code='PERM084').exists()):
+        if user_has_permission(user, 'PERM084'):
             return CustomUser.objects.filter(is_active=True).order_by('full_name_ar')
         
         # الموظفون العاديون يمكنهم رؤية زملائهم في القسم أو جميع الموظفين حسب الصلاحية
-        if user.role and user.role.permissions.filter(code='PERM_CHAT_VIEW_COLLEAGUES').exists():
-            if user.department:
+        if user_has_permission(user, 'PERM_CHAT_VIEW_COLLEAGUES'):
+            if user.department_id:
                 return CustomUser.objects.filter(
                     is_active=True, 
-                    department=user.department
+                    department_id=user.department_id
                 ).exclude(id=user.id).order_by('full_name_ar')
             else:
                 return CustomUser.objects.filter(is_active=True).exclude(id=user.id).order_by('full_name_ar')
@@ -417,7 +589,7 @@ class StaffViewSet(viewsets.ModelViewSet):
         queryset = CustomUser.objects.filter(is_active=True).exclude(id=user.id)
         
         # المديرون يرون الجميع
-        if not (user.is_superuser or (user.role and user.role.permissions.filter(code='PERM084').exists())):
+        if not user_has_permission(user, 'PERM084'):
             # الموظفون العاديون يرون زملاء القسم فقط
             if user.department:
                 queryset = queryset.filter(department=user.department)
@@ -428,10 +600,23 @@ class StaffViewSet(viewsets.ModelViewSet):
         department_id = request.query_params.get('department')
         if department_id:
             queryset = queryset.filter(department_id=department_id)
-            
+
+        queryset = annotate_active_counts(queryset).select_related('role', 'department')
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def workload(self, request):
+        """
+        ملخص عبء العمل: المعاملات والمهام المفتوحة لكل موظف حسب الحالة والمتأخر منها،
+        مع إجمالي كل قسم. يطبق نفس صلاحيات عرض الموظفين.
+        """
+        queryset = self.get_staff_queryset()
+        department_id = request.query_params.get('department')
+        if department_id:
+            queryset = queryset.filter(department_id=department_id)
+        return Response(build_workload_summary(queryset))
+
 
 class InvoiceViewSet(viewsets.ModelViewSet):
     """
@@ -439,6 +624,7 @@ class InvoiceViewSet(viewsets.ModelViewSet):
     """
     serializer_class = InvoiceSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-issue_date', '-id')
 
     # --- هذا هو التعديل ---
     def get_queryset(self):
@@ -448,7 +634,7 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         - Otherwise, sees nothing.
         """
         user = self.request.user
-        if user.is_superuser or (user.role and user.role.permissions.filter(code='PERM064').exists()):
+        if user_has_permission(user, 'PERM064'):
             return Invoice.objects.all().order_by('-issue_date')
         return Invoice.objects.none()
     @action(detail=True, methods=['post'])
@@ -495,6 +681,8 @@ class TransactionMainCategoryViewSet(viewsets.ModelViewSet):
     queryset = TransactionMainCategory.objects.all()
     serializer_class = TransactionMainCategorySerializer
     permission_classes = [IsAuthenticated]
+    # بيانات مرجعية صغيرة تُعرض كاملة في القوائم المنسدلة، لذلك بدون ترقيم صفحات
+    pagination_class = None
 
 class TransactionSubCategoryViewSet(viewsets.ModelViewSet):
     """
@@ -503,6 +691,8 @@ class TransactionSubCategoryViewSet(viewsets.ModelViewSet):
     queryset = TransactionSubCategory.objects.all()
     serializer_class = TransactionSubCategorySerializer
     permission_classes = [IsAuthenticated]
+    # بيانات مرجعية صغيرة تُعرض كاملة في القوائم المنسدلة، لذلك بدون ترقيم صفحات
+    pagination_class = None
 
     def get_queryset(self):
         queryset = TransactionSubCategory.objects.all()
@@ -518,6 +708,25 @@ class CompetentAuthorityViewSet(viewsets.ModelViewSet):
     queryset = CompetentAuthority.objects.all()
     serializer_class = CompetentAuthoritySerializer
     permission_classes = [IsAuthenticated]
+    # بيانات مرجعية صغيرة تُعرض كاملة في القوائم المنسدلة، لذلك بدون ترقيم صفحات
+    pagination_class = None
+
+class RequiredDocumentRuleViewSet(viewsets.ModelViewSet):
+    """
+    API endpoint for the required documents checklist rules.
+    """
+    queryset = RequiredDocumentRule.objects.all()
+    serializer_class = RequiredDocumentRuleSerializer
+    permission_classes = [IsAuthenticated]
+    # بيانات مرجعية صغيرة تُعرض كاملة في القوائم المنسدلة، لذلك بدون ترقيم صفحات
+    pagination_class = None
+
+    def get_queryset(self):
+        queryset = RequiredDocumentRule.objects.select_related('document_type')
+        sub_category_id = self.request.query_params.get('sub_category')
+        if sub_category_id is not None:
+            queryset = queryset.filter(sub_category_id=sub_category_id)
+        return queryset
 
 class TransactionDocumentViewSet(viewsets.ModelViewSet):
     """
@@ -534,11 +743,11 @@ class TransactionDocumentViewSet(viewsets.ModelViewSet):
         user = self.request.user
         
         # Superuser or user with "View All Transactions" permission can see all
-        if user.is_superuser or (user.role and user.role.permissions.filter(code='PERM039').exists()):
+        if user_has_permission(user, 'PERM039'):
             return TransactionDocument.objects.all()
         
         # User with "View Assigned Transactions" can see checklist items for their transactions
-        if user.role and user.role.permissions.filter(code='PERM040').exists():
+        if user_has_permission(user, 'PERM040'):
             return TransactionDocument.objects.filter(transaction__assigned_to=user)
         
         return TransactionDocument.objects.none()
@@ -596,6 +805,8 @@ class DepartmentViewSet(viewsets.ModelViewSet):
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
     permission_classes = [IsAuthenticated]
+    # بيانات مرجعية صغيرة تُعرض كاملة في القوائم المنسدلة، لذلك بدون ترقيم صفحات
+    pagination_class = None
 
 class BudgetViewSet(viewsets.ModelViewSet):
     queryset = Budget.objects.all()
@@ -631,7 +842,7 @@ class PermissionRequestViewSet(viewsets.ModelViewSet):
         # === START: التصحيح الكامل هنا ===
         # استخدام الطريقة الصحيحة للتحقق من الصلاحية من خلال الدور المخصص
         # الصلاحية المطلوبة هي 'HR_Manage_PermissionRequests'
-        if user.is_superuser or (user.role and user.role.permissions.filter(code='HR_Manage_PermissionRequests').exists()):
+        if user_has_permission(user, 'HR_Manage_PermissionRequests'):
             status_filter = self.request.query_params.get('status')
             if status_filter:
                 return PermissionRequest.objects.filter(status=status_filter.upper()).select_related('requester', 'permission')
@@ -647,7 +858,7 @@ class PermissionRequestViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
         # التصحيح هنا أيضاً
-        if not (request.user.is_superuser or (request.user.role and request.user.role.permissions.filter(code='HR_Manage_PermissionRequests').exists())):
+        if not user_has_permission(request.user, 'HR_Manage_PermissionRequests'):
              return Response({'detail': 'Action forbidden.'}, status=status.HTTP_403_FORBIDDEN)
 
         permission_request = self.get_object()
@@ -668,7 +879,7 @@ class PermissionRequestViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def reject(self, request, pk=None):
         # التصحيح هنا أيضاً
-        if not (request.user.is_superuser or (request.user.role and request.user.role.permissions.filter(code='HR_Manage_PermissionRequests').exists())):
+        if not user_has_permission(request.user, 'HR_Manage_PermissionRequests'):
              return Response({'detail': 'Action forbidden.'}, status=status.HTTP_403_FORBIDDEN)
 
         permission_request = self.get_object()
@@ -726,6 +937,7 @@ class AttendanceViewSet(
     ViewSet for listing attendance records and handling check-in/out actions.
     """
     serializer_class = AttendanceSerializer
+    cursor_ordering = ('-date', '-check_in')
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['employee', 'date']
@@ -734,7 +946,7 @@ class AttendanceViewSet(
         user = self.request.user
         
         # التحقق من صلاحية عرض جميع سجلات الحضور
-        if user.is_superuser or (user.role and user.role.permissions.filter(code='PERM004').exists()):
+        if user_has_permission(user, 'PERM004'):
             return Attendance.objects.select_related(
                 'employee', 'employee__department'
             ).all().order_by('-date', '-check_in')
@@ -788,10 +1000,10 @@ class LeaveRequestViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         # المدراء ومن لديهم صلاحية يرون طلبات القسم أو كل الطلبات
-        if user.is_superuser or (user.role and user.role.permissions.filter(code='HR_LeaveRequests_View').exists()):
+        if user_has_permission(user, 'HR_LeaveRequests_View'):
             return LeaveRequest.objects.all().order_by('-start_date')
         
-        if user.role and user.role.permissions.filter(code='HR_DepartmentLeaves_View').exists() and user.department:
+        if user_has_permission(user, 'HR_DepartmentLeaves_View') and user.department:
             return LeaveRequest.objects.filter(employee__department=user.department).order_by('-start_date')
 
         # الخيار الافتراضي الآمن هو إرجاع لا شيء
@@ -818,7 +1030,7 @@ class LeaveRequestViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
         """Approve a leave request."""
-        if not (request.user.is_superuser or (request.user.role and request.user.role.permissions.filter(code='HR_LeaveRequests_Manage').exists())):
+        if not user_has_permission(request.user, 'HR_LeaveRequests_Manage'):
             return Response({'detail': 'Action forbidden.'}, status=status.HTTP_403_FORBIDDEN)
         
         leave_request = self.get_object()
@@ -829,7 +1041,7 @@ class LeaveRequestViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def reject(self, request, pk=None):
         """Reject a leave request."""
-        if not (request.user.is_superuser or (request.user.role and request.user.role.permissions.filter(code='HR_LeaveRequests_Manage').exists())):
+        if not user_has_permission(request.user, 'HR_LeaveRequests_Manage'):
             return Response({'detail': 'Action forbidden.'}, status=status.HTTP_403_FORBIDDEN)
             
         leave_request = self.get_object()
@@ -845,6 +1057,8 @@ class AccountViewSet(viewsets.ModelViewSet):
     queryset = Account.objects.filter(is_active=True)
     serializer_class = AccountSerializer
     permission_classes = [IsAuthenticated]
+    # شجرة الحسابات تُبنى كاملة في الواجهة، لذلك بدون ترقيم صفحات
+    pagination_class = None
 
     def get_queryset(self):
         # نعرض فقط الحسابات الرئيسية (التي ليس لها حساب أصلي)
@@ -859,6 +1073,7 @@ class JournalEntryViewSet(viewsets.ModelViewSet):
     queryset = JournalEntry.objects.prefetch_related('items__account').all()
     serializer_class = JournalEntrySerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-date', '-id')
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
@@ -947,19 +1162,9 @@ class ReportTemplateViewSet(viewsets.ModelViewSet):
 
 class GenerateReportView(APIView):
     """A view to generate a PDF report from a template and transaction data."""
-    permission_classes = [IsAuthenticated]
-
-    def check_permissions(self, request):
-        """
-        Custom permission check to ensure user can generate reports.
-        """
-        super().check_permissions(request)
-        user = request.user
-        # PERM144 = Reports_Generate
-        if not (user.is_superuser or (user.role and user.role.permissions.filter(code='PERM144').exists())):
-            self.permission_denied(
-                request, message='You do not have permission to generate reports.'
-            )
+    # PERM144 = Reports_Generate
+    permission_classes = [IsAuthenticated, HasRolePermission]
+    required_permissions = ['PERM144']
 
     def post(self, request, *args, **kwargs):
         template_id = request.data.get('template_id')
@@ -996,7 +1201,7 @@ class GenerateReportView(APIView):
             )
             generated_report.generated_file.save(file_name, ContentFile(result.getvalue()))
             
-            serializer = GeneratedReportSerializer(generated_report)
+            serializer = GeneratedReportSerializer(generated_report, context={'request': request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         
         return Response({'detail': 'فشل في إنشاء ملف PDF.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1037,11 +1242,12 @@ class TransactionDistributionViewSet(viewsets.ModelViewSet):
     queryset = TransactionDistribution.objects.all()
     serializer_class = TransactionDistributionSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-assigned_at', '-id')
 
     def get_queryset(self):
         user = self.request.user
         # المدراء ومن لديهم صلاحية التوزيع يرون كل عمليات التوزيع
-        if user.is_superuser or (user.role and user.role.permissions.filter(code='Transactions_Assign').exists()):
+        if user_has_permission(user, 'Transactions_Assign'):
             return TransactionDistribution.objects.select_related('transaction', 'assigned_from', 'assigned_to').all()
         
         # الموظف العادي يرى فقط المعاملات الموجهة إليه
@@ -1075,6 +1281,49 @@ class TransactionDistributionViewSet(viewsets.ModelViewSet):
         transaction.status = 'under_review' # تغيير الحالة إلى "قيد المراجعة"
         transaction.save()
 
+    @action(detail=False, methods=['post'], url_path='auto-distribute')
+    def auto_distribute(self, request):
+        """
+        توزيع تلقائي لمجموعة من المعاملات غير المسندة على الموظفين الأقل حملاً،
+        مع تفضيل من لديه (أو لقسمه) خبرة في التخصص الهندسي للمعاملة.
+        """
+        if not user_has_permission(request.user, 'Transactions_Assign'):
+            return Response({'detail': 'Action forbidden.'}, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = AutoDistributeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        transaction_ids = data.get('transactions')
+        if transaction_ids is None:
+            # بدون قائمة: أقدم المعاملات المفتوحة غير المسندة
+            transaction_ids = list(
+                Transaction.objects.filter(assigned_to__isnull=True).exclude(
+                    status__in=CLOSED_TRANSACTION_STATUSES
+                ).order_by('created_at', 'id').values_list('id', flat=True)[:data['limit']]
+            )
+
+        staff = CustomUser.objects.filter(is_active=True).exclude(id=request.user.id)
+        if data.get('department'):
+            staff = staff.filter(department=data['department'])
+
+        distributions = auto_distribute(transaction_ids, staff, request.user, data.get('manager_notes'))
+        names = dict(CustomUser.objects.filter(
+            id__in={d.assigned_to_id for d in distributions}
+        ).values_list('id', 'full_name_ar'))
+        return Response({
+            'assigned': len(distributions),
+            'distributions': [
+                {
+                    'transaction': d.transaction_id,
+                    'transaction_code': d.transaction.short_code,
+                    'assigned_to': d.assigned_to_id,
+                    'assigned_to_name': names.get(d.assigned_to_id, ''),
+                }
+                for d in distributions
+            ],
+        }, status=status.HTTP_201_CREATED if distributions else status.HTTP_200_OK)
+
 
 class ChatRoomViewSet(viewsets.ModelViewSet):
     """ViewSet لإدارة غرف المحادثة - متاح للجميع"""
@@ -1091,15 +1340,30 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
         user = self.request.user
         room_type = self.request.query_params.get('room_type')
         
-        queryset = ChatRoom.objects.filter(
+        # الملخص (آخر رسالة وعدد المشاركين) محفوظ في الغرفة، وغير المقروء محسوب في نفس الاستعلام
+        queryset = annotate_unread_counts(ChatRoom.objects.filter(
             participants=user,
             is_active=True
-        ).prefetch_related('participants', 'messages')
+        ), user.id).select_related(
+            'last_message__sender__role'
+        ).prefetch_related(
+            Prefetch('participants', queryset=CustomUser.objects.select_related('department'))
+        )
         
         if room_type:
             queryset = queryset.filter(room_type=room_type)
         
         return queryset.order_by('-created_at')
+
+    def get_serializer(self, *args, **kwargs):
+        # حالة الاتصال لكل مشاركي الغرف المعروضة بقراءة واحدة من الـ cache
+        if args and isinstance(args[0], (list, QuerySet, ChatRoom)):
+            rooms = [args[0]] if isinstance(args[0], ChatRoom) else args[0]
+            kwargs['context'] = {
+                **self.get_serializer_context(),
+                'online_user_ids': online_user_ids({user.id for room in rooms for user in room.participants.all()}),
+            }
+        return super().get_serializer(*args, **kwargs)
     
     def perform_create(self, serializer):
         # لا حاجة لتمرير created_by هنا، لأن الـ serializer يتعامل معه
@@ -1147,6 +1411,8 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
     """ViewSet لإدارة الرسائل"""
     serializer_class = ChatMessageSerializer
     permission_classes = [IsAuthenticated]
+    # الأحدث أولاً: الصفحة الأولى هي آخر الرسائل، والمؤشر next يجلب الرسائل الأقدم
+    cursor_ordering = ('-created_at', '-id')
     
     def get_queryset(self):
         room_id = self.kwargs.get('room_pk')
@@ -1157,71 +1423,62 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
             return ChatMessage.objects.none()
         
         return ChatMessage.objects.filter(room_id=room_id).select_related(
-            'sender', 'sender__department'
+            'sender', 'sender__role'
         ).order_by('created_at')
-    
-    @action(detail=False, methods=['post'])
-    def mark_all_read(self, request, room_pk=None):
-        """تحديد جميع الرسائل في الغرفة كمقروءة"""
-        room_id = room_pk
-        user = request.user
-        
-        # تحديث حالة القراءة للرسائل
-        messages = ChatMessage.objects.filter(
-            room_id=room_id
-        ).exclude(sender=user)
-        
-        for message in messages:
-            MessageReadStatus.objects.update_or_create(
-                message=message,
-                user=user,
-                defaults={'is_read': True, 'read_at': timezone.now()}
-            )
-        
-        return Response({'status': 'تم تحديد جميع الرسائل كمقروءة'})
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ChatMessageListSerializer
+        return ChatMessageSerializer
+
+    def list(self, request, *args, **kwargs):
+        """
+        بدون معاملات: ترقيم الصفحات المعتاد. مع before أو after أو limit: صفحة من سجل
+        المحادثة بالترتيب الزمني (آخر الرسائل أولاً عند فتح الغرفة، ثم before للأقدم).
+        """
+        if not any(name in request.query_params for name in ('before', 'after', 'limit')):
+            return super().list(request, *args, **kwargs)
+
+        try:
+            before, after, limit = parse_history_params(request.query_params)
+        except ValueError:
+            return Response({'detail': 'before و after و limit يجب أن تكون أرقامًا صحيحة، ولا يُجمع before مع after.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        messages, has_more = history_page(self.get_queryset(), before=before, after=after, limit=limit)
+        return Response({
+            'results': self.get_serializer(messages, many=True).data,
+            'has_more': has_more,
+        })
     
     def perform_create(self, serializer):
         room_id = self.kwargs.get('room_pk')
         room = ChatRoom.objects.get(id=room_id)
-        
-        message = serializer.save(
-            sender=self.request.user,
-            room=room
-        )
-        
-        # إنشاء سجلات حالة القراءة للمشاركين الآخرين
-        participants = room.participants.exclude(id=self.request.user.id)
-        print(f"سيتم إرسال إشعار رسالة جديدة إلى {participants.count()} مشارك.")
-        for participant in participants:
-            # 1. إرسال الإشعار الفوري
-            create_and_send_notification(
-                user=participant,
-                message=f"لديك رسالة جديدة من {message.sender.username} في '{room.name}'.",
-                event_type=Notification.EventType.NEW_MESSAGE,
-                link=f'/chat?room={room.id}',
-                related_object=message
-            )
 
-            # 2. تسجيل حالة الرسالة كـ "غير مقروءة" لنفس المشارك
-            MessageReadStatus.objects.get_or_create(
-                message=message,
-                user=participant,
-                defaults={'is_read': False}
+        with db_transaction.atomic():
+            message = serializer.save(
+                sender=self.request.user,
+                room=room
             )
-    
+            # حالات القراءة والإشعارات لكل المشاركين الآخرين دفعة واحدة
+            fan_out_message(message)
+
+    def perform_destroy(self, instance):
+        room_id = instance.room_id
+        with db_transaction.atomic():
+            instance.delete()
+            # إذا كانت آخر رسالة في الغرفة، يُعاد حساب ملخص الغرفة
+            if ChatRoom.objects.filter(pk=room_id, last_message__isnull=True).exists():
+                refresh_last_message(room_id)
 
-    
     @action(detail=True, methods=['post'])
     def mark_as_read(self, request, room_pk=None, pk=None):
         """تحديد الرسالة كمقروءة"""
         message = self.get_object()
-        
-        MessageReadStatus.objects.update_or_create(
-            message=message,
-            user=request.user,
-            defaults={'is_read': True, 'read_at': timezone.now()}
-        )
-        
+
+        # مؤشر القراءة: الرسالة وكل ما قبلها مقروء
+        advance_read_cursor(message.room_id, request.user.id, message.id)
+
         return Response({'status': 'تم تحديد الرسالة كمقروءة'})
     
     @action(detail=False, methods=['post'])
@@ -1235,22 +1492,8 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
             return Response({'detail': 'You are not a participant in this room.'},
                             status=status.HTTP_403_FORBIDDEN)
 
-        # تحديث أو إنشاء حالات القراءة لجميع الرسائل في الغرفة
-        messages = ChatMessage.objects.filter(
-            room_id=room_id
-        ).exclude(
-            sender=user
-        )
-
-        for message in messages:
-            MessageReadStatus.objects.update_or_create(
-                message=message,
-                user=user,
-                defaults={
-                    'is_read': True,
-                    'read_at': timezone.now()
-                }
-            )
+        # تحديث واحد لمؤشر القراءة بدلاً من صف لكل رسالة
+        mark_room_read(room_id, user.id)
 
         return Response({'status': 'تم تحديد جميع الرسائل كمقروءة'})
 
@@ -1264,9 +1507,13 @@ class UserListView(APIView):
             is_active=True
         ).exclude(
             id=request.user.id
-        ).select_related('department', 'presence')
+        ).select_related('department')
+        users = list(users)
         
-        serializer = ChatUserSerializer(users, many=True, context={'request': request})
+        serializer = ChatUserSerializer(users, many=True, context={
+            'request': request,
+            'online_user_ids': online_user_ids(user.id for user in users),
+        })
         return Response(serializer.data)
 
 class UserPresenceView(APIView):
@@ -1276,30 +1523,25 @@ class UserPresenceView(APIView):
     def post(self, request):
         is_online = request.data.get('is_online', True)
         device_token = request.data.get('device_token')
-        
-        UserPresence.objects.update_or_create(
-            user=request.user,
-            defaults={
-                'is_online': is_online,
-                'device_token': device_token,
-                'last_seen': timezone.now()
-            }
-        )
+
+        # الحالة في الـ cache بمدة صلاحية؛ last_seen يُكتب في قاعدة البيانات على دفعات (core.presence)
+        if str(is_online).lower() in ('false', '0'):
+            mark_offline(request.user.id)
+        else:
+            heartbeat(request.user.id)
+
+        # رمز الجهاز يُكتب فقط عند تغيّره
+        if device_token and not UserPresence.objects.filter(user=request.user, device_token=device_token).exists():
+            UserPresence.objects.update_or_create(user=request.user, defaults={'device_token': device_token})
         
         return Response({'status': 'تم تحديث حالة الاتصال'})
     
     def get(self, request):
-        try:
-            presence = UserPresence.objects.get(user=request.user)
-            return Response({
-                'is_online': presence.is_online,
-                'last_seen': presence.last_seen
-            })
-        except UserPresence.DoesNotExist:
-            return Response({
-                'is_online': False,
-                'last_seen': None
-            })
+        is_online, last_seen = get_presence(request.user.id)
+        return Response({
+            'is_online': is_online,
+            'last_seen': last_seen
+        })
         
 class PusherAuthView(APIView):
     """
@@ -1308,33 +1550,23 @@ class PusherAuthView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
-        print("--- Pusher authentication request received ---")
-        
-        pusher_client = pusher.Pusher(
-            app_id=settings.PUSHER_APP_ID,
-            key=settings.PUSHER_KEY,
-            secret=settings.PUSHER_SECRET,
-            cluster=settings.PUSHER_CLUSTER,
-            ssl=True
-        )
-
         channel_name = request.data.get('channel_name')
         socket_id = request.data.get('socket_id')
 
         # Basic validation
         if not channel_name or not socket_id:
-            print("!!! Pusher Auth Error: Missing channel_name or socket_id")
             return Response({'error': 'channel_name and socket_id are required'}, status=400)
 
         # Check if the user is authorized for this channel
         # The channel name should be 'private-user-{user.id}'
         expected_channel = f'private-user-{request.user.id}'
         if channel_name != expected_channel:
-            print(f"!!! Pusher Auth Error: User {request.user.id} not authorized for channel {channel_name}")
+            logger.warning(f"Pusher auth: user {request.user.id} not authorized for channel {channel_name}")
             return Response({'error': 'Forbidden'}, status=403)
 
         try:
-            auth = pusher_client.authenticate(
+            # نفس العميل المشترك المستخدم في إرسال الإشعارات
+            auth = get_pusher_client().authenticate(
                 channel=channel_name,
                 socket_id=socket_id,
                 custom_data={
@@ -1342,9 +1574,68 @@ class PusherAuthView(APIView):
                     'user_info': {'username': request.user.username}
                 }
             )
-            print(f"--- Successfully authenticated user {request.user.id} for Pusher channel {channel_name} ---")
             return Response(auth)
 
         except Exception as e:
-            print(f"!!! Pusher Auth Exception: {e}")
+            logger.error(f"Pusher auth failed for user {request.user.id}: {e}", exc_info=True)
             return Response({'error': 'Authentication failed'}, status=500)
+
+
+# --- تنزيل الملفات المحمية (core.downloads) ---
+
+class FileDownloadView(APIView):
+    """
+    يتحقق من صلاحية الوصول ثم يرسل الملف بدعم Range و ETag/Last-Modified،
+    أو يسلمه لخادم الويب عبر X-Accel-Redirect/X-Sendfile (FILE_DOWNLOAD_BACKEND).
+    ?download=1 للتنزيل كمرفق بدلاً من العرض في المتصفح.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_file(self, request, pk):
+        """ترجع حقل الملف، أو None إذا لم يوجد السجل أو لا يملك المستخدم صلاحية الوصول."""
+        raise NotImplementedError
+
+    def can_view_transaction(self, user, transaction_obj):
+        # نفس قاعدة TransactionViewSet: عرض الكل (PERM039) أو المعاملات المسندة للمستخدم
+        return user_has_permission(user, 'PERM039') or transaction_obj.assigned_to_id == user.id
+
+    def get(self, request, pk):
+        field = self.get_file(request, pk)
+        if not field:
+            raise Http404
+        as_attachment = request.query_params.get('download') in ['true', 'True', '1']
+        try:
+            return serve_file(request, field, as_attachment=as_attachment)
+        except FileNotFoundError:
+            raise Http404
+
+
+class DocumentDownloadView(FileDownloadView):
+    """ملف مستند المعاملة؛ ?version=stamped للنسخة المختومة."""
+
+    def get_file(self, request, pk):
+        document = Document.objects.select_related('transaction').filter(pk=pk).first()
+        if document is None or not self.can_view_transaction(request.user, document.transaction):
+            return None
+        if request.query_params.get('version') == 'stamped':
+            return document.stamped_file
+        return document.file
+
+
+class GeneratedReportDownloadView(FileDownloadView):
+    def get_file(self, request, pk):
+        report = GeneratedReport.objects.select_related('transaction').filter(pk=pk).first()
+        if report is None or not self.can_view_transaction(request.user, report.transaction):
+            return None
+        return report.generated_file
+
+
+class ChatMessageFileDownloadView(FileDownloadView):
+    def get_file(self, request, pk):
+        # مرفقات المحادثة للمشاركين في غرفة نشطة فقط، مثل ChatMessageViewSet
+        message = ChatMessage.objects.filter(
+            pk=pk, room__is_active=True, room__participants=request.user
+        ).first()
+        if message is None:
+            return None
+        return message.file
@@ -0,0 +1,111 @@
+# core/workload.py
+
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Task, Transaction, TransactionStatusCounter
+
+# الحالات المغلقة التي لا تُحسب ضمن عبء العمل
+CLOSED_TRANSACTION_STATUSES = ('completed', 'cancelled')
+CLOSED_TASK_STATUSES = ('approved', 'cancelled')
+
+
+def annotate_active_counts(queryset):
+    """
+    Adds active_transactions_count and active_tasks_count to a users queryset.
+
+    Both are correlated subqueries evaluated inside the staff query, so listing
+    N employees costs one query instead of 2N + 1. Transactions are counted
+    from the status counters table, which holds one row per (status, assignee).
+    """
+    active_transactions = TransactionStatusCounter.objects.filter(
+        assignee_id=OuterRef('pk')
+    ).exclude(status__in=CLOSED_TRANSACTION_STATUSES).order_by().values('assignee_id').annotate(
+        total=Sum('count')
+    ).values('total')
+
+    active_tasks = Task.objects.filter(
+        assigned_to=OuterRef('pk')
+    ).exclude(status__in=CLOSED_TASK_STATUSES).order_by().values('assigned_to').annotate(
+        total=Count('id')
+    ).values('total')
+
+    return queryset.annotate(
+        active_transactions_count=Coalesce(Subquery(active_transactions, output_field=IntegerField()), Value(0)),
+        active_tasks_count=Coalesce(Subquery(active_tasks, output_field=IntegerField()), Value(0)),
+    )
+
+
+def _empty_workload():
+    return {
+        'open_transactions': 0,
+        'overdue_transactions': 0,
+        'transactions_by_status': {},
+        'open_tasks': 0,
+        'overdue_tasks': 0,
+        'tasks_by_status': {},
+    }
+
+
+def build_workload_summary(staff_queryset):
+    """
+    ملخص عبء العمل لكل موظف (المعاملات والمهام المفتوحة حسب الحالة والمتأخر منها)
+    مع إجمالي كل قسم. عدد الاستعلامات ثابت (3) مهما كان عدد الموظفين.
+    """
+    today = timezone.localdate()
+    staff = list(staff_queryset.order_by('full_name_ar', 'id').values('id', 'username', 'full_name_ar', 'department_id', 'department__name'))
+    staff_ids = [member['id'] for member in staff]
+    workload = {member_id: _empty_workload() for member_id in staff_ids}
+
+    transaction_rows = Transaction.objects.filter(assigned_to__in=staff_ids).exclude(
+        status__in=CLOSED_TRANSACTION_STATUSES
+    ).order_by().values('assigned_to', 'status').annotate(
+        total=Count('id'),
+        overdue=Count('id', filter=Q(expected_end_date__lt=today)),
+    )
+    for row in transaction_rows:
+        entry = workload[row['assigned_to']]
+        entry['transactions_by_status'][row['status']] = row['total']
+        entry['open_transactions'] += row['total']
+        entry['overdue_transactions'] += row['overdue']
+
+    task_rows = Task.objects.filter(assigned_to__in=staff_ids).exclude(
+        status__in=CLOSED_TASK_STATUSES
+    ).order_by().values('assigned_to', 'status').annotate(
+        total=Count('id'),
+        overdue=Count('id', filter=Q(due_date__lt=today)),
+    )
+    for row in task_rows:
+        entry = workload[row['assigned_to']]
+        entry['tasks_by_status'][row['status']] = row['total']
+        entry['open_tasks'] += row['total']
+        entry['overdue_tasks'] += row['overdue']
+
+    employees = []
+    departments = {}
+    for member in staff:
+        entry = workload[member['id']]
+        employees.append({
+            'id': member['id'],
+            'username': member['username'],
+            'full_name_ar': member['full_name_ar'],
+            'department': member['department_id'],
+            'department_name': member['department__name'] or '',
+            **entry,
+        })
+
+        department = departments.setdefault(member['department_id'], {
+            'department': member['department_id'],
+            'department_name': member['department__name'] or '',
+            'employees': 0,
+            'open_transactions': 0,
+            'overdue_transactions': 0,
+            'open_tasks': 0,
+            'overdue_tasks': 0,
+        })
+        department['employees'] += 1
+        for key in ('open_transactions', 'overdue_transactions', 'open_tasks', 'overdue_tasks'):
+            department[key] += entry[key]
+
+    return {'employees': employees, 'departments': list(departments.values())}
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from datetime import timedelta
 from pathlib import Path
 
@@ -142,13 +143,23 @@ CORS_ALLOWED_ORIGINS = ["http://localhost:3000",]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        # يقرأ صلاحيات المستخدم من التوكن لتجنب استعلامات الصلاحيات في كل طلب
+        'core.authentication.PermissionClaimsJWTAuthentication',
+    ),
+    # ترقيم الصفحات بالمؤشر لكل القوائم، و ?page=N لترقيم الصفحات التقليدي في شاشات الإدارة
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# إرسال الملفات المحمية (/api/files/...): 'django' يرسلها بنفسه مع دعم Range،
+# 'x-accel' يسلمها لـ nginx (موقع internal على FILE_DOWNLOAD_ACCEL_PREFIX يشير إلى MEDIA_ROOT)،
+# 'x-sendfile' لـ Apache/lighttpd
+FILE_DOWNLOAD_BACKEND = os.environ.get('FILE_DOWNLOAD_BACKEND', 'django')
+FILE_DOWNLOAD_ACCEL_PREFIX = os.environ.get('FILE_DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=14), # <-- يمكن للمستخدم البقاء مسجلاً لمدة 7 أيام
@@ -197,13 +208,52 @@ PUSHER_CLUSTER = 'eu'
 
 ASGI_APPLICATION = 'engineering_office.asgi.application'
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-        # للإنتاج، استخدم Redis:
-        # 'BACKEND': 'channels_redis.core.RedisChannelLayer',
-        # 'CONFIG': {
-        #     "hosts": [('127.0.0.1', 6379)],
-        # },
+# طبقة القنوات (Channels)
+# InMemoryChannelLayer تعمل داخل عملية daphne واحدة فقط. للتشغيل بأكثر من عملية أو خادم:
+#   CHANNEL_LAYER=redis
+#   CHANNEL_REDIS_HOSTS=redis://10.0.0.1:6379/0,redis://10.0.0.2:6379/0
+# مع أكثر من خادم Redis توزع channels_redis القنوات والمجموعات عليها (sharding)،
+# ويجب أن تستخدم كل العمليات نفس القائمة بنفس الترتيب.
+CHANNEL_REDIS_HOSTS = [
+    host.strip() for host in os.environ.get('CHANNEL_REDIS_HOSTS', 'redis://127.0.0.1:6379/0').split(',') if host.strip()
+]
+
+REDIS_CHANNEL_LAYER = {
+    'BACKEND': 'channels_redis.core.RedisChannelLayer',
+    'CONFIG': {
+        'hosts': CHANNEL_REDIS_HOSTS,
+        'prefix': os.environ.get('CHANNEL_REDIS_PREFIX', 'engineering_office'),
+        # عدد الرسائل المنتظرة لكل قناة قبل إسقاط الجديد منها
+        'capacity': int(os.environ.get('CHANNEL_LAYER_CAPACITY', 1000)),
+        # عمر الرسالة غير المستلمة (ثوان)
+        'expiry': int(os.environ.get('CHANNEL_LAYER_EXPIRY', 60)),
+        # بقاء الاتصال في مجموعة الغرفة (ثوان)؛ أطول من أطول اتصال WebSocket متوقع
+        'group_expiry': int(os.environ.get('CHANNEL_LAYER_GROUP_EXPIRY', 86400)),
     },
 }
+
+IN_MEMORY_CHANNEL_LAYER = {
+    'BACKEND': 'channels.layers.InMemoryChannelLayer',
+}
+
+CHANNEL_LAYERS = {
+    'default': REDIS_CHANNEL_LAYER if os.environ.get('CHANNEL_LAYER') == 'redis' else IN_MEMORY_CHANNEL_LAYER,
+    # للمقارنة في benchmark_channels
+    'memory': IN_MEMORY_CHANNEL_LAYER,
+    'redis': REDIS_CHANNEL_LAYER,
+}
+
+# الـ cache: LocMemCache افتراضياً (داخل العملية فقط). مع أكثر من عملية يجب أن يكون مشتركاً
+# حتى تتطابق حالة الاتصال (core.presence) وإصدارات الصلاحيات بين العمليات:
+#   CACHE_REDIS_URL=redis://127.0.0.1:6379/1
+if os.environ.get('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CACHE_REDIS_URL'],
+        },
+    }
+
+# حالة الاتصال: مدة صلاحية النبضة، وفترة كتابة last_seen في قاعدة البيانات (ثوان)
+PRESENCE_TTL = 60
+PRESENCE_FLUSH_INTERVAL = 60